@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from typing import Iterator, Optional
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from pii_masking.infer.cancel import GenerationCancelled
+
+# Absolute deadline in unix seconds, set by the caller (frontend/gateway) and forwarded unchanged.
+DEADLINE_HEADER = "X-Request-Deadline"
+
+_counts: Counter = Counter()
+_counts_lock = threading.Lock()
+
+
+def cancellations() -> dict:
+    """Requests cancelled since startup, by reason ("disconnect" / "deadline")."""
+    with _counts_lock:
+        return dict(_counts)
+
+
+class CancelToken:
+    """Polled between decoded tokens (the models' `should_stop`): true once the client is gone or the deadline passed."""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str) -> None:
+        with _counts_lock:
+            if self.reason is None:
+                self.reason = reason
+                _counts[reason] += 1
+
+    def __call__(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.time() >= self.deadline:
+            self.cancel("deadline")
+        return self.reason is not None
+
+
+def request_token(request: Request) -> CancelToken:
+    raw = request.headers.get(DEADLINE_HEADER)
+    if not raw:
+        return CancelToken()
+    try:
+        token = CancelToken(float(raw))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{DEADLINE_HEADER} must be a unix timestamp in seconds.")
+    if token():
+        raise HTTPException(status_code=504, detail="Request deadline already passed.")
+    return token
+
+
+def cancelled_error(token: CancelToken) -> HTTPException:
+    # 499 is nginx's "client closed request": nobody reads it, but it keeps aborts apart from errors in access logs.
+    if token.reason == "deadline":
+        return HTTPException(status_code=504, detail="Generation cancelled: request deadline passed.")
+    return HTTPException(status_code=499, detail="Generation cancelled: client disconnected.")
+
+
+def cancellable_pieces(pieces: Iterator[str], token: CancelToken) -> Iterator[str]:
+    """A model stream whose GenerationCancelled surfaces as cancelled_error(token) (for stream_events' error event)."""
+    try:
+        yield from pieces
+    except GenerationCancelled:
+        raise cancelled_error(token)
+
+
+async def watch_disconnect(receive, token: CancelToken) -> None:
+    """Cancel `token` when the client disconnects. Only for requests whose body has already been read."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            token.cancel("disconnect")
+            return
+
+
+async def run_cancellable(request: Request, token: CancelToken, fn, *args):
+    """Run sync `fn(*args)` in the threadpool, cancelling `token` if the client disconnects meanwhile."""
+    watcher = asyncio.ensure_future(watch_disconnect(request.receive, token))
+    try:
+        return await run_in_threadpool(fn, *args)
+    except GenerationCancelled:
+        raise cancelled_error(token)
+    finally:
+        watcher.cancel()
@@ -0,0 +1,193 @@
+import contextvars
+import cProfile
+import functools
+import hmac
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+# Off unless both are set; when off nothing below is installed on the app, so requests pay nothing.
+PROFILING_ENABLED = os.getenv("DEBUG_PROFILING", "0") == "1"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "40"))
+
+# Leaf frames in these files are idle pool/event-loop threads, not work.
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "base_events.py")
+
+_request_profile: contextvars.ContextVar[Optional[cProfile.Profile]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+_sampling = threading.Lock()
+
+
+def _enabled() -> bool:
+    return PROFILING_ENABLED and bool(ADMIN_TOKEN)
+
+
+def _is_admin(request: Request) -> bool:
+    token = request.headers.get("x-admin-token", "")
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def profiled(fn):
+    """Run `fn` under the request's cProfile when the caller sent X-Profile: 1.
+
+    Applied to sync endpoints so the profile covers the worker thread that does the work
+    (lock wait, generation, post-processing). Returns `fn` unchanged when profiling is off.
+    """
+    if not _enabled():
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        prof = _request_profile.get()
+        if prof is None:
+            return fn(*args, **kwargs)
+        prof.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            prof.disable()
+
+    return wrapper
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval_s: float) -> tuple[Counter, float]:
+    """Sample every other thread's Python stack; returns ({(thread, *frames): count}, elapsed_s)."""
+    me = threading.get_ident()
+    counts: Counter = Counter()
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            counts[(names.get(ident, str(ident)), *stack)] += 1
+        time.sleep(interval_s)
+    return counts, time.perf_counter() - t0
+
+
+def collapsed(counts: Counter) -> str:
+    """Brendan Gregg folded format: `thread;root;...;leaf count` (flamegraph.pl, speedscope, inferno)."""
+    return "".join(f"{';'.join(stack)} {n}\n" for stack, n in counts.most_common())
+
+
+def speedscope(counts: Counter, interval_s: float, elapsed: float, name: str) -> dict:
+    frames: list[dict] = []
+    index: dict[str, int] = {}
+    per_thread: dict[str, dict] = {}
+    for (thread, *stack), n in counts.items():
+        prof = per_thread.setdefault(thread, {"samples": [], "weights": []})
+        ids = []
+        for f in stack:
+            if f not in index:
+                index[f] = len(frames)
+                frames.append({"name": f})
+            ids.append(index[f])
+        prof["samples"].append(ids)
+        prof["weights"].append(n * interval_s)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "pii-redaction /debug/profile",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": elapsed,
+                "samples": p["samples"],
+                "weights": p["weights"],
+            }
+            for thread, p in sorted(per_thread.items())
+        ],
+    }
+
+
+def _pstats_text(prof: cProfile.Profile) -> str:
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    return buf.getvalue()
+
+
+def install_profiling(app: FastAPI, name: str) -> None:
+    """Add /debug/profile and X-Profile: 1 handling to `app` (no-op unless DEBUG_PROFILING=1 and ADMIN_TOKEN set)."""
+    if not _enabled():
+        return
+
+    @app.get("/debug/profile")
+    def debug_profile(request: Request, seconds: float = 10.0, format: str = "collapsed"):
+        if not _is_admin(request):
+            raise HTTPException(status_code=403, detail="Admin token required.")
+        if format not in {"collapsed", "speedscope"}:
+            raise HTTPException(status_code=400, detail="format must be collapsed or speedscope")
+        seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+        if not _sampling.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="A profile is already running.")
+        try:
+            interval_s = PROFILE_INTERVAL_MS / 1000.0
+            counts, elapsed = sample_stacks(seconds, interval_s)
+        finally:
+            _sampling.release()
+        if format == "speedscope":
+            return JSONResponse(speedscope(counts, interval_s, elapsed, f"{name} {seconds:g}s"))
+        return PlainTextResponse(collapsed(counts))
+
+    @app.middleware("http")
+    async def _per_request_profile(request: Request, call_next):
+        if request.headers.get("x-profile") != "1":
+            return await call_next(request)
+        if not _is_admin(request):
+            return JSONResponse({"detail": "Admin token required."}, status_code=403)
+
+        prof = cProfile.Profile()
+        token = _request_profile.set(prof)
+        t0 = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _request_profile.reset(token)
+        # Nothing recorded: the route isn't @profiled (streams, /models, ...) or the request was rejected
+        # before its handler ran. Pass the response through untouched, without buffering its body.
+        if not prof.getstats():
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        request_ms = (time.perf_counter() - t0) * 1000.0
+        try:
+            original = json.loads(body) if body else None
+        except ValueError:
+            original = body.decode("utf-8", errors="replace")
+        stats = pstats.Stats(prof)
+        payload = {
+            "status_code": response.status_code,
+            "response": original,
+            "request_ms": request_ms,
+            "profiled_ms": stats.total_tt * 1000.0,
+            "profile": _pstats_text(prof),
+        }
+        return Response(json.dumps(payload), status_code=200, media_type="application/json")
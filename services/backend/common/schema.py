@@ -4,6 +4,18 @@ class RedactIn(BaseModel):
     text: str
     max_new_tokens: int | None = None
     model_path: str | None = None
+    # Name of a LoRA adapter from the CPU backend's /models, applied on top of model_path.
+    adapter: str | None = None
+    # "sentences": redact sentence by sentence, reusing cached sentence redactions.
+    mode: str | None = None
+    # Collapse whitespace and map Unicode look-alikes before generating, then project the redaction back
+    # onto the original text. None: the backend's COMPACT_INPUT default.
+    compact: bool | None = None
+
+class Entity(BaseModel):
+    tag: str
+    start: int
+    end: int
 
 class RedactOut(BaseModel):
     normalized: str
@@ -11,4 +23,36 @@ class RedactOut(BaseModel):
     tag_count: int | None = None
     model_name: str | None = None
     model_path: str | None = None
+    adapter: str | None = None
+    # Time spent applying the adapter before generating (0 when it was already active).
+    adapter_switch_ms: float | None = None
+    max_new_tokens: int | None = None
+    ttft_ms: float | None = None
+    completion_tokens: int | None = None
+    tokens_per_s: float | None = None
+    entities: list[Entity] | None = None
+    # Bulk mode only: "llm" or "template", and the Drain template the input matched.
+    source: str | None = None
+    template_id: int | None = None
+    # Sentence mode only.
+    sentences: int | None = None
+    gated_sentences: int | None = None
+    cached_sentences: int | None = None
+    reuse_ratio: float | None = None
+    # Compacted input only: prompt tokens the compaction removed, and whether the redaction could be
+    # projected onto the original text (false: `normalized` is the redaction of the compacted text).
+    prompt_tokens_saved: int | None = None
+    projected: bool | None = None
+
+class RedactBulkIn(BaseModel):
+    texts: list[str]
     max_new_tokens: int | None = None
+    model_path: str | None = None
+    adapter: str | None = None
+
+class RedactBulkOut(BaseModel):
+    results: list[RedactOut]
+    latency_ms: float | None = None
+    llm_calls: int = 0
+    template_hits: int = 0
+    templates: int = 0
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+from services.backend.common.cancel import watch_disconnect
+
+
+def ndjson(obj: dict) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def token_stats(t_start: float, t_first: float | None, t_end: float, n_tokens: int) -> dict:
+    ttft_ms = (t_first - t_start) * 1000.0 if t_first is not None else None
+    decode_s = t_end - t_first if t_first is not None else 0.0
+    tokens_per_s = (n_tokens - 1) / decode_s if n_tokens > 1 and decode_s > 0 else None
+    return {
+        "latency_ms": (t_end - t_start) * 1000.0,
+        "ttft_ms": ttft_ms,
+        "completion_tokens": n_tokens,
+        "tokens_per_s": tokens_per_s,
+    }
+
+
+def stream_events(pieces: Iterable[str], t_start: float, finish: Callable[[str, dict], dict]) -> Iterator[bytes]:
+    """NDJSON stream: one `token` event per generated piece, then a single `done` (or `error`) event.
+
+    `finish(raw_text, stats)` builds the final payload once generation ends.
+    """
+    parts: list[str] = []
+    t_first = None
+    try:
+        for piece in pieces:
+            if t_first is None:
+                t_first = time.perf_counter()
+            parts.append(piece)
+            yield ndjson({"event": "token", "text": piece})
+    except Exception as e:
+        yield ndjson({"event": "error", "detail": getattr(e, "detail", None) or f"{e.__class__.__name__}: {e}"})
+        return
+    stats = token_stats(t_start, t_first, time.perf_counter(), len(parts))
+    yield ndjson({"event": "done", **finish("".join(parts), stats)})
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for handlers that keep reading the request body while responding.
+
+    Starlette's version listens for disconnects by calling receive(), which would swallow body chunks;
+    here receive() is left to the handler, and a disconnect surfaces through request.stream().
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """StreamingResponse for generation streams that hold a model.
+
+    Cancels `token` (services.backend.common.cancel) as soon as the client disconnects, so decoding stops at
+    the next token, and closes the content generator when the response ends either way: an abandoned
+    generator otherwise keeps its model lock until it's garbage collected.
+    """
+
+    def __init__(self, content, token, **kwargs):
+        super().__init__(content, **kwargs)
+        self.token = token
+        self._content = content
+
+    async def __call__(self, scope, receive, send) -> None:
+        watcher = asyncio.ensure_future(watch_disconnect(receive, self.token))
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            watcher.cancel()
+            close = getattr(self._content, "close", None)
+            if close is not None:
+                await run_in_threadpool(close)
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """Non-empty lines from a chunked body, yielded as soon as each one is complete."""
+    buf = bytearray()
+    async for chunk in chunks:
+        buf += chunk
+        while True:
+            i = buf.find(b"\n")
+            if i < 0:
+                break
+            line = bytes(buf[:i])
+            del buf[: i + 1]
+            if line.strip():
+                yield line
+        if len(buf) > max_line_bytes:
+            raise ValueError(f"Record longer than {max_line_bytes} bytes")
+    if bytes(buf).strip():
+        yield bytes(buf)
+
+
+async def ndjson_pipeline(
+    chunks: AsyncIterator[bytes],
+    handle: Callable[[dict], dict],
+    window: int = 32,
+    concurrency: int = 1,
+    max_line_bytes: int = 1 << 20,
+    on_abort: Optional[Callable[[], None]] = None,
+) -> AsyncIterator[bytes]:
+    """Redact an NDJSON request body record by record: one `result` event per record, in input order, then `done`.
+
+    `handle(record) -> dict` runs in the threadpool, at most `concurrency` at a time. At most `window` records
+    are read but not yet written back; past that the body isn't read, so TCP flow control pauses the client,
+    and a slow reader of the response stalls intake the same way. `on_abort()` runs if the stream is closed
+    before its `done` event (client gone), e.g. to stop the record that's still generating.
+    """
+    slots = asyncio.Semaphore(window)
+    workers = asyncio.Semaphore(concurrency)
+    order: asyncio.Queue = asyncio.Queue()
+    t0 = time.perf_counter()
+
+    async def run(seq: int, line: bytes, t_read: float) -> dict:
+        rec_id = seq
+        async with workers:
+            t_start = time.perf_counter()
+            try:
+                rec = json.loads(line)
+                if not isinstance(rec, dict) or not isinstance(rec.get("text"), str):
+                    raise ValueError('each record must be an object with a "text" string')
+                rec_id = rec.get("id", seq)
+                out = await run_in_threadpool(handle, rec)
+            except Exception as e:
+                # HTTPException carries a detail; anything else is reported by type.
+                out = {"error": getattr(e, "detail", None) or f"{e.__class__.__name__}: {e}"}
+            t_end = time.perf_counter()
+        return {
+            "event": "result",
+            "id": rec_id,
+            "seq": seq,
+            **out,
+            "queue_ms": (t_start - t_read) * 1000.0,
+            "latency_ms": (t_end - t_start) * 1000.0,
+        }
+
+    async def read() -> None:
+        seq = 0
+        try:
+            async for line in ndjson_lines(chunks, max_line_bytes):
+                await slots.acquire()
+                order.put_nowait(asyncio.ensure_future(run(seq, line, time.perf_counter())))
+                seq += 1
+        except Exception as e:
+            order.put_nowait(e)
+        finally:
+            order.put_nowait(None)
+
+    reader = asyncio.ensure_future(read())
+    records = errors = 0
+    finished = False
+    try:
+        while True:
+            item = await order.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                yield ndjson({"event": "error", "detail": f"{item.__class__.__name__}: {item}"})
+                continue
+            result = await item
+            slots.release()
+            records += 1
+            errors += "error" in result
+            yield ndjson(result)
+        finished = True
+        yield ndjson({"event": "done", "records": records, "errors": errors, "latency_ms": (time.perf_counter() - t0) * 1000.0})
+    finally:
+        if not finished and on_abort is not None:
+            on_abort()
+        # Client gone or stream finished: stop reading and drop records that haven't started.
+        reader.cancel()
+        while not order.empty():
+            item = order.get_nowait()
+            if isinstance(item, asyncio.Future):
+                item.cancel()
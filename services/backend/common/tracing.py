@@ -0,0 +1,273 @@
+import atexit
+import contextvars
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Optional, Union
+
+# none | file | otlp. "file" writes OTLP/JSON lines (one export request per line), the same
+# format the OpenTelemetry collector's file exporter writes and its otlpjsonfile receiver reads.
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").strip().lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/")
+TRACING_FLUSH_S = float(os.getenv("TRACING_FLUSH_S", "1"))
+TRACING_BATCH = int(os.getenv("TRACING_BATCH", "256"))
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_exporter: Optional["_Exporter"] = None
+_service_name = os.getenv("OTEL_SERVICE_NAME", "pii-redaction")
+
+
+def enabled() -> bool:
+    return TRACING_EXPORTER in {"file", "otlp"}
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str]]:
+    """W3C `traceparent` -> (trace_id, parent_span_id), or None if absent/invalid."""
+    m = TRACEPARENT_RE.match((value or "").strip().lower())
+    if not m or m.group(1) == "0" * 32 or m.group(2) == "0" * 16:
+        return None
+    return m.group(1), m.group(2)
+
+
+def _attr(key: str, value) -> dict:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def fail(self, error: Union[BaseException, str]) -> None:
+        self.error = f"{error.__class__.__name__}: {error}" if isinstance(error, BaseException) else error
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if _exporter is not None:
+                _exporter.put(self)
+
+    def otlp(self) -> dict:
+        out = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_attr(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        return out
+
+
+class _NoopSpan:
+    traceparent = None
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def fail(self, error) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class _Exporter:
+    """Batches finished spans on a background thread and ships them as OTLP/JSON."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.q: queue.Queue = queue.Queue(maxsize=TRACING_BATCH * 64)
+        self.dropped = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="trace-export", daemon=True).start()
+        atexit.register(self.flush)
+
+    def put(self, span: Span) -> None:
+        try:
+            self.q.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> list:
+        batch = []
+        while len(batch) < TRACING_BATCH:
+            try:
+                batch.append(self.q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _payload(self, spans: list) -> dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_attr("service.name", _service_name)]},
+                    "scopeSpans": [{"scope": {"name": "pii-redaction"}, "spans": [s.otlp() for s in spans]}],
+                }
+            ]
+        }
+
+    def _send(self, spans: list) -> None:
+        body = json.dumps(self._payload(spans), separators=(",", ":"))
+        if self.kind == "file":
+            with self._lock, open(TRACING_FILE, "a", encoding="utf-8") as f:
+                f.write(body + "\n")
+            return
+        req = urllib.request.Request(
+            f"{OTLP_ENDPOINT}/v1/traces",
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=5):
+            pass
+
+    def flush(self) -> None:
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            try:
+                self._send(batch)
+            except Exception:
+                # Tracing must never take the service down; a lost batch is just lost.
+                self.dropped += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(TRACING_FLUSH_S)
+            self.flush()
+
+
+def configure(service_name: str) -> None:
+    """Set this process's service.name and start the exporter (once; no-op when TRACING_EXPORTER=none)."""
+    global _exporter, _service_name
+    _service_name = os.getenv("OTEL_SERVICE_NAME", service_name)
+    if enabled() and _exporter is None:
+        _exporter = _Exporter(TRACING_EXPORTER)
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name: str, parent=None, kind: str = "internal", **attributes):
+    """Start a span without making it current; call .end(). Use this across generator yields.
+
+    `parent` is a Span, a W3C traceparent string, or None (= the current span, else a new trace).
+    """
+    if _exporter is None:
+        return NOOP
+    if parent is None:
+        parent = _current.get()
+    if isinstance(parent, Span):
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        ctx = parse_traceparent(parent) if isinstance(parent, str) else None
+        trace_id, parent_id = ctx if ctx else (secrets.token_hex(16), None)
+    return Span(name, trace_id, parent_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, parent=None, kind: str = "internal", **attributes):
+    """Start a span, make it current for the block, and end it (marking errors) on exit."""
+    s = start_span(name, parent=parent, kind=kind, **attributes)
+    if s is NOOP:
+        yield s
+        return
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def inject(headers: Optional[dict] = None, s=None) -> dict:
+    """Add `traceparent` for `s` (default: the current span) to outgoing request headers."""
+    headers = dict(headers or {})
+    s = s if s is not None else _current.get()
+    if s is not None and s.traceparent:
+        headers["traceparent"] = s.traceparent
+    return headers
+
+
+class TracingMiddleware:
+    """ASGI middleware: one server span per HTTP request, continuing the caller's `traceparent`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        method, path = scope.get("method", "GET"), scope.get("path", "")
+        with span(
+            f"{method} {path}",
+            parent=headers.get("traceparent"),
+            kind="server",
+            **{"http.method": method, "http.target": path},
+        ) as s:
+
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    s.set(**{"http.status_code": message["status"]})
+                    if message["status"] >= 500:
+                        s.fail(f"HTTP {message['status']}")
+                    message["headers"] = list(message.get("headers") or []) + [(b"traceparent", s.traceparent.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
+
+
+def install_tracing(app, service_name: str) -> None:
+    """Configure the exporter and add TracingMiddleware (nothing is added when tracing is off)."""
+    configure(service_name)
+    if _exporter is not None:
+        app.add_middleware(TracingMiddleware)
@@ -1,23 +1,115 @@
+import codecs
 import os
 import threading
+import gzip
+import hashlib
 import json
+import logging
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from pii_masking.eval.store import ERROR_TYPES, EXAMPLES_FILE, INDEX_FILE, ExampleStore
 from pii_masking.infer.gguf_infer import GGUFModel
+from pii_masking.infer.bulk import BulkRedactor
+from pii_masking.infer.cancel import GenerationCancelled
+from pii_masking.infer.gguf_meta import estimate_gguf_ram_bytes, is_lora_adapter, read_gguf_metadata
+from pii_masking.infer.llama_profile import resolve_llama_params
+from pii_masking.infer.pii_gate import PIIGate
+from pii_masking.infer.sentence_memo import SentenceStore, redact_by_sentence
+from pii_masking.utils.align import align_entities
+from pii_masking.utils.compaction import Compacted, compact, project
 from pii_masking.utils.post_processing import normalize_entities
-from services.backend.common.schema import RedactIn, RedactOut
+from services.backend.common.cancel import (
+    CancelToken,
+    cancellable_pieces,
+    cancellations,
+    cancelled_error,
+    request_token,
+    run_cancellable,
+)
+from services.backend.common.profiling import install_profiling, profiled
+from services.backend.common.schema import RedactBulkIn, RedactBulkOut, RedactIn, RedactOut
+from services.backend.common.streaming import (
+    CancellableStreamingResponse,
+    DuplexStreamingResponse,
+    ndjson,
+    ndjson_pipeline,
+    stream_events,
+)
+from services.backend.common.tracing import current_span, install_tracing, span, start_span
+from services.backend.cpu.model_manager import (
+    ModelBudgetError,
+    ModelLoadError,
+    ModelManager,
+    file_stamp,
+    system_memory_bytes,
+)
+from services.backend.cpu.scheduler import FairScheduler
 
 GGUF_PATH = os.getenv("GGUF_PATH")  # e.g. /models/gguf/quantized/mistral7b-pii-Q5_K_M.gguf
-N_CTX = int(os.getenv("N_CTX", "2048"))
-THREADS = int(os.getenv("THREADS", str(os.cpu_count() or 4)))
+# Unset = use the model's tuned profile (<model>.gguf.tuned.json from pii_masking.cli.autotune), else defaults.
+N_CTX = int(os.getenv("N_CTX")) if os.getenv("N_CTX") else None
+THREADS = int(os.getenv("THREADS")) if os.getenv("THREADS") else None
 GGUF_SCAN_DIRS = [p.strip() for p in os.getenv("GGUF_SCAN_DIRS", "").split(",") if p.strip()]
+# 0 = derive from the container memory limit (or physical RAM) times MODEL_RAM_FRACTION.
+MODEL_RAM_BUDGET_MB = int(os.getenv("MODEL_RAM_BUDGET_MB", "0"))
+MODEL_RAM_FRACTION = float(os.getenv("MODEL_RAM_FRACTION", "0.8"))
+MODEL_OVERHEAD_MB = int(os.getenv("MODEL_OVERHEAD_MB", "256"))
+# Comma-separated paths or file names to load in the background at startup ("*" = all scanned).
+PRELOAD_MODELS = [p.strip() for p in os.getenv("PRELOAD_MODELS", "").split(",") if p.strip()]
+# Hot reload: how often loaded model files and GGUF_PATH's target are checked (0 = never), and how long a
+# changed file must go unmodified before its new version is loaded.
+MODEL_RELOAD_INTERVAL_S = float(os.getenv("MODEL_RELOAD_INTERVAL_S", "10"))
+MODEL_RELOAD_SETTLE_S = float(os.getenv("MODEL_RELOAD_SETTLE_S", "5"))
+# Run through each model (version) before it takes traffic: JSONL with "text"/"input", or plain lines.
+WARMUP_CORPUS = os.getenv("WARMUP_CORPUS")
+WARMUP_MAX_NEW_TOKENS = int(os.getenv("WARMUP_MAX_NEW_TOKENS", "16"))
 EVAL_RUNS_DIR = Path(
     os.getenv("EVAL_RUNS_DIR", str(Path(__file__).resolve().parents[3] / "src" / "pii_masking" / "eval" / "eval_runs"))
 )
+EVAL_GZIP_MIN_BYTES = int(os.getenv("EVAL_GZIP_MIN_BYTES", "4096"))
+EVAL_BODY_CACHE_SIZE = int(os.getenv("EVAL_BODY_CACHE_SIZE", "64"))
+EVAL_EXAMPLES_MAX_LIMIT = int(os.getenv("EVAL_EXAMPLES_MAX_LIMIT", "200"))
+# /redact/bulk: template masks are applied once this many LLM redactions agree at BULK_CONFIDENCE.
+BULK_CONFIDENCE = float(os.getenv("BULK_CONFIDENCE", "0.9"))
+BULK_MIN_OBSERVATIONS = int(os.getenv("BULK_MIN_OBSERVATIONS", "2"))
+BULK_SIM_THRESHOLD = float(os.getenv("BULK_SIM_THRESHOLD", "0.5"))
+BULK_MAX_TEMPLATES = int(os.getenv("BULK_MAX_TEMPLATES", "1000"))
+BULK_MAX_TEXTS = int(os.getenv("BULK_MAX_TEXTS", "1000"))
+# /redact/ndjson: records read ahead of the response, records redacted concurrently, longest accepted line.
+NDJSON_WINDOW = int(os.getenv("NDJSON_WINDOW", "32"))
+NDJSON_CONCURRENCY = int(os.getenv("NDJSON_CONCURRENCY", "1"))
+NDJSON_MAX_LINE_BYTES = int(os.getenv("NDJSON_MAX_LINE_BYTES", str(1 << 20)))
+# mode="sentences": per-sentence redaction cache, and the input-token budget per batched prompt.
+SENTENCE_CACHE_PATH = os.getenv("SENTENCE_CACHE_PATH", ".cache/sentence_cache.sqlite")
+SENTENCE_CACHE_MAX_ROWS = int(os.getenv("SENTENCE_CACHE_MAX_ROWS", "1000000"))
+SENTENCE_BATCH_TOKENS = int(os.getenv("SENTENCE_BATCH_TOKENS", "384"))
+# Default for RedactIn.compact (/redact and /redact/stream).
+COMPACT_INPUT = os.getenv("COMPACT_INPUT", "0") == "1"
+# Optional sentence PII gate (pii_masking.train.train_gate); sentences it doesn't flag skip the model.
+PII_GATE_PATH = os.getenv("PII_GATE_PATH")
+PII_GATE_THRESHOLD = float(os.getenv("PII_GATE_THRESHOLD")) if os.getenv("PII_GATE_THRESHOLD") else None
+
+# Priority classes, highest first ("name=weight,..."): weights share a model between flows (class, client).
+SCHED_WEIGHTS = {
+    k.strip(): float(v) for k, v in (p.split("=", 1) for p in os.getenv("SCHED_WEIGHTS", "interactive=8,batch=1").split(",") if p.strip())
+}
+# "class=seconds": how long one generation of that class may hold a model while higher classes wait.
+SCHED_MAX_HOLD_S = {
+    k.strip(): float(v) for k, v in (p.split("=", 1) for p in os.getenv("SCHED_MAX_HOLD_S", "batch=2").split(",") if p.strip())
+}
+# "key=class[:client],...", matched against X-API-Key. Once keys are set, X-Priority can only lower a request's class.
+SCHED_API_KEYS = {
+    k.strip(): tuple(v.strip().split(":", 1)) for k, v in (p.split("=", 1) for p in os.getenv("SCHED_API_KEYS", "").split(",") if p.strip())
+}
+SCHED_BULK_CLASS = os.getenv("SCHED_BULK_CLASS", list(SCHED_WEIGHTS)[-1])
 SYSTEM = os.getenv(
     "PII_SYSTEM_PROMPT",
     "You are a PII redaction assistant. Replace PII with bracketed tags only. "
@@ -26,6 +118,8 @@ SYSTEM = os.getenv(
     "Preserve all non-PII text exactly. Output only the redacted text.",
 )
 
+log = logging.getLogger(__name__)
+
 app = FastAPI(title="PII Redaction (CPU/GGUF)")
 app.add_middleware(
     CORSMiddleware,
@@ -34,11 +128,34 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+install_profiling(app, "cpu-gguf")
+install_tracing(app, "pii-backend-cpu")
 
-_models_lock = threading.Lock()
-_model_cache: dict[str, GGUFModel] = {}
-_model_infer_locks: dict[str, threading.Lock] = {}
 _allowed_models: list[str] = []
+# LoRA adapters found by the same scan: name (file stem) -> path. Applied per request on top of a base model.
+_adapters: dict[str, str] = {}
+# path -> (mtime_ns, is adapter), so headers are only re-read when a file changes.
+_gguf_kinds: dict[str, tuple[int, bool]] = {}
+_eval_lock = threading.Lock()
+# path -> {"mtime_ns", "size", "etag", "data"}; revalidated against stat() on every read.
+_eval_cache: dict[str, dict] = {}
+# view etag -> (json body, gzip body or None), least recently used first
+_eval_bodies: "OrderedDict[str, tuple[bytes, Optional[bytes]]]" = OrderedDict()
+# run dir -> ((parquet mtime_ns, index mtime_ns), ExampleStore)
+_example_stores: dict[str, tuple[tuple[int, int], ExampleStore]] = {}
+# _model_key (path, file version, adapter) -> learned templates for /redact/bulk
+_bulk: dict[str, BulkRedactor] = {}
+_bulk_lock = threading.Lock()
+_sentences: Optional[SentenceStore] = None
+_sentences_lock = threading.Lock()
+_gate: Optional[PIIGate] = None
+# Orders generations per model path across priority classes and clients; infer_lock still guards the model itself.
+_sched = FairScheduler(SCHED_WEIGHTS, max_hold_s=SCHED_MAX_HOLD_S)
+# Default model actually served: switches to a new GGUF_PATH target only once that model is warm.
+_serving_default: Optional[str] = None
+_ready = threading.Event()
+_startup_error: Optional[str] = None
+_warmup_texts: Optional[list[str]] = None
 
 
 def _default_scan_dirs() -> list[str]:
@@ -66,14 +183,39 @@ def _scan_models() -> list[str]:
     return sorted(out)
 
 
+def _is_adapter(path: str) -> bool:
+    mtime = os.stat(path).st_mtime_ns
+    cached = _gguf_kinds.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        kind = is_lora_adapter(read_gguf_metadata(path))
+    except (OSError, ValueError):
+        kind = False
+    _gguf_kinds[path] = (mtime, kind)
+    return kind
+
+
 def _refresh_allowed_models() -> list[str]:
-    global _allowed_models
-    _allowed_models = _scan_models()
+    global _allowed_models, _adapters
+    models, adapters = [], {}
+    for p in _scan_models():
+        if _is_adapter(p):
+            adapters.setdefault(Path(p).stem, p)
+        else:
+            models.append(p)
+    _allowed_models, _adapters = models, adapters
     return _allowed_models
 
 
 def _default_model_path() -> Optional[str]:
     allowed = _refresh_allowed_models()
+    if _serving_default in allowed:
+        return _serving_default
+    return _configured_default_path(allowed)
+
+
+def _configured_default_path(allowed: list[str]) -> Optional[str]:
     if GGUF_PATH and os.path.isfile(GGUF_PATH):
         return str(Path(GGUF_PATH).resolve())
     if allowed:
@@ -81,21 +223,139 @@ def _default_model_path() -> Optional[str]:
     return None
 
 
-def _get_model(model_path: str) -> GGUFModel:
-    rp = str(Path(model_path).resolve())
-    with _models_lock:
-        if rp not in _model_cache:
-            _model_cache[rp] = GGUFModel(rp, n_ctx=N_CTX, n_threads=THREADS)
-            _model_infer_locks[rp] = threading.Lock()
-        return _model_cache[rp]
+def _budget_bytes() -> int:
+    if MODEL_RAM_BUDGET_MB > 0:
+        return MODEL_RAM_BUDGET_MB * 1024 * 1024
+    return int(system_memory_bytes() * MODEL_RAM_FRACTION)
+
+
+def _llama_params(path: str) -> dict:
+    return resolve_llama_params(path, n_ctx=N_CTX, n_threads=THREADS)
+
+
+_models = ModelManager(
+    loader=lambda p: GGUFModel(p, **_llama_params(p)),
+    estimator=lambda p: estimate_gguf_ram_bytes(
+        p, _llama_params(p)["n_ctx"], overhead_bytes=MODEL_OVERHEAD_MB * 1024 * 1024
+    ),
+    budget_bytes=_budget_bytes(),
+    closer=lambda m: m.close(),
+)
+
+
+def _preload_paths(allowed: list[str]) -> list[str]:
+    if "*" in PRELOAD_MODELS:
+        return list(allowed)
+    out = []
+    for want in PRELOAD_MODELS:
+        rp = str(Path(want).resolve())
+        match = rp if rp in allowed else next((a for a in allowed if os.path.basename(a) == want), None)
+        if match and match not in out:
+            out.append(match)
+    return out
 
 
-def _get_model_infer_lock(model_path: str) -> threading.Lock:
-    rp = str(Path(model_path).resolve())
-    with _models_lock:
-        if rp not in _model_infer_locks:
-            _model_infer_locks[rp] = threading.Lock()
-        return _model_infer_locks[rp]
+def _warmup_corpus() -> list[str]:
+    global _warmup_texts
+    if _warmup_texts is None:
+        texts = ["John Smith lives at 123 Main St. Call him at 555-0100 or mail john.smith@example.com."]
+        if WARMUP_CORPUS:
+            texts = []
+            with open(WARMUP_CORPUS, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("{"):
+                        obj = json.loads(line)
+                        line = obj.get("text") or obj.get("input") or ""
+                    if line:
+                        texts.append(line)
+        _warmup_texts = texts
+    return _warmup_texts
+
+
+def _warm(model) -> None:
+    # Pages the weights in and fills llama.cpp's buffers (and the system prompt's KV prefix) before real traffic.
+    for text in _warmup_corpus():
+        model.complete(SYSTEM, text, max_new_tokens=WARMUP_MAX_NEW_TOKENS)
+
+
+def _load_warm(path: str, evict: bool = True) -> None:
+    # Pinned for the warm-up, so no other load can evict the model halfway; warm_lock makes a second caller
+    # (startup and the watcher both warming the default) wait for the first one's warm-up instead of repeating it.
+    with _models.use(path, evict=evict) as slot, slot.warm_lock:
+        if slot.warmup_ms is None:
+            # One background-class turn per text: requests that arrive meanwhile get the model between texts,
+            # however long WARMUP_CORPUS is.
+            t0 = time.perf_counter()
+            for text in _warmup_corpus():
+                with _sched.turn(slot.path, SCHED_BULK_CLASS, "warmup", cost=WARMUP_MAX_NEW_TOKENS), slot.infer_lock:
+                    slot.model.complete(SYSTEM, text, max_new_tokens=WARMUP_MAX_NEW_TOKENS)
+            slot.warmup_ms = (time.perf_counter() - t0) * 1000.0
+
+
+def _settled(path: str) -> bool:
+    stamp = file_stamp(path)
+    return stamp is not None and time.time() - stamp[2] / 1e9 >= MODEL_RELOAD_SETTLE_S
+
+
+def _check_models() -> None:
+    """One hot-reload pass: new versions of replaced files, a retargeted GGUF_PATH, newly dropped PRELOAD_MODELS."""
+    global _serving_default, _startup_error
+    for path in _models.changed(MODEL_RELOAD_SETTLE_S):
+        try:
+            _models.reload(path, warmup=_warm)
+        except Exception:
+            log.exception("hot reload of %s failed; the loaded version keeps serving", path)
+            continue
+        with _bulk_lock:
+            # Templates learned from the previous version (see _model_key).
+            for key in [k for k in _bulk if k == path or k.startswith((path + "@", path + "+"))]:
+                del _bulk[key]
+
+    allowed = _refresh_allowed_models()
+    want = _configured_default_path(allowed)
+    if want and want != _serving_default and _settled(want):
+        try:
+            _load_warm(want)
+            _serving_default = want
+            # Also recovers readiness after a failed first load.
+            _startup_error = None
+            _ready.set()
+            log.info("default model switched to %s", want)
+        except Exception:
+            log.exception("loading new default model %s failed", want)
+
+    status = _models.status(allowed)
+    for path in _preload_paths(allowed):
+        if status[path]["state"] == "unloaded" and _settled(path):
+            try:
+                _load_warm(path, evict=False)
+            except Exception as e:
+                log.warning("preload of %s skipped: %s", path, e)
+
+
+def _watch_models() -> None:
+    while True:
+        time.sleep(MODEL_RELOAD_INTERVAL_S)
+        try:
+            _check_models()
+        except Exception:
+            log.exception("model reload check failed")
+
+
+def _warm_start(default_model: str) -> None:
+    global _serving_default, _startup_error
+    try:
+        _load_warm(default_model)
+    except Exception as e:
+        _startup_error = f"{e.__class__.__name__}: {e}"
+        log.exception("loading default model %s failed", default_model)
+        return
+    _serving_default = default_model
+    _ready.set()
+    preload = [p for p in _preload_paths(_allowed_models) if p != default_model]
+    if preload:
+        _models.preload(preload)
 
 
 def _eval_file(path: Path) -> Path:
@@ -106,14 +366,89 @@ def _eval_file(path: Path) -> Path:
     return rp
 
 
-def _read_json(path: Path):
+def _eval_entry(path: Path) -> dict:
     p = _eval_file(path)
-    if not p.exists():
+    try:
+        st = p.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Eval file not found: {p.name}")
+    key = str(p)
+    with _eval_lock:
+        entry = _eval_cache.get(key)
+    if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+        return entry
+
+    raw = p.read_bytes()
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        data = json.loads(raw.decode("utf-8"))
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=500, detail=f"Invalid JSON in {p.name}: {e}") from e
+    entry = {
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "etag": hashlib.sha1(raw).hexdigest()[:16],
+        "data": data,
+    }
+    with _eval_lock:
+        _eval_cache[key] = entry
+    return entry
+
+
+def _read_json(path: Path):
+    return _eval_entry(path)["data"]
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _accepts_gzip(header: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip: an explicit gzip entry wins over `*`, and q=0 refuses."""
+    qs = {}
+    for part in header.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            qs[coding.lower()] = q
+    q = qs.get("gzip", qs.get("x-gzip", qs.get("*", 0.0)))
+    return q > 0
+
+
+def _eval_response(request: Request, etag: str, build) -> Response:
+    """Serve an eval view with ETag revalidation; `build()` only runs when the body is not cached."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    with _eval_lock:
+        cached = _eval_bodies.get(etag)
+        if cached is not None:
+            _eval_bodies.move_to_end(etag)
+    if cached is None:
+        body = json.dumps(build(), ensure_ascii=False).encode("utf-8")
+        gz = gzip.compress(body, compresslevel=6) if len(body) >= EVAL_GZIP_MIN_BYTES else None
+        cached = (body, gz)
+        with _eval_lock:
+            _eval_bodies[etag] = cached
+            while len(_eval_bodies) > EVAL_BODY_CACHE_SIZE:
+                _eval_bodies.popitem(last=False)
+
+    body, gz = cached
+    if gz is not None and _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        body = gz
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 def _summary_path_for_run(run_name: str) -> Path:
@@ -136,66 +471,582 @@ def _norm_row(row: dict) -> dict:
 
 @app.on_event("startup")
 def _load():
+    global _gate
+    if PII_GATE_PATH:
+        _gate = PIIGate.load(PII_GATE_PATH, PII_GATE_THRESHOLD)
     default_model = _default_model_path()
     assert default_model, f"No GGUF models found. GGUF_PATH={GGUF_PATH}, GGUF_SCAN_DIRS={GGUF_SCAN_DIRS}"
-    _get_model(default_model)
+    # Loads in the background: /healthz/live answers right away, /healthz/ready once the default model is warm.
+    threading.Thread(target=_warm_start, args=(default_model,), name="model-warm-start", daemon=True).start()
+    if MODEL_RELOAD_INTERVAL_S > 0:
+        threading.Thread(target=_watch_models, name="model-reload", daemon=True).start()
+
+
+@app.get("/healthz/live")
+def healthz_live():
+    return {"status": "ok"}
+
+
+@app.get("/healthz/ready")
+def healthz_ready():
+    if not _ready.is_set():
+        raise HTTPException(status_code=503, detail=_startup_error or "Default model is still loading.")
+    return {"status": "ready", "default_model": _serving_default}
 
 @app.get("/")
 def root():
     model_path = _default_model_path()
+    params = _llama_params(model_path) if model_path else {}
     return {
         "backend": "cpu-gguf",
         "mode": "single-model-ready",
         "gguf": model_path,
         "model_name": os.path.basename(model_path) if model_path else None,
-        "n_ctx": N_CTX,
-        "threads": THREADS,
+        "n_ctx": params.get("n_ctx"),
+        "threads": params.get("n_threads"),
+        "llama_params": params,
+        "cancellations": cancellations(),
     }
 
 
 @app.get("/models")
 def models():
     allowed = _refresh_allowed_models()
-    return {"default_model": _default_model_path(), "models": allowed}
+    status = _models.status(allowed)
+    for path, model in _models.loaded().items():
+        if path in status:
+            status[path]["adapters"] = model.adapter_stats()
+    return {
+        "default_model": _default_model_path(),
+        "models": allowed,
+        "ready": _ready.is_set(),
+        "adapters": dict(_adapters),
+        "status": status,
+        "budget_bytes": _models.budget_bytes,
+        "used_bytes": _models.used_bytes(),
+        "evictions": _models.evictions,
+        "reloads": _models.reloads,
+    }
 
 
-@app.get("/eval/leaderboard")
-def eval_leaderboard():
-    payload = _read_json(EVAL_RUNS_DIR / "leaderboard.json")
+@app.get("/scheduler")
+def scheduler():
+    """Per-class queue wait (ms) over the last 1024 grants, plus what each model's queue holds right now."""
+    return _sched.stats()
+
+
+def _leaderboard_view(payload: dict) -> dict:
     rows = [_norm_row(r) for r in payload.get("rows", [])]
     return {"dataset": payload.get("dataset"), "rows": rows}
 
 
+@app.get("/eval/leaderboard")
+def eval_leaderboard(request: Request):
+    entry = _eval_entry(EVAL_RUNS_DIR / "leaderboard.json")
+    return _eval_response(request, f'"lb-{entry["etag"]}"', lambda: _leaderboard_view(entry["data"]))
+
+
 @app.get("/eval/summary/{run_name}")
-def eval_summary(run_name: str):
+def eval_summary(run_name: str, request: Request):
     if not run_name:
         raise HTTPException(status_code=400, detail="run_name is required.")
-    return _read_json(_summary_path_for_run(run_name))
+    entry = _eval_entry(_summary_path_for_run(run_name))
+    return _eval_response(request, f'"sum-{entry["etag"]}"', lambda: entry["data"])
 
-@app.post("/redact", response_model=RedactOut)
-def redact(x: RedactIn):
+
+@app.get("/eval/overview")
+def eval_overview(request: Request):
+    """Leaderboard plus the top run's summary, so a page load needs a single round-trip."""
+    lb = _eval_entry(EVAL_RUNS_DIR / "leaderboard.json")
+    view = _leaderboard_view(lb["data"])
+    top_run = view["rows"][0].get("run_name") if view["rows"] else None
+    summary = None
+    summary_error = None
+    etag_parts = [lb["etag"]]
+    if top_run:
+        try:
+            summary = _eval_entry(_summary_path_for_run(top_run))
+            etag_parts.append(summary["etag"])
+        except HTTPException as e:
+            summary_error = e.detail
+            etag_parts.append("missing")
+    etag = f'"ov-{hashlib.sha1("-".join(etag_parts).encode()).hexdigest()[:16]}"'
+    return _eval_response(
+        request,
+        etag,
+        lambda: {
+            **view,
+            "top_run": top_run,
+            "summary": summary["data"] if summary else None,
+            "summary_error": summary_error,
+        },
+    )
+
+def _example_store(run_name: str) -> ExampleStore:
+    d = _eval_file(EVAL_RUNS_DIR / run_name)
+    try:
+        stamp = ((d / EXAMPLES_FILE).stat().st_mtime_ns, (d / INDEX_FILE).stat().st_mtime_ns)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No example store for run: {run_name}")
+    key = str(d)
+    with _eval_lock:
+        cached = _example_stores.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    store = ExampleStore(key)
+    with _eval_lock:
+        _example_stores[key] = (stamp, store)
+    return store
+
+
+@app.get("/eval/examples")
+def eval_examples(
+    run_name: str,
+    model_type: Optional[str] = None,
+    error: Optional[str] = None,
+    tag: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 50,
+):
+    """Page through a run's examples, optionally only those with `error` (missing/spurious/confused) on `tag`."""
+    if error is not None and error not in ERROR_TYPES:
+        raise HTTPException(status_code=400, detail=f"error must be one of: {', '.join(ERROR_TYPES)}")
+    if offset < 0 or not 1 <= limit <= EVAL_EXAMPLES_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Need offset >= 0 and 1 <= limit <= {EVAL_EXAMPLES_MAX_LIMIT}.")
+    store = _example_store(run_name)
+    if model_type is not None and model_type not in store.index["models"]:
+        raise HTTPException(status_code=404, detail=f"No {model_type} rows in run: {run_name}")
+    return {
+        "run_name": run_name,
+        "model_type": model_type,
+        "error": error,
+        "tag": tag.upper() if tag else None,
+        **store.page(model_type, error, tag.upper() if tag else None, offset, limit),
+    }
+
+
+def _selected_model_path(x: RedactIn | RedactBulkIn) -> str:
+    return _allowed_model_path(x.model_path)
+
+
+def _allowed_model_path(model_path: Optional[str]) -> str:
     allowed = _refresh_allowed_models()
-    selected = x.model_path or _default_model_path()
+    selected = model_path or _default_model_path()
     if not selected:
         raise HTTPException(status_code=400, detail="No model path provided.")
     selected = str(Path(selected).resolve())
     if selected not in allowed:
         raise HTTPException(status_code=400, detail=f"Model not in allowed list: {selected}")
+    return selected
+
+
+def _adapter_path(name: Optional[str]) -> Optional[str]:
+    """Path of a scanned LoRA adapter, by name or path (call after _allowed_model_path, which refreshes the scan)."""
+    if not name:
+        return None
+    path = _adapters.get(name)
+    if path is None:
+        rp = str(Path(name).resolve())
+        path = rp if rp in _adapters.values() else None
+    if path is None:
+        raise HTTPException(status_code=400, detail=f"Unknown adapter: {name}")
+    return path
+
+
+def _adapter_name(path: Optional[str]) -> Optional[str]:
+    return Path(path).stem if path else None
+
+
+def _apply_adapter(slot, adapter: Optional[str]) -> float:
+    """Make `adapter` active on the slot's model (caller holds infer_lock); returns the switch cost in ms."""
+    try:
+        return slot.model.set_adapter(adapter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e} (base model: {os.path.basename(slot.path)})") from e
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@contextmanager
+def _use_model(path: str):
+    try:
+        with _models.use(path) as slot:
+            yield slot
+    except ModelBudgetError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"}) from e
+    except ModelLoadError as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+def _sentence_store() -> SentenceStore:
+    global _sentences
+    with _sentences_lock:
+        if _sentences is None:
+            _sentences = SentenceStore(SENTENCE_CACHE_PATH, max_rows=SENTENCE_CACHE_MAX_ROWS)
+        return _sentences
+
+
+def _priority(request: Request, default: str) -> tuple[str, str]:
+    """(class, client) for a request: API key first, then X-Priority / X-Client-Id, then the endpoint default."""
+    key = request.headers.get("x-api-key")
+    if key and key in SCHED_API_KEYS:
+        cls, *client = SCHED_API_KEYS[key]
+        return cls, client[0] if client else hashlib.sha1(key.encode()).hexdigest()[:12]
+    if key and SCHED_API_KEYS:
+        raise HTTPException(status_code=401, detail="Unknown API key.")
+    cls = request.headers.get("x-priority") or default
+    if cls not in SCHED_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"Unknown priority class: {cls}")
+    if SCHED_API_KEYS and _sched.ranks[cls] < _sched.ranks[default]:
+        cls = default
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else "-")
+    return cls, client
+
+
+def _generation(
+    slot,
+    prio: tuple[str, str],
+    text: str,
+    max_new: int,
+    token: CancelToken,
+    adapter: Optional[str],
+    usage: dict,
+    parent=None,
+) -> Iterator[str]:
+    """Text pieces of one scheduled generation; fills `usage` (prompt/completion tokens, adapter_switch_ms).
+
+    Past its class's hold cap it hands the model to waiting higher-priority work and, on its next turn,
+    resumes from the exact token ids generated so far (greedy decoding, so the output matches an
+    uninterrupted run). `adapter` is (re)applied on every turn, since other requests may switch it in between.
+    Raises GenerationCancelled, with the turn and lock released, once `token` fires.
+    """
+    cls, client = prio
+    ids: list[int] = []
+    # Carries a character whose bytes are split across tokens, or across turns.
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    usage.update(prompt_tokens=None, completion_tokens=0, adapter_switch_ms=0.0)
+    while True:
+        lock_wait = start_span("model.lock_wait", parent=parent, **{"sched.class": cls, "sched.resumed": bool(ids)})
+        with _sched.turn(slot.path, cls, client, cost=max_new - len(ids), should_stop=token) as turn, slot.infer_lock:
+            lock_wait.end()
+            usage["adapter_switch_ms"] += _apply_adapter(slot, adapter)
+            prompt = slot.model.prompt_ids(SYSTEM, text)
+            usage["prompt_tokens"] = len(prompt)
+            yielded = False
+            for tok, data in slot.model.stream_ids(prompt, max_new - len(ids), resume=ids, should_stop=token):
+                ids.append(tok)
+                usage["completion_tokens"] = len(ids)
+                piece = decoder.decode(data)
+                if piece:
+                    yield piece
+                if len(ids) < max_new and turn.should_yield():
+                    yielded = True
+                    break
+        if not yielded:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        _sched.record_yield(cls)
+
+
+def _generate(
+    slot, prio: tuple[str, str], text: str, max_new: int, token: CancelToken, adapter: Optional[str] = None
+) -> tuple[str, dict]:
+    """One scheduled generation (see _generation). Classes without a hold cap can't be asked to yield,
+    so they run it as a single llama.cpp completion."""
+    cls, client = prio
+    if _sched.max_hold_s.get(cls):
+        usage: dict = {}
+        raw = "".join(_generation(slot, prio, text, max_new, token, adapter, usage))
+        return raw.strip(), usage
+    lock_wait = start_span("model.lock_wait", **{"sched.class": cls, "sched.resumed": False})
+    with _sched.turn(slot.path, cls, client, cost=max_new, should_stop=token), slot.infer_lock:
+        lock_wait.end()
+        switch_ms = _apply_adapter(slot, adapter)
+        raw, usage = slot.model.complete(SYSTEM, text, max_new_tokens=max_new, should_stop=token)
+        return raw, {**usage, "adapter_switch_ms": switch_ms}
+
+
+def _redact_sentences(
+    slot, prio: tuple[str, str], text: str, token: CancelToken, adapter: Optional[str] = None
+) -> tuple[str, dict]:
+    """Sentence-mode redaction; returns (normalized, stats incl. summed completion_tokens and adapter_switch_ms)."""
+    completion_tokens = 0
+    switch_ms = 0.0
+
+    def llm(chunk: str, max_new: int) -> str:
+        nonlocal completion_tokens, switch_ms
+        raw, usage = _generate(slot, prio, chunk, max_new, token, adapter)
+        completion_tokens += usage.get("completion_tokens") or 0
+        switch_ms += usage["adapter_switch_ms"]
+        return raw
+
+    # Cached redactions are only valid for the model file, adapter and prompt that produced them.
+    namespace = f"{_model_key(slot, adapter)}:{hashlib.sha1(SYSTEM.encode()).hexdigest()}"
+    norm, stats = redact_by_sentence(
+        text,
+        llm,
+        _sentence_store(),
+        namespace,
+        normalize=lambda line, sentence: normalize_entities(line, system=SYSTEM, user_text=sentence),
+        gate=_gate.flags if _gate is not None else None,
+        count_tokens=slot.model.count_tokens,
+        batch_tokens=SENTENCE_BATCH_TOKENS,
+    )
+    return norm, {**stats, "completion_tokens": completion_tokens, "adapter_switch_ms": switch_ms}
+
+
+def _compacted(x: RedactIn) -> Optional[Compacted]:
+    return compact(x.text) if (COMPACT_INPUT if x.compact is None else x.compact) else None
+
+
+def _project(comp: Optional[Compacted], norm: str, entities: list[dict]) -> tuple[str, list[dict], Optional[bool]]:
+    if comp is None:
+        return norm, entities, None
+    out = project(comp, norm)
+    return (*out, True) if out is not None else (norm, entities, False)
 
+
+def _tokens_saved(slot, comp: Optional[Compacted]) -> Optional[int]:
+    # Tokenizing doesn't touch the model's context, so this needs neither a scheduler turn nor the infer lock.
+    if comp is None:
+        return None
+    return slot.model.count_tokens(comp.original) - slot.model.count_tokens(comp.text)
+
+
+@app.post("/redact", response_model=RedactOut)
+async def redact(x: RedactIn, request: Request):
+    token = request_token(request)
+    return await run_cancellable(request, token, _redact, x, request, token)
+
+
+@profiled
+def _redact(x: RedactIn, request: Request, token: CancelToken) -> RedactOut:
+    if x.mode not in (None, "sentences"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {x.mode}")
+    selected = _selected_model_path(x)
+    adapter = _adapter_path(x.adapter)
+    prio = _priority(request, list(SCHED_WEIGHTS)[0])
     max_new = x.max_new_tokens or 256
-    model = _get_model(selected)
-    infer_lock = _get_model_infer_lock(selected)
-    # llama.cpp python bindings are not safe for concurrent generation on the same model instance.
-    t0 = time.perf_counter()
-    with infer_lock:
-        raw = model.generate(SYSTEM, x.text, max_new_tokens=max_new)
+    comp = _compacted(x)
+    text = comp.text if comp else x.text
+    sent = None
+    # Ends once the slot is ready; the finally covers load/budget errors.
+    acquire = start_span("model.acquire", **{"model.path": selected})
+    try:
+        with _use_model(selected) as slot:
+            acquire.end()
+            t0 = time.perf_counter()
+            saved = _tokens_saved(slot, comp)
+            if x.mode == "sentences":
+                with span("llama.sentences") as sp:
+                    norm, sent = _redact_sentences(slot, prio, text, token, adapter)
+                    usage = {k: sent.pop(k) for k in ("completion_tokens", "adapter_switch_ms")}
+                    sp.set(**{f"sentences.{k}": v for k, v in sent.items()})
+            else:
+                with span("llama.generate", **{"gen.max_new_tokens": max_new}) as sp:
+                    raw, usage = _generate(slot, prio, text, max_new, token, adapter)
+                    sp.set(**{
+                        "gen.prompt_tokens": usage.get("prompt_tokens"),
+                        "gen.completion_tokens": usage.get("completion_tokens"),
+                        "gen.adapter_switch_ms": usage["adapter_switch_ms"],
+                    })
+    finally:
+        acquire.end()
     latency_ms = (time.perf_counter() - t0) * 1000.0
-    norm = normalize_entities(raw, system=SYSTEM, user_text=x.text)
+    if sent is None:
+        with span("normalize_entities"):
+            norm = normalize_entities(raw, system=SYSTEM, user_text=text)
+    with span("align_entities") as sp:
+        norm, entities, projected = _project(comp, norm, align_entities(text, norm))
+        sp.set(**{"entities.count": len(entities), "compaction.projected": projected})
     return RedactOut(
         normalized=norm,
         latency_ms=latency_ms,
         tag_count=norm.count("["),
+        completion_tokens=usage.get("completion_tokens"),
+        entities=entities,
         model_name=os.path.basename(selected),
         model_path=selected,
+        adapter=_adapter_name(adapter),
+        adapter_switch_ms=usage["adapter_switch_ms"],
         max_new_tokens=max_new,
+        sentences=(sent or {}).get("sentences"),
+        gated_sentences=(sent or {}).get("gated_sentences"),
+        cached_sentences=(sent or {}).get("cached_sentences"),
+        reuse_ratio=(sent or {}).get("reuse_ratio"),
+        prompt_tokens_saved=saved,
+        projected=projected,
     )
+
+
+def _model_key(slot, adapter: Optional[str] = None) -> str:
+    # The mtime tells hot-reloaded versions of one path apart.
+    key = f"{slot.path}@{slot.stamp[2]}" if slot.stamp else slot.path
+    return f"{key}+{adapter}" if adapter else key
+
+
+def _bulk_redactor(key: str) -> BulkRedactor:
+    # Keyed by _model_key: templates learned from one model version or adapter aren't valid for another.
+    with _bulk_lock:
+        if key not in _bulk:
+            _bulk[key] = BulkRedactor(
+                confidence=BULK_CONFIDENCE,
+                min_observations=BULK_MIN_OBSERVATIONS,
+                sim_threshold=BULK_SIM_THRESHOLD,
+                max_templates=BULK_MAX_TEMPLATES,
+            )
+        return _bulk[key]
+
+
+@app.post("/redact/bulk", response_model=RedactBulkOut)
+async def redact_bulk(x: RedactBulkIn, request: Request):
+    token = request_token(request)
+    return await run_cancellable(request, token, _redact_bulk, x, request, token)
+
+
+def _redact_bulk(x: RedactBulkIn, request: Request, token: CancelToken) -> RedactBulkOut:
+    if len(x.texts) > BULK_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_TEXTS} texts per request.")
+    selected = _selected_model_path(x)
+    adapter = _adapter_path(x.adapter)
+    prio = _priority(request, SCHED_BULK_CLASS)
+    max_new = x.max_new_tokens or 256
+    t0 = time.perf_counter()
+    with _use_model(selected) as slot:
+
+        def llm(text: str) -> str:
+            raw, _usage = _generate(slot, prio, text, max_new, token, adapter)
+            return normalize_entities(raw, system=SYSTEM, user_text=text)
+
+        bulk = _bulk_redactor(_model_key(slot, adapter))
+        with span("bulk.redact_many", **{"bulk.texts": len(x.texts)}) as sp:
+            results = bulk.redact_many(x.texts, llm)
+            hits = sum(1 for r in results if r["source"] == "template")
+            sp.set(**{"bulk.template_hits": hits})
+    model_name = os.path.basename(selected)
+    return RedactBulkOut(
+        results=[
+            RedactOut(
+                tag_count=r["normalized"].count("["),
+                model_name=model_name,
+                model_path=selected,
+                adapter=_adapter_name(adapter),
+                max_new_tokens=max_new,
+                **r,
+            )
+            for r in results
+        ],
+        latency_ms=(time.perf_counter() - t0) * 1000.0,
+        llm_calls=len(results) - hits,
+        template_hits=hits,
+        templates=bulk.stats()["templates"],
+    )
+
+
+@app.post("/redact/ndjson")
+async def redact_ndjson(
+    request: Request, model_path: Optional[str] = None, adapter: Optional[str] = None, max_new_tokens: Optional[int] = None
+):
+    """Body: one {"text", "id"?, "max_new_tokens"?} per line; results stream back in input order as they finish."""
+    selected = await run_in_threadpool(_allowed_model_path, model_path)
+    adapter = _adapter_path(adapter)
+    prio = _priority(request, SCHED_BULK_CLASS)
+    token = request_token(request)
+    model_name = os.path.basename(selected)
+
+    def handle(rec: dict) -> dict:
+        max_new = rec.get("max_new_tokens") or max_new_tokens or 256
+        try:
+            with _use_model(selected) as slot:
+                raw, usage = _generate(slot, prio, rec["text"], max_new, token, adapter)
+        except GenerationCancelled:
+            raise cancelled_error(token)
+        norm = normalize_entities(raw, system=SYSTEM, user_text=rec["text"])
+        return {
+            "normalized": norm,
+            "tag_count": norm.count("["),
+            "entities": align_entities(rec["text"], norm),
+            "completion_tokens": usage.get("completion_tokens"),
+            "model_name": model_name,
+            "adapter": _adapter_name(adapter),
+            "adapter_switch_ms": usage["adapter_switch_ms"],
+        }
+
+    return DuplexStreamingResponse(
+        ndjson_pipeline(
+            request.stream(),
+            handle,
+            window=NDJSON_WINDOW,
+            concurrency=NDJSON_CONCURRENCY,
+            max_line_bytes=NDJSON_MAX_LINE_BYTES,
+            on_abort=lambda: token.cancel("disconnect"),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.post("/redact/stream")
+def redact_stream(x: RedactIn, request: Request):
+    selected = _selected_model_path(x)
+    adapter = _adapter_path(x.adapter)
+    cls, client = _priority(request, list(SCHED_WEIGHTS)[0])
+    token = request_token(request)
+    max_new = x.max_new_tokens or 256
+    comp = _compacted(x)
+    text = comp.text if comp else x.text
+    usage: dict = {}
+    saved = None
+
+    # Spans here are started/ended explicitly (not made current): the generator resumes in a new context per chunk.
+    parent = current_span()
+    gen = None
+
+    def finish(raw: str, stats: dict) -> dict:
+        gen.set(**{"gen.completion_tokens": stats["completion_tokens"], "gen.ttft_ms": stats["ttft_ms"]})
+        gen.end()
+        post = start_span("normalize_entities", parent=parent)
+        norm = normalize_entities(raw, system=SYSTEM, user_text=text)
+        norm, entities, projected = _project(comp, norm, align_entities(text, norm))
+        post.end()
+        return RedactOut(
+            normalized=norm,
+            tag_count=norm.count("["),
+            entities=entities,
+            model_name=os.path.basename(selected),
+            model_path=selected,
+            adapter=_adapter_name(adapter),
+            adapter_switch_ms=usage.get("adapter_switch_ms"),
+            max_new_tokens=max_new,
+            prompt_tokens_saved=saved,
+            projected=projected,
+            # Tokens, not pieces: a character split across tokens arrives as one piece.
+            **{**stats, "completion_tokens": usage.get("completion_tokens", stats["completion_tokens"])},
+        ).model_dump()
+
+    def events():
+        nonlocal gen, saved
+        t0 = time.perf_counter()
+        acquire = start_span("model.acquire", parent=parent, **{"model.path": selected})
+        try:
+            # The model stays pinned for the whole stream. Turns and the infer lock follow the class's hold
+            # cap like any generation (see _generation); all are released when the generator ends or is closed.
+            with _use_model(selected) as slot:
+                acquire.end()
+                saved = _tokens_saved(slot, comp)
+                gen = start_span("llama.stream", parent=parent, **{"gen.max_new_tokens": max_new})
+                try:
+                    pieces = _generation(slot, (cls, client), text, max_new, token, adapter, usage, parent=parent)
+                    yield from stream_events(cancellable_pieces(pieces, token), t0, finish)
+                finally:
+                    gen.end()
+        except HTTPException as e:
+            acquire.fail(str(e.detail))
+            yield ndjson({"event": "error", "detail": e.detail})
+        except GenerationCancelled:
+            yield ndjson({"event": "error", "detail": cancelled_error(token).detail})
+        finally:
+            acquire.end()
+
+    return CancellableStreamingResponse(events(), token, media_type="application/x-ndjson")
@@ -0,0 +1,346 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+log = logging.getLogger(__name__)
+
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+STATE_UNLOADED = "unloaded"
+# Replaced by a newer version of the same file; closed once its last request finishes.
+STATE_DRAINING = "draining"
+
+
+class ModelBudgetError(RuntimeError):
+    pass
+
+
+class ModelLoadError(RuntimeError):
+    pass
+
+
+def system_memory_bytes() -> int:
+    """Container memory limit if one is set (cgroup v2/v1), else physical RAM."""
+    for p in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            raw = Path(p).read_text().strip()
+        except OSError:
+            continue
+        if raw.isdigit() and int(raw) < (1 << 60):
+            return int(raw)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def file_stamp(path: str) -> Optional[tuple[int, int, int]]:
+    """(inode, size, mtime_ns): changes when the file is replaced or rewritten."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class ModelSlot:
+    def __init__(self, path: str, est_bytes: int, version: int = 1):
+        self.path = path
+        self.est_bytes = est_bytes
+        self.version = version
+        # File identity when loading started; reload() compares against it.
+        self.stamp: Optional[tuple[int, int, int]] = None
+        self.warmup_ms: Optional[float] = None
+        self.model: Any = None
+        self.state = STATE_LOADING
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.last_used: Optional[float] = None
+        self.in_use = 0
+        self.requests = 0
+        # llama.cpp python bindings are not safe for concurrent generation on the same model instance.
+        self.infer_lock = threading.Lock()
+        self.ready = threading.Event()
+        # Held by whoever runs this version's warm-up, so concurrent callers don't warm it twice.
+        self.warm_lock = threading.Lock()
+
+    def info(self) -> dict:
+        return {
+            "state": self.state,
+            "version": self.version,
+            "est_bytes": self.est_bytes,
+            "load_ms": self.load_ms,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "in_use": self.in_use,
+            "requests": self.requests,
+            "warmup_ms": self.warmup_ms,
+            "error": self.error,
+        }
+
+
+class ModelManager:
+    """Loads models on demand under a RAM budget, evicting least-recently-used idle models.
+
+    `loader(path)` builds a model, `estimator(path)` predicts its resident size in bytes
+    and `closer(model)` releases it. A slot is "in use" from `use()` entry until exit,
+    which covers time spent waiting on its infer lock, so queued requests pin the model.
+    `reload(path)` loads a new version next to the current one and swaps it in once warm.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Any],
+        estimator: Callable[[str], int],
+        budget_bytes: int,
+        closer: Optional[Callable[[Any], None]] = None,
+    ):
+        self._loader = loader
+        self._estimator = estimator
+        self._closer = closer
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[str, ModelSlot]" = OrderedDict()
+        # Versions being loaded/warmed by reload(), and replaced versions still serving requests.
+        self._staging: dict[str, ModelSlot] = {}
+        self._draining: list[ModelSlot] = []
+        # path -> (file_stamp, estimated bytes)
+        self._estimates: dict[str, tuple] = {}
+        self.evictions = 0
+        self.reloads = 0
+
+    def _estimate(self, path: str) -> int:
+        # Reads the GGUF header, so call it without self._lock; cached per file version.
+        stamp = file_stamp(path)
+        cached = self._estimates.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        est = self._estimator(path)
+        self._estimates[path] = (stamp, est)
+        return est
+
+    def _used(self) -> int:
+        # Caller holds self._lock.
+        slots = [*self._slots.values(), *self._staging.values(), *self._draining]
+        return sum(s.est_bytes for s in slots if s.state != STATE_FAILED)
+
+    def used_bytes(self) -> int:
+        with self._lock:
+            return self._used()
+
+    def _evict_for(self, need: int, evict: bool = True, keep: Optional[str] = None) -> list[ModelSlot]:
+        # Caller holds self._lock. Oldest entries first: _slots is kept in LRU order.
+        used = self._used()
+        if self.budget_bytes <= 0 or used + need <= self.budget_bytes:
+            return []
+        if not evict:
+            raise ModelBudgetError(f"Model needs ~{need >> 20} MiB; budget is full and eviction is disabled.")
+        victims = []
+        for path, slot in list(self._slots.items()):
+            if used + need <= self.budget_bytes:
+                break
+            # Models being reloaded keep serving until their new version is swapped in.
+            if slot.state == STATE_READY and slot.in_use == 0 and path != keep and path not in self._staging:
+                victims.append(self._slots.pop(path))
+                used -= slot.est_bytes
+        if used + need > self.budget_bytes:
+            # Not enough idle models to free; put victims back and refuse.
+            for v in reversed(victims):
+                self._slots[v.path] = v
+                self._slots.move_to_end(v.path, last=False)
+            raise ModelBudgetError(
+                f"Model needs ~{need >> 20} MiB but only {(self.budget_bytes - used) >> 20} MiB "
+                f"of the {self.budget_bytes >> 20} MiB budget can be freed right now."
+            )
+        return victims
+
+    def _close(self, slot: ModelSlot) -> None:
+        model, slot.model, slot.state = slot.model, None, STATE_UNLOADED
+        if self._closer and model is not None:
+            try:
+                self._closer(model)
+            except Exception:
+                log.exception("failed to close model %s", slot.path)
+
+    def _release(self, victims: list[ModelSlot]) -> None:
+        for v in victims:
+            log.info("evicting model %s (~%d MiB)", v.path, v.est_bytes >> 20)
+            self._close(v)
+            self.evictions += 1
+        if victims:
+            gc.collect()
+
+    def _load(self, slot: ModelSlot) -> None:
+        t0 = time.perf_counter()
+        slot.stamp = file_stamp(slot.path)
+        try:
+            slot.model = self._loader(slot.path)
+        except Exception as e:
+            slot.state = STATE_FAILED
+            slot.error = f"{e.__class__.__name__}: {e}"
+            with self._lock:
+                if self._slots.get(slot.path) is slot:
+                    del self._slots[slot.path]
+            log.exception("failed to load model %s", slot.path)
+        else:
+            slot.load_ms = (time.perf_counter() - t0) * 1000.0
+            slot.loaded_at = time.time()
+            slot.state = STATE_READY
+            log.info("loaded model %s in %.0f ms", slot.path, slot.load_ms)
+        finally:
+            slot.ready.set()
+
+    def _checkout(self, path: str, pin: bool, evict: bool = True) -> ModelSlot:
+        victims: list[ModelSlot] = []
+        owner = False
+        est = self._estimate(path)
+        with self._lock:
+            slot = self._slots.get(path)
+            if slot is None:
+                if self.budget_bytes > 0 and est > self.budget_bytes:
+                    raise ModelBudgetError(
+                        f"Model needs ~{est >> 20} MiB, above the {self.budget_bytes >> 20} MiB budget."
+                    )
+                victims = self._evict_for(est, evict=evict)
+                slot = ModelSlot(path, est)
+                self._slots[path] = slot
+                owner = True
+            self._slots.move_to_end(path)
+            if pin:
+                slot.in_use += 1
+        self._release(victims)
+        if owner:
+            self._load(slot)
+        else:
+            slot.ready.wait()
+        if slot.state != STATE_READY:
+            if pin:
+                with self._lock:
+                    slot.in_use -= 1
+            raise ModelLoadError(f"Model failed to load: {slot.error}")
+        return slot
+
+    @contextmanager
+    def use(self, path: str, evict: bool = True) -> Iterator[ModelSlot]:
+        slot = self._checkout(path, pin=True, evict=evict)
+        try:
+            yield slot
+        finally:
+            with self._lock:
+                slot.in_use -= 1
+                slot.requests += 1
+                slot.last_used = time.time()
+                drained = slot.state == STATE_DRAINING and slot.in_use == 0
+                if drained:
+                    self._draining.remove(slot)
+            if drained:
+                self._drain(slot)
+
+    def _drain(self, slot: ModelSlot) -> None:
+        log.info("closing drained model %s v%d", slot.path, slot.version)
+        self._close(slot)
+        gc.collect()
+
+    def changed(self, settle_s: float = 0.0) -> list[str]:
+        """Ready models whose file was replaced or rewritten since loading, and not modified in the last `settle_s`."""
+        with self._lock:
+            slots = [s for p, s in self._slots.items() if s.state == STATE_READY and p not in self._staging]
+        out = []
+        for slot in slots:
+            stamp = file_stamp(slot.path)
+            if stamp is not None and stamp != slot.stamp and time.time() - stamp[2] / 1e9 >= settle_s:
+                out.append(slot.path)
+        return out
+
+    def reload(self, path: str, warmup: Optional[Callable[[Any], None]] = None) -> ModelSlot:
+        """Load a new version of `path`, run `warmup(model)`, then swap it in for new requests.
+
+        The current version keeps serving meanwhile; requests already holding it finish on it, and it is
+        closed when the last one exits. Both versions count against the budget until then. On failure
+        the current version stays in place.
+        """
+        est = self._estimate(path)
+        with self._lock:
+            if path in self._staging:
+                raise ModelLoadError(f"Reload of {path} already in progress.")
+            old = self._slots.get(path)
+            victims = self._evict_for(est, keep=path)
+            new = ModelSlot(path, est, version=old.version + 1 if old else 1)
+            self._staging[path] = new
+        self._release(victims)
+        try:
+            self._load(new)
+            if new.state != STATE_READY:
+                raise ModelLoadError(f"Model failed to load: {new.error}")
+            if warmup is not None:
+                t0 = time.perf_counter()
+                warmup(new.model)
+                new.warmup_ms = (time.perf_counter() - t0) * 1000.0
+        except BaseException:
+            with self._lock:
+                self._staging.pop(path, None)
+            self._close(new)
+            raise
+
+        with self._lock:
+            self._staging.pop(path, None)
+            old = self._slots.get(path)
+            self._slots[path] = new
+            self._slots.move_to_end(path)
+            self.reloads += 1
+            drained = False
+            if old is not None:
+                old.state = STATE_DRAINING
+                drained = old.in_use == 0
+                if not drained:
+                    self._draining.append(old)
+        log.info("swapped in model %s v%d (load %.0f ms, warm-up %.0f ms)", path, new.version, new.load_ms or 0,
+                 new.warmup_ms or 0)
+        if drained:
+            self._drain(old)
+        return new
+
+    def ensure_loaded(self, path: str, evict: bool = True) -> ModelSlot:
+        return self._checkout(path, pin=False, evict=evict)
+
+    def preload(self, paths: list[str]) -> threading.Thread:
+        # Preloading never evicts: it only fills free budget.
+        def _run():
+            for p in paths:
+                try:
+                    self.ensure_loaded(p, evict=False)
+                except Exception as e:
+                    log.warning("preload of %s skipped: %s", p, e)
+
+        t = threading.Thread(target=_run, name="model-preload", daemon=True)
+        t.start()
+        return t
+
+    def loaded(self) -> dict[str, Any]:
+        """path -> model, for every slot that is ready."""
+        with self._lock:
+            return {p: s.model for p, s in self._slots.items() if s.state == STATE_READY and s.model is not None}
+
+    def status(self, paths: list[str]) -> dict:
+        with self._lock:
+            slots = dict(self._slots)
+            staging = dict(self._staging)
+            draining = list(self._draining)
+        out = {}
+        for p in paths:
+            slot = slots.get(p)
+            out[p] = slot.info() if slot else {"state": STATE_UNLOADED}
+            if p in staging:
+                out[p]["next"] = staging[p].info()
+            old = [d.info() for d in draining if d.path == p]
+            if old:
+                out[p]["draining"] = old
+        return out
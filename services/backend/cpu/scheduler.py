@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from pii_masking.eval.leaderboard import percentile
+from pii_masking.infer.cancel import GenerationCancelled
+
+
+class Turn:
+    """One request's exclusive use of a model, granted by FairScheduler.turn()."""
+
+    __slots__ = ("cls", "client", "rank", "start", "seq", "enqueued", "granted", "max_hold_s", "_queue", "_cv")
+
+    def __init__(self, cls: str, client: str, rank: int, start: float, seq: int, max_hold_s: float, queue, cv):
+        self.cls = cls
+        self.client = client
+        self.rank = rank
+        self.start = start
+        self.seq = seq
+        self.enqueued = time.perf_counter()
+        self.granted: Optional[float] = None
+        self.max_hold_s = max_hold_s
+        self._queue = queue
+        self._cv = cv
+
+    def key(self):
+        # Start-time fair queuing; on equal start tags the higher class goes first.
+        return (self.start, self.rank, self.seq)
+
+    def should_yield(self) -> bool:
+        """True once this turn is past its class's hold cap and higher-priority work is waiting."""
+        if not self.max_hold_s or self.granted is None:
+            return False
+        if time.perf_counter() - self.granted < self.max_hold_s:
+            return False
+        with self._cv:
+            return any(w.rank < self.rank for _k, w in self._queue.waiters)
+
+
+class _ModelQueue:
+    def __init__(self):
+        self.holder: Optional[Turn] = None
+        self.waiters: list = []
+        self.vtime = 0.0
+        self.last_finish: dict[tuple[str, str], float] = {}
+
+
+class _ClassStats:
+    def __init__(self, window: int):
+        self.granted = 0
+        self.waiting = 0
+        self.yields = 0
+        self.wait_ms: deque = deque(maxlen=window)
+        self.hold_ms: deque = deque(maxlen=window)
+
+    def info(self) -> dict:
+        waits, holds = list(self.wait_ms), list(self.hold_ms)
+        return {
+            "granted": self.granted,
+            "waiting": self.waiting,
+            "yields": self.yields,
+            "wait_ms_mean": sum(waits) / len(waits) if waits else None,
+            "wait_ms_p50": percentile(waits, 50),
+            "wait_ms_p95": percentile(waits, 95),
+            "wait_ms_p99": percentile(waits, 99),
+            "wait_ms_max": max(waits) if waits else None,
+            "hold_ms_mean": sum(holds) / len(holds) if holds else None,
+            "hold_ms_max": max(holds) if holds else None,
+        }
+
+
+class FairScheduler:
+    """Orders access to each model across priority classes and clients.
+
+    Every (class, client) pair is a flow; flows share a model by start-time fair queuing with
+    the class weight, so a backlogged batch client can't push an interactive request further back
+    than the one generation in progress. `cost` is the work a turn asks for (max_new_tokens).
+    Classes listed first rank higher; `max_hold_s` caps how long a class may keep a model while
+    higher-ranked work waits (callers check Turn.should_yield() and come back for another turn).
+    """
+
+    def __init__(self, weights: dict[str, float], max_hold_s: Optional[dict[str, float]] = None, window: int = 1024):
+        self.weights = dict(weights)
+        self.ranks = {c: i for i, c in enumerate(weights)}
+        self.max_hold_s = dict(max_hold_s or {})
+        self._cv = threading.Condition()
+        self._queues: dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self._stats = {c: _ClassStats(window) for c in weights}
+
+    @contextmanager
+    def turn(
+        self, key: str, cls: str, client: str, cost: float = 1.0, should_stop: Optional[Callable[[], bool]] = None
+    ) -> Iterator[Turn]:
+        """Wait for the model at `key`; raises GenerationCancelled if `should_stop()` turns true while queued."""
+        if cls not in self.weights:
+            raise ValueError(f"Unknown priority class: {cls}")
+        stats = self._stats[cls]
+        with self._cv:
+            q = self._queues.setdefault(key, _ModelQueue())
+            flow = (cls, client)
+            start = max(q.vtime, q.last_finish.get(flow, 0.0))
+            q.last_finish[flow] = start + max(cost, 1.0) / self.weights[cls]
+            t = Turn(cls, client, self.ranks[cls], start, next(self._seq), self.max_hold_s.get(cls, 0.0), q, self._cv)
+            heapq.heappush(q.waiters, (t.key(), t))
+            stats.waiting += 1
+            try:
+                while q.holder is not None or q.waiters[0][1] is not t:
+                    if should_stop is not None and should_stop():
+                        raise GenerationCancelled()
+                    self._cv.wait(0.1 if should_stop is not None else None)
+            except BaseException:
+                q.waiters.remove((t.key(), t))
+                heapq.heapify(q.waiters)
+                stats.waiting -= 1
+                self._cv.notify_all()
+                raise
+            heapq.heappop(q.waiters)
+            q.holder = t
+            q.vtime = t.start
+            if len(q.last_finish) > 10000:
+                # Flows whose tags are behind virtual time start fresh anyway.
+                q.last_finish = {f: v for f, v in q.last_finish.items() if v > q.vtime}
+            t.granted = time.perf_counter()
+            stats.waiting -= 1
+            stats.granted += 1
+            stats.wait_ms.append((t.granted - t.enqueued) * 1000.0)
+        try:
+            yield t
+        finally:
+            with self._cv:
+                q.holder = None
+                stats.hold_ms.append((time.perf_counter() - t.granted) * 1000.0)
+                self._cv.notify_all()
+
+    def record_yield(self, cls: str) -> None:
+        with self._cv:
+            self._stats[cls].yields += 1
+
+    def stats(self) -> dict:
+        with self._cv:
+            return {
+                "classes": {c: dict(s.info(), weight=self.weights[c], max_hold_s=self.max_hold_s.get(c) or None)
+                            for c, s in self._stats.items()},
+                "queues": {k: {"busy": q.holder is not None, "waiting": len(q.waiters)} for k, q in self._queues.items()},
+            }
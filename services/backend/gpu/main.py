@@ -1,9 +1,30 @@
+import hashlib
 import os
-from fastapi import FastAPI
+import threading
+import time
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from pii_masking.infer.bulk import BulkRedactor
+from pii_masking.infer.cancel import GenerationCancelled
 from pii_masking.infer.hf_infer import HFModel
+from pii_masking.infer.pii_gate import PIIGate
+from pii_masking.infer.sentence_memo import SentenceStore, redact_by_sentence
+from pii_masking.utils.align import align_entities
+from pii_masking.utils.compaction import Compacted, compact, project
 from pii_masking.utils.post_processing import normalize_entities
-from services.backend.common.schema import RedactIn, RedactOut
+from services.backend.common.cancel import (
+    CancelToken,
+    cancellable_pieces,
+    cancellations,
+    cancelled_error,
+    request_token,
+    run_cancellable,
+)
+from services.backend.common.profiling import install_profiling, profiled
+from services.backend.common.schema import RedactBulkIn, RedactBulkOut, RedactIn, RedactOut
+from services.backend.common.streaming import CancellableStreamingResponse, DuplexStreamingResponse, ndjson_pipeline, stream_events
+from services.backend.common.tracing import current_span, install_tracing, span, start_span
 
 HF_DIR = os.getenv("HF_DIR")  # e.g. /models/merged_pii_model
 SYSTEM = os.getenv(
@@ -13,6 +34,18 @@ SYSTEM = os.getenv(
     "[EMAIL], [URL], [USERNAME], [IP], [IPV4], [IPV6], [ACCOUNTNUMBER], [OTHERPII]. "
     "Preserve all non-PII text exactly. Output only the redacted text.",
 )
+BULK_MAX_TEXTS = int(os.getenv("BULK_MAX_TEXTS", "1000"))
+# Default for RedactIn.compact (/redact and /redact/stream).
+COMPACT_INPUT = os.getenv("COMPACT_INPUT", "0") == "1"
+PII_GATE_PATH = os.getenv("PII_GATE_PATH")
+PII_GATE_THRESHOLD = float(os.getenv("PII_GATE_THRESHOLD")) if os.getenv("PII_GATE_THRESHOLD") else None
+# /redact/ndjson: records read ahead of the response, records redacted concurrently, longest accepted line.
+NDJSON_WINDOW = int(os.getenv("NDJSON_WINDOW", "32"))
+NDJSON_CONCURRENCY = int(os.getenv("NDJSON_CONCURRENCY", "1"))
+NDJSON_MAX_LINE_BYTES = int(os.getenv("NDJSON_MAX_LINE_BYTES", str(1 << 20)))
+SENTENCE_CACHE_PATH = os.getenv("SENTENCE_CACHE_PATH", ".cache/sentence_cache.sqlite")
+SENTENCE_CACHE_MAX_ROWS = int(os.getenv("SENTENCE_CACHE_MAX_ROWS", "1000000"))
+SENTENCE_BATCH_TOKENS = int(os.getenv("SENTENCE_BATCH_TOKENS", "384"))
 
 app = FastAPI(title="PII Redaction (GPU/HF)")
 app.add_middleware(
@@ -22,22 +55,222 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+install_profiling(app, "gpu-hf")
+install_tracing(app, "pii-backend-gpu")
 
 _model = None
+_bulk = BulkRedactor(
+    confidence=float(os.getenv("BULK_CONFIDENCE", "0.9")),
+    min_observations=int(os.getenv("BULK_MIN_OBSERVATIONS", "2")),
+    sim_threshold=float(os.getenv("BULK_SIM_THRESHOLD", "0.5")),
+    max_templates=int(os.getenv("BULK_MAX_TEMPLATES", "1000")),
+)
+_sentences = None
+_sentences_lock = threading.Lock()
+_gate = None
 
 @app.on_event("startup")
 def _load():
-    global _model
+    global _model, _gate
+    if PII_GATE_PATH:
+        _gate = PIIGate.load(PII_GATE_PATH, PII_GATE_THRESHOLD)
     assert HF_DIR and os.path.isdir(HF_DIR), f"Missing HF_DIR: {HF_DIR}"
     _model = HFModel(HF_DIR)
 
 @app.get("/")
 def root():
-    return {"backend": "gpu-hf", "model_dir": HF_DIR}
+    return {"backend": "gpu-hf", "model_dir": HF_DIR, "cancellations": cancellations()}
+
+@app.get("/healthz/live")
+def healthz_live():
+    return {"status": "ok"}
+
+@app.get("/healthz/ready")
+def healthz_ready():
+    if _model is None:
+        raise HTTPException(status_code=503, detail="Model is still loading.")
+    return {"status": "ready", "model_dir": HF_DIR}
+
+def _sentence_store() -> SentenceStore:
+    global _sentences
+    with _sentences_lock:
+        if _sentences is None:
+            _sentences = SentenceStore(SENTENCE_CACHE_PATH, max_rows=SENTENCE_CACHE_MAX_ROWS)
+        return _sentences
+
+
+def _redact_sentences(text: str, token: CancelToken) -> tuple[str, dict]:
+    namespace = f"{os.path.abspath(HF_DIR)}:{hashlib.sha1(SYSTEM.encode()).hexdigest()}"
+    return redact_by_sentence(
+        text,
+        lambda chunk, max_new: _model.generate(SYSTEM, chunk, max_new_tokens=max_new, should_stop=token),
+        _sentence_store(),
+        namespace,
+        normalize=lambda line, sentence: normalize_entities(line, system=SYSTEM, user_text=sentence),
+        gate=_gate.flags if _gate is not None else None,
+        count_tokens=_model.count_tokens,
+        batch_tokens=SENTENCE_BATCH_TOKENS,
+    )
+
+
+def _no_adapter(adapter: Optional[str]) -> None:
+    # The merged HF model is served as is; runtime LoRA adapters are a CPU backend feature.
+    if adapter:
+        raise HTTPException(status_code=400, detail="LoRA adapters are only supported by the CPU backend.")
+
+
+def _compacted(x: RedactIn) -> Optional[Compacted]:
+    return compact(x.text) if (COMPACT_INPUT if x.compact is None else x.compact) else None
+
+
+def _project(comp: Optional[Compacted], norm: str, entities: list[dict]) -> tuple[str, list[dict], Optional[bool]]:
+    if comp is None:
+        return norm, entities, None
+    out = project(comp, norm)
+    return (*out, True) if out is not None else (norm, entities, False)
+
 
 @app.post("/redact", response_model=RedactOut)
-def redact(x: RedactIn):
+async def redact(x: RedactIn, request: Request):
+    token = request_token(request)
+    return await run_cancellable(request, token, _redact, x, token)
+
+
+@profiled
+def _redact(x: RedactIn, token: CancelToken) -> RedactOut:
+    if x.mode not in (None, "sentences"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {x.mode}")
+    _no_adapter(x.adapter)
     max_new = x.max_new_tokens or 256
-    raw = _model.generate(SYSTEM, x.text, max_new_tokens=max_new)
-    norm = normalize_entities(raw, system=SYSTEM, user_text=x.text)
-    return RedactOut(normalized=norm)
+    comp = _compacted(x)
+    text = comp.text if comp else x.text
+    saved = _model.count_tokens(x.text) - _model.count_tokens(text) if comp else None
+    if x.mode == "sentences":
+        with span("hf.sentences") as sp:
+            norm, sent = _redact_sentences(text, token)
+            sp.set(**{f"sentences.{k}": v for k, v in sent.items()})
+        with span("align_entities"):
+            norm, entities, projected = _project(comp, norm, align_entities(text, norm))
+        return RedactOut(
+            normalized=norm,
+            tag_count=norm.count("["),
+            entities=entities,
+            sentences=sent["sentences"],
+            gated_sentences=sent["gated_sentences"],
+            cached_sentences=sent["cached_sentences"],
+            reuse_ratio=sent["reuse_ratio"],
+            prompt_tokens_saved=saved,
+            projected=projected,
+        )
+    with span("hf.generate", **{"gen.max_new_tokens": max_new}) as sp:
+        raw, usage = _model.complete(SYSTEM, text, max_new_tokens=max_new, should_stop=token)
+        sp.set(**{"gen.prompt_tokens": usage["prompt_tokens"], "gen.completion_tokens": usage["completion_tokens"]})
+    with span("normalize_entities"):
+        norm = normalize_entities(raw, system=SYSTEM, user_text=text)
+    with span("align_entities"):
+        norm, entities, projected = _project(comp, norm, align_entities(text, norm))
+    return RedactOut(
+        normalized=norm, tag_count=norm.count("["), entities=entities, prompt_tokens_saved=saved, projected=projected
+    )
+
+@app.post("/redact/bulk", response_model=RedactBulkOut)
+async def redact_bulk(x: RedactBulkIn, request: Request):
+    token = request_token(request)
+    return await run_cancellable(request, token, _redact_bulk, x, token)
+
+
+def _redact_bulk(x: RedactBulkIn, token: CancelToken) -> RedactBulkOut:
+    if len(x.texts) > BULK_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_TEXTS} texts per request.")
+    _no_adapter(x.adapter)
+    max_new = x.max_new_tokens or 256
+    t0 = time.perf_counter()
+
+    def llm(text: str) -> str:
+        raw = _model.generate(SYSTEM, text, max_new_tokens=max_new, should_stop=token)
+        return normalize_entities(raw, system=SYSTEM, user_text=text)
+
+    with span("bulk.redact_many", **{"bulk.texts": len(x.texts)}) as sp:
+        results = _bulk.redact_many(x.texts, llm)
+        hits = sum(1 for r in results if r["source"] == "template")
+        sp.set(**{"bulk.template_hits": hits})
+    model_name = os.path.basename(HF_DIR or "")
+    return RedactBulkOut(
+        results=[RedactOut(tag_count=r["normalized"].count("["), model_name=model_name, max_new_tokens=max_new, **r) for r in results],
+        latency_ms=(time.perf_counter() - t0) * 1000.0,
+        llm_calls=len(results) - hits,
+        template_hits=hits,
+        templates=_bulk.stats()["templates"],
+    )
+
+@app.post("/redact/ndjson")
+async def redact_ndjson(request: Request, adapter: Optional[str] = None, max_new_tokens: Optional[int] = None):
+    """Body: one {"text", "id"?, "max_new_tokens"?} per line; results stream back in input order as they finish."""
+    _no_adapter(adapter)
+    token = request_token(request)
+
+    def handle(rec: dict) -> dict:
+        max_new = rec.get("max_new_tokens") or max_new_tokens or 256
+        try:
+            raw, usage = _model.complete(SYSTEM, rec["text"], max_new_tokens=max_new, should_stop=token)
+        except GenerationCancelled:
+            raise cancelled_error(token)
+        norm = normalize_entities(raw, system=SYSTEM, user_text=rec["text"])
+        return {
+            "normalized": norm,
+            "tag_count": norm.count("["),
+            "entities": align_entities(rec["text"], norm),
+            "completion_tokens": usage["completion_tokens"],
+        }
+
+    return DuplexStreamingResponse(
+        ndjson_pipeline(
+            request.stream(),
+            handle,
+            window=NDJSON_WINDOW,
+            concurrency=NDJSON_CONCURRENCY,
+            max_line_bytes=NDJSON_MAX_LINE_BYTES,
+            on_abort=lambda: token.cancel("disconnect"),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.post("/redact/stream")
+def redact_stream(x: RedactIn, request: Request):
+    _no_adapter(x.adapter)
+    max_new = x.max_new_tokens or 256
+    token = request_token(request)
+    comp = _compacted(x)
+    text = comp.text if comp else x.text
+
+    parent = current_span()
+    gen = start_span("hf.stream", parent=parent, **{"gen.max_new_tokens": max_new})
+
+    def finish(raw: str, stats: dict) -> dict:
+        gen.set(**{"gen.completion_tokens": stats["completion_tokens"], "gen.ttft_ms": stats["ttft_ms"]})
+        gen.end()
+        post = start_span("normalize_entities", parent=parent)
+        norm = normalize_entities(raw, system=SYSTEM, user_text=text)
+        norm, entities, projected = _project(comp, norm, align_entities(text, norm))
+        post.end()
+        return RedactOut(
+            normalized=norm,
+            tag_count=norm.count("["),
+            entities=entities,
+            model_name=os.path.basename(HF_DIR or ""),
+            max_new_tokens=max_new,
+            prompt_tokens_saved=_model.count_tokens(x.text) - _model.count_tokens(text) if comp else None,
+            projected=projected,
+            **stats,
+        ).model_dump()
+
+    def events():
+        try:
+            yield from stream_events(pieces, t0, finish)
+        finally:
+            gen.end()
+
+    t0 = time.perf_counter()
+    pieces = cancellable_pieces(_model.stream(SYSTEM, text, max_new_tokens=max_new, should_stop=token), token)
+    return CancellableStreamingResponse(events(), token, media_type="application/x-ndjson")
@@ -1,8 +1,10 @@
 import concurrent.futures
 import json
 import os
+import queue
+import re
 import time
-from difflib import SequenceMatcher
+from collections import Counter
 
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse, RedirectResponse, Response
@@ -10,23 +12,54 @@ import gradio as gr
 import requests
 import uvicorn
 
+from services.backend.common.tracing import configure as configure_tracing, inject, span, start_span
+
 CPU_API = os.getenv("CPU_API_URL", "http://localhost:7860")
 GPU_API = os.getenv("GPU_API_URL", "http://localhost:7862")
 TITLE = "PII Redaction Model Arena"
 DEFAULT_MAX_NEW_TOKENS = int(os.getenv("PII_MAX_NEW_TOKENS", "256"))
 FRONTEND_BUILD_ID = "frontend-2026-03-12-v2"
 DATASET_URL = "https://huggingface.co/datasets/ai4privacy/pii-masking-200k"
+ARENA_UI_INTERVAL_S = float(os.getenv("ARENA_UI_INTERVAL_S", "0.05"))
+WORD_RE = re.compile(r"\S+")
 
+configure_tracing("pii-frontend")
 
-def _call(api_url, text, model_path=None):
-    t0 = time.perf_counter()
+# Shared across messages; each arena message uses two workers (one stream per model).
+_arena_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("ARENA_MAX_WORKERS", "16")),
+    thread_name_prefix="arena",
+)
+
+
+def _stream_call(api_url, text, model_path, key, events: queue.Queue, parent=None):
     payload = {"text": text, "max_new_tokens": DEFAULT_MAX_NEW_TOKENS}
     if model_path:
         payload["model_path"] = model_path
-    r = requests.post(f"{api_url}/redact", json=payload, timeout=120)
-    latency_ms = (time.perf_counter() - t0) * 1000.0
-    r.raise_for_status()
-    return r.json().get("normalized", ""), latency_ms
+    with span("_call", parent=parent, kind="client", **{"http.url": f"{api_url}/redact/stream", "arena.slot": key}) as sp:
+        t_start = time.perf_counter()
+        # The deadline lets the backend stop decoding (and free the model) once this call would have timed out.
+        headers = inject({"X-Request-Deadline": f"{time.time() + 120:.3f}"})
+        with requests.post(f"{api_url}/redact/stream", json=payload, stream=True, timeout=120, headers=headers) as r:
+            r.raise_for_status()
+            n_tokens = 0
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                t_event = time.perf_counter()
+                event = json.loads(line)
+                events.put((key, event, t_event))
+                kind = event.get("event")
+                if kind == "token":
+                    n_tokens += 1
+                    if n_tokens == 1:
+                        sp.set(**{"gen.ttft_ms": (t_event - t_start) * 1000.0})
+                elif kind in {"done", "error"}:
+                    sp.set(**{"gen.completion_tokens": n_tokens, "arena.final_event": kind})
+                    if kind == "error":
+                        sp.fail(str(event.get("detail")))
+                    return
+    raise RuntimeError("stream ended without a final event")
 
 
 def _gpu_available():
@@ -108,30 +141,91 @@ def refresh_model_choices():
     )
 
 
-def _run_selected_model(selection: str, user_text: str):
+def _stream_selected_model(selection: str, user_text: str, key: str, events: queue.Queue, parent=None):
     if "::" not in selection:
         raise ValueError("Invalid model selection format.")
     _, value = selection.split("::", 1)
-    if value == "GPU_DEFAULT":
-        return _call(GPU_API, user_text, model_path=None)
-    return _call(CPU_API, user_text, model_path=value)
+    try:
+        if value == "GPU_DEFAULT":
+            _stream_call(GPU_API, user_text, None, key, events, parent=parent)
+        else:
+            _stream_call(CPU_API, user_text, value, key, events, parent=parent)
+    except Exception as e:
+        events.put((key, {"event": "error", "detail": f"{e.__class__.__name__}: {e}"}, time.perf_counter()))
 
 
 def _tag_count(text: str) -> int:
     return text.count("[")
 
 
-def _arena_metrics(out1, out2, ms1, ms2, err):
+def _similarity(a: str, b: str) -> float:
+    """Linear-time stand-in for SequenceMatcher.ratio().
+
+    Common prefix/suffix count as matched characters; the differing middles are
+    compared as word multisets, so reordered or re-tagged spans still score.
+    """
+    if not a and not b:
+        return 1.0
+    n = min(len(a), len(b))
+    pre = 0
+    while pre < n and a[pre] == b[pre]:
+        pre += 1
+    suf = 0
+    while suf < n - pre and a[-1 - suf] == b[-1 - suf]:
+        suf += 1
+    mid_a = Counter(WORD_RE.findall(a[pre:len(a) - suf]))
+    mid_b = Counter(WORD_RE.findall(b[pre:len(b) - suf]))
+    mid = sum(len(w) * c for w, c in (mid_a & mid_b).items())
+    return 2.0 * (pre + suf + mid) / (len(a) + len(b))
+
+
+def _span_agreement(ents1, ents2) -> float:
+    """Jaccard overlap of (tag, start, end) spans returned by the backends' aligner."""
+    a = {(e["tag"], e["start"], e["end"]) for e in ents1 or []}
+    b = {(e["tag"], e["start"], e["end"]) for e in ents2 or []}
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _new_live():
+    return {"text": "", "t_first": None, "t_last": None, "tokens": 0, "final": None}
+
+
+def _live_line(label: str, live: dict, t0: float) -> str:
+    final = live["final"]
+    if final:
+        ttft = final.get("ttft_ms") or 0.0
+        tps = final.get("tokens_per_s") or 0.0
+        latency = final.get("latency_ms") or 0.0
+        return (
+            f"- {label}: TTFT `{ttft:.1f} ms`, `{tps:.1f} tok/s`, "
+            f"latency `{latency:.1f} ms`, tokens `{final.get('completion_tokens') or 0}`"
+        )
+    if live["t_first"] is None:
+        return f"- {label}: waiting for first token (`{(time.perf_counter() - t0) * 1000.0:.0f} ms`)"
+    ttft = (live["t_first"] - t0) * 1000.0
+    elapsed = live["t_last"] - live["t_first"]
+    tps = (live["tokens"] - 1) / elapsed if live["tokens"] > 1 and elapsed > 0 else 0.0
+    return f"- {label}: TTFT `{ttft:.1f} ms`, `{tps:.1f} tok/s` (streaming, `{live['tokens']}` tokens)"
+
+
+def _arena_metrics(live1, live2, t0, err):
+    out1 = (live1["final"] or {}).get("normalized")
+    out2 = (live2["final"] or {}).get("normalized")
     exact = "PENDING"
-    sim = 0.0
-    if out1 and out2:
+    sim = "PENDING"
+    spans = "PENDING"
+    if out1 is not None and out2 is not None:
         exact = "MATCH" if out1 == out2 else "DIFF"
-        sim = SequenceMatcher(None, out1, out2).ratio()
+        sim = f"{_similarity(out1, out2):.4f}"
+        spans = f"{_span_agreement(live1['final'].get('entities'), live2['final'].get('entities')):.4f}"
     metrics = (
         f"- Exact output match: `{exact}`\n"
-        f"- Similarity: `{sim:.4f}`\n"
-        f"- Model 1 latency: `{ms1:.1f} ms`\n"
-        f"- Model 2 latency: `{ms2:.1f} ms`\n"
+        f"- Similarity: `{sim}`\n"
+        f"- Entity span agreement: `{spans}`\n"
+        f"{_live_line('Model 1', live1, t0)}\n"
+        f"{_live_line('Model 2', live2, t0)}\n"
         f"- Model 1 tags: `{_tag_count(out1) if out1 else 0}`\n"
         f"- Model 2 tags: `{_tag_count(out2) if out2 else 0}`"
     )
@@ -151,54 +245,81 @@ def arena_send(user_text, model1, model2, model1_hist, model2_hist):
     model2_hist = (model2_hist or []) + [{"role": "user", "content": user_text}]
 
     err = None
-    out1 = out2 = ""
-    ms1 = ms2 = 0.0
+    live = {"m1": _new_live(), "m2": _new_live()}
+    model1_hist = model1_hist + [{"role": "assistant", "content": ""}]
+    model2_hist = model2_hist + [{"role": "assistant", "content": ""}]
 
-    yield "", model1_hist, model2_hist, "Running both models asynchronously..."
+    yield "", model1_hist, model2_hist, "Streaming from both models..."
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as ex:
-        pending = {
-            ex.submit(_run_selected_model, model1, user_text): "m1",
-            ex.submit(_run_selected_model, model2, user_text): "m2",
-        }
-        while pending:
-            done, _ = concurrent.futures.wait(
-                pending.keys(),
-                return_when=concurrent.futures.FIRST_COMPLETED,
-            )
-            for fut in done:
-                key = pending.pop(fut)
-                try:
-                    out, ms = fut.result()
-                except Exception as e:
-                    msg = f"{'Model 1' if key == 'm1' else 'Model 2'} failed: {e.__class__.__name__}: {e}"
-                    err = f"{err} | {msg}" if err else msg
-                    out = f"[ERROR] {msg}"
-                    ms = 0.0
-
-                if key == "m1":
-                    out1, ms1 = out, ms
-                    model1_hist = model1_hist + [{"role": "assistant", "content": out1}]
-                else:
-                    out2, ms2 = out, ms
-                    model2_hist = model2_hist + [{"role": "assistant", "content": out2}]
-
-                yield (
-                    "",
-                    model1_hist,
-                    model2_hist,
-                    _arena_metrics(out1, out2, ms1, ms2, err),
-                )
+    events: queue.Queue = queue.Queue()
+    t0 = time.perf_counter()
+    # Root of this message's trace; not made current because Gradio resumes this generator in other contexts.
+    root = start_span("arena_send", **{"arena.model1": model1, "arena.model2": model2, "input.chars": len(user_text)})
+    _arena_pool.submit(_stream_selected_model, model1, user_text, "m1", events, root)
+    _arena_pool.submit(_stream_selected_model, model2, user_text, "m2", events, root)
+
+    pending = {"m1", "m2"}
+    last_ui = 0.0
+    while pending:
+        try:
+            key, event, t_event = events.get(timeout=ARENA_UI_INTERVAL_S)
+        except queue.Empty:
+            key = None
+        if key is not None:
+            state = live[key]
+            kind = event.get("event")
+            if kind == "token":
+                if state["t_first"] is None:
+                    state["t_first"] = t_event
+                state["t_last"] = t_event
+                state["tokens"] += 1
+                state["text"] += event.get("text", "")
+            elif kind == "done":
+                state["final"] = event
+                state["text"] = event.get("normalized", state["text"])
+                pending.discard(key)
+            else:
+                msg = f"{'Model 1' if key == 'm1' else 'Model 2'} failed: {event.get('detail')}"
+                err = f"{err} | {msg}" if err else msg
+                state["text"] = f"[ERROR] {msg}"
+                pending.discard(key)
+
+            model1_hist[-1] = {"role": "assistant", "content": live["m1"]["text"]}
+            model2_hist[-1] = {"role": "assistant", "content": live["m2"]["text"]}
+
+        now = time.perf_counter()
+        if pending and now - last_ui < ARENA_UI_INTERVAL_S:
+            continue
+        last_ui = now
+        if not pending:
+            if err:
+                root.fail(err)
+            root.end()
+        yield "", model1_hist, model2_hist, _arena_metrics(live["m1"], live["m2"], t0, err)
 
 
 def arena_clear():
     return [], [], "Cleared."
 
 
+# url -> (etag, payload); lets page loads revalidate with If-None-Match instead of re-downloading.
+_api_etags: dict[str, tuple[str, dict]] = {}
+
+
 def _api_json(url: str):
-    r = requests.get(url, timeout=20)
+    headers = {}
+    cached = _api_etags.get(url)
+    if cached:
+        headers["If-None-Match"] = cached[0]
+    r = requests.get(url, timeout=20, headers=headers)
+    if r.status_code == 304 and cached:
+        return cached[1]
     r.raise_for_status()
-    return r.json()
+    payload = r.json()
+    etag = r.headers.get("ETag")
+    if etag:
+        _api_etags[url] = (etag, payload)
+    return payload
 
 
 def _leaderboard_status(dataset, row_count: int) -> str:
@@ -212,7 +333,7 @@ def _leaderboard_status(dataset, row_count: int) -> str:
 
 def load_leaderboard():
     try:
-        payload = _api_json(f"{CPU_API}/eval/leaderboard")
+        payload = _api_json(f"{CPU_API}/eval/overview")
     except Exception as e:
         return [], "[]", f"Failed to load leaderboard. Dataset: [ai4privacy/pii-masking-200k]({DATASET_URL})", [], "Failed to load leaderboard"
 
@@ -238,7 +359,9 @@ def load_leaderboard():
         row = rows[0]
         run_name = row.get("run_name")
         try:
-            summary = _summary_for_run(run_name)
+            summary = payload.get("summary")
+            if summary is None:
+                raise RuntimeError(payload.get("summary_error") or "summary unavailable")
             per_tag = _per_tag_rows(summary, row)
             details = _detail_markdown(run_name, row, summary)
         except Exception as e:
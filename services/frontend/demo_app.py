@@ -57,6 +57,7 @@ def redact_text(user_text: str):
             f"{CPU_API}/redact",
             json={"text": user_text, "max_new_tokens": DEFAULT_MAX_NEW_TOKENS},
             timeout=REQUEST_TIMEOUT,
+            headers={"X-Request-Deadline": f"{time.time() + REQUEST_TIMEOUT:.3f}"},
         )
         response.raise_for_status()
         payload = response.json()
@@ -0,0 +1,128 @@
+"""Routing, retry and ejection check for the gateway against stub replicas.
+
+Starts four stub_backend replicas (plus one URL nobody listens on) and drives the gateway in-process:
+
+- /redact, /redact/bulk and /redact/stream go to the replica that has the requested model loaded,
+  also when the caller's model_path only matches by file name
+- a replica answering 503 is retried on another one, and ejected after GATEWAY_MAX_FAILURES failures
+- a replica that can't be polled is ejected
+- /eval/* asks replicas for identity encoding unless the client sent its own Accept-Encoding
+
+    PYTHONPATH=src:. python -m services.gateway.check_gateway
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+STUBS = {
+    "A": {"STUB_MODELS": "/m/a.gguf,/m/b.gguf", "STUB_LOADED": "/m/a.gguf"},
+    "B": {"STUB_MODELS": "/m/a.gguf,/m/b.gguf", "STUB_LOADED": "/m/b.gguf"},
+    # C has /m/c loaded (so it's preferred) but answers 503 to every request; D can serve it cold.
+    "C": {"STUB_MODELS": "/m/c.gguf", "STUB_LOADED": "/m/c.gguf", "STUB_FAIL_RATE": "1"},
+    "D": {"STUB_MODELS": "/m/c.gguf", "STUB_LOADED": ""},
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_stub(name: str, env: dict, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "services.gateway.stub_backend:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "STUB_NAME": name, "STUB_DELAY_MS": "10", **env},
+    )
+
+
+def _wait_up(url: str, timeout_s: float = 20.0) -> None:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"❌ stub replica at {url} did not start")
+
+
+def main():
+    urls = {name: f"http://127.0.0.1:{_free_port()}" for name in STUBS}
+    dead = f"http://127.0.0.1:{_free_port()}"
+    procs = [_start_stub(name, env, int(urls[name].rsplit(":", 1)[1])) for name, env in STUBS.items()]
+    try:
+        for url in urls.values():
+            _wait_up(url)
+        # Config is read at import time; polling is driven by hand below.
+        os.environ.update({
+            "BACKEND_URLS": ",".join([*urls.values(), dead]),
+            "GATEWAY_POLL_INTERVAL_S": "3600",
+            "GATEWAY_POLL_TIMEOUT_S": "0.5",
+            "GATEWAY_MAX_FAILURES": "2",
+            "GATEWAY_EJECT_S": "60",
+        })
+        from fastapi.testclient import TestClient
+        from services.gateway import main as gw
+
+        failures = []
+
+        def check(label: str, ok: bool, detail=""):
+            print(f"{'ok  ' if ok else 'FAIL'} {label}" + (f": {detail}" if not ok and detail else ""))
+            if not ok:
+                failures.append(label)
+
+        with TestClient(gw.app) as client:
+            gw.poll_once()
+            replica_of = {url: name for name, url in urls.items()}
+
+            def routed(resp) -> str:
+                return replica_of.get(resp.headers.get("x-gateway-replica"), resp.headers.get("x-gateway-replica"))
+
+            r = client.post("/redact", json={"text": "hi Ann", "model_path": "/m/a.gguf"})
+            check("/redact -> replica with the model loaded", r.status_code == 200 and routed(r) == "A", (r.status_code, routed(r)))
+            r = client.post("/redact", json={"text": "hi Ann", "model_path": "/elsewhere/b.gguf"})
+            check("/redact matches model by file name", r.status_code == 200 and routed(r) == "B", (r.status_code, routed(r)))
+            r = client.post("/redact/bulk", json={"texts": ["a", "b"], "model_path": "/m/b.gguf"})
+            ok = r.status_code == 200 and routed(r) == "B" and len(r.json()["results"]) == 2
+            check("/redact/bulk is proxied", ok, (r.status_code, routed(r)))
+            r = client.post("/redact/stream", json={"text": "hi Ann Lee", "model_path": "/m/a.gguf"})
+            last = json.loads(r.text.strip().splitlines()[-1]) if r.status_code == 200 else {}
+            check("/redact/stream is proxied", routed(r) == "A" and last.get("event") == "done", (r.status_code, last))
+            r = client.post("/redact", json={"text": "x", "model_path": "/m/zzz.gguf"})
+            check("unknown model -> 503", r.status_code == 503, r.status_code)
+
+            for attempt in (1, 2):
+                r = client.post("/redact", json={"text": "x", "model_path": "/m/c.gguf"})
+                check(f"503 retried on another replica (#{attempt})", r.status_code == 200 and routed(r) == "D", (r.status_code, routed(r)))
+            status = {replica_of.get(s["url"], "dead"): s for s in client.get("/gateway/status").json()["replicas"]}
+            check("failing replica ejected", not status["C"]["healthy"] and status["C"]["ejected_for_s"] > 0, status["C"])
+            gw.poll_once()
+            status = {replica_of.get(s["url"], "dead"): s for s in client.get("/gateway/status").json()["replicas"]}
+            check("ejection outlasts a successful poll", not status["C"]["healthy"], status["C"])
+            check("unreachable replica ejected", status["dead"]["failures"] >= 2 and status["dead"]["ejected_for_s"] > 0, status["dead"])
+            check("healthy replicas stay in", all(status[n]["healthy"] for n in "ABD"), status)
+
+            del client.headers["accept-encoding"]
+            r = client.get("/eval/leaderboard")
+            check("/eval asks for identity by default", r.json().get("accept_encoding") == "identity", r.text)
+            r = client.get("/eval/leaderboard", headers={"Accept-Encoding": "gzip"})
+            check("/eval forwards the client's Accept-Encoding", r.json().get("accept_encoding") == "gzip", r.text)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+    if failures:
+        raise SystemExit(f"❌ {len(failures)} gateway checks failed")
+    print("✅ gateway routing, retry and ejection behave as expected")
+
+
+if __name__ == "__main__":
+    main()
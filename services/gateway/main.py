@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+
+import requests
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+
+from services.backend.common.schema import RedactBulkIn, RedactIn
+from services.backend.common.tracing import inject, install_tracing, start_span
+from services.gateway.pool import ReplicaPool
+
+BACKEND_URLS = [u.strip() for u in os.getenv("BACKEND_URLS", "http://localhost:7860").split(",") if u.strip()]
+POLL_INTERVAL_S = float(os.getenv("GATEWAY_POLL_INTERVAL_S", "2"))
+POLL_TIMEOUT_S = float(os.getenv("GATEWAY_POLL_TIMEOUT_S", "2"))
+MAX_FAILURES = int(os.getenv("GATEWAY_MAX_FAILURES", "2"))
+EJECT_S = float(os.getenv("GATEWAY_EJECT_S", "15"))
+MAX_ATTEMPTS = int(os.getenv("GATEWAY_MAX_ATTEMPTS", "3"))
+REQUEST_TIMEOUT_S = float(os.getenv("GATEWAY_REQUEST_TIMEOUT_S", "300"))
+# Upstream statuses that mean "this replica can't take it right now", so another one is tried.
+RETRY_STATUSES = {502, 503, 504}
+# Absolute unix-seconds deadline; backends stop generating once it passes. Set here if the caller didn't.
+DEADLINE_HEADER = "X-Request-Deadline"
+
+app = FastAPI(title="PII Redaction Gateway")
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[o.strip() for o in os.getenv("CORS_ORIGINS", "*").split(",")],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+install_tracing(app, "pii-gateway")
+
+pool = ReplicaPool(BACKEND_URLS, max_failures=MAX_FAILURES, eject_s=EJECT_S)
+_session = requests.Session()
+_stop = threading.Event()
+
+
+def poll_once() -> None:
+    for r in pool.replicas:
+        try:
+            resp = _session.get(f"{r.url}/models", timeout=POLL_TIMEOUT_S)
+            resp.raise_for_status()
+            pool.update(r, resp.json())
+        except Exception as e:
+            pool.mark_failure(r, f"poll: {e.__class__.__name__}: {e}")
+
+
+def _poll_loop():
+    while not _stop.is_set():
+        poll_once()
+        _stop.wait(POLL_INTERVAL_S)
+
+
+@app.on_event("startup")
+def _start():
+    poll_once()
+    threading.Thread(target=_poll_loop, name="gateway-poll", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    _stop.set()
+
+
+_HOP_HEADERS = {"host", "content-length", "content-type", "connection", "keep-alive", "transfer-encoding", "accept-encoding"}
+
+
+def _forward_headers(request: Request) -> dict:
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS}
+    if DEADLINE_HEADER.lower() not in headers:
+        headers[DEADLINE_HEADER] = f"{time.time() + REQUEST_TIMEOUT_S:.3f}"
+    return headers
+
+
+def _deadline_passed(headers: dict) -> bool:
+    try:
+        return time.time() >= float(headers.get(DEADLINE_HEADER) or headers.get(DEADLINE_HEADER.lower()))
+    except (TypeError, ValueError):
+        return False
+
+
+def _payload(x: RedactIn | RedactBulkIn, local_path) -> dict:
+    body = x.model_dump(exclude_none=True)
+    if local_path:
+        body["model_path"] = local_path
+    return body
+
+
+def _no_replica(x: RedactIn | RedactBulkIn, errors: list[str]):
+    detail = f"No healthy replica serves model: {x.model_path or '<default>'}"
+    if errors:
+        detail += " (" + " | ".join(errors) + ")"
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "2"})
+
+
+def _proxy(path: str, x: RedactIn | RedactBulkIn, request: Request) -> Response:
+    tried: set[str] = set()
+    errors: list[str] = []
+    headers = _forward_headers(request)
+    for _ in range(MAX_ATTEMPTS):
+        picked = pool.pick(x.model_path, exclude=tried)
+        if picked is None:
+            break
+        replica, local = picked
+        tried.add(replica.url)
+        hop = start_span(f"proxy {path}", kind="client", **{"replica.url": replica.url, "attempt": len(tried)})
+        try:
+            resp = _session.post(
+                f"{replica.url}{path}",
+                json=_payload(x, local),
+                headers=inject(headers, hop),
+                timeout=REQUEST_TIMEOUT_S,
+            )
+            hop.set(**{"http.status_code": resp.status_code})
+        except requests.RequestException as e:
+            hop.fail(e)
+            pool.mark_failure(replica, f"{path}: {e.__class__.__name__}")
+            errors.append(f"{replica.url}: {e.__class__.__name__}")
+            continue
+        finally:
+            hop.end()
+            pool.release(replica)
+        # Past the deadline the replica's 504 is the answer, not a reason to try another one.
+        if resp.status_code in RETRY_STATUSES and not _deadline_passed(headers):
+            pool.mark_failure(replica, f"{path}: HTTP {resp.status_code}")
+            errors.append(f"{replica.url}: HTTP {resp.status_code}")
+            continue
+        return Response(
+            content=resp.content,
+            status_code=resp.status_code,
+            media_type=resp.headers.get("content-type", "application/json"),
+            headers={"X-Gateway-Replica": replica.url},
+        )
+    _no_replica(x, errors)
+
+
+@app.post("/redact")
+def redact(x: RedactIn, request: Request):
+    return _proxy("/redact", x, request)
+
+
+@app.post("/redact/bulk")
+def redact_bulk(x: RedactBulkIn, request: Request):
+    return _proxy("/redact/bulk", x, request)
+
+
+@app.post("/redact/stream")
+def redact_stream(x: RedactIn, request: Request):
+    # Retries only happen before the first byte; once streaming starts the replica is committed.
+    tried: set[str] = set()
+    errors: list[str] = []
+    headers = _forward_headers(request)
+    for _ in range(MAX_ATTEMPTS):
+        picked = pool.pick(x.model_path, exclude=tried)
+        if picked is None:
+            break
+        replica, local = picked
+        tried.add(replica.url)
+        hop = start_span("proxy /redact/stream", kind="client", **{"replica.url": replica.url, "attempt": len(tried)})
+        try:
+            resp = _session.post(
+                f"{replica.url}/redact/stream",
+                json=_payload(x, local),
+                headers=inject(headers, hop),
+                timeout=REQUEST_TIMEOUT_S,
+                stream=True,
+            )
+        except requests.RequestException as e:
+            hop.fail(e)
+            hop.end()
+            pool.release(replica)
+            pool.mark_failure(replica, f"stream: {e.__class__.__name__}")
+            errors.append(f"{replica.url}: {e.__class__.__name__}")
+            continue
+        hop.set(**{"http.status_code": resp.status_code})
+        if resp.status_code in RETRY_STATUSES and not _deadline_passed(headers):
+            hop.end()
+            resp.close()
+            pool.release(replica)
+            pool.mark_failure(replica, f"stream: HTTP {resp.status_code}")
+            errors.append(f"{replica.url}: HTTP {resp.status_code}")
+            continue
+
+        def body(resp=resp, replica=replica, hop=hop):
+            try:
+                for chunk in resp.iter_content(chunk_size=None):
+                    yield chunk
+            finally:
+                hop.end()
+                resp.close()
+                pool.release(replica)
+
+        return StreamingResponse(
+            body(),
+            status_code=resp.status_code,
+            media_type=resp.headers.get("content-type", "application/x-ndjson"),
+            headers={"X-Gateway-Replica": replica.url},
+        )
+    _no_replica(x, errors)
+
+
+@app.get("/models")
+def models():
+    return {"default_model": pool.default_model(), "models": pool.all_models(), "replicas": pool.status()}
+
+
+@app.get("/gateway/status")
+def gateway_status():
+    return {"replicas": pool.status(), "poll_interval_s": POLL_INTERVAL_S, "max_attempts": MAX_ATTEMPTS}
+
+
+@app.get("/eval/{path:path}")
+def eval_proxy(path: str, request: Request):
+    # Eval artifacts are identical on every replica; serve from the first healthy one.
+    now = time.time()
+    for r in pool.replicas:
+        if not r.healthy(now):
+            continue
+        headers = {k: v for k, v in request.headers.items() if k.lower() in {"if-none-match", "accept-encoding"}}
+        # The body is relayed undecoded, so don't let requests ask for gzip on behalf of a client that didn't.
+        headers.setdefault("accept-encoding", "identity")
+        try:
+            resp = _session.get(
+                f"{r.url}/eval/{path}",
+                headers=headers,
+                timeout=POLL_TIMEOUT_S * 5,
+                stream=True,
+            )
+        except requests.RequestException as e:
+            pool.mark_failure(r, f"eval: {e.__class__.__name__}")
+            continue
+        raw = resp.raw.read()
+        headers = {k: v for k, v in resp.headers.items() if k.lower() in {"etag", "content-encoding", "cache-control", "vary"}}
+        return Response(content=raw, status_code=resp.status_code, headers=headers, media_type=resp.headers.get("content-type"))
+    raise HTTPException(status_code=503, detail="No healthy replica.")
+
+
+@app.get("/")
+def root():
+    now = time.time()
+    healthy = sum(1 for r in pool.replicas if r.healthy(now))
+    return {"backend": "gateway", "replicas": len(pool.replicas), "healthy": healthy}
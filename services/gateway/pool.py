@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from typing import Optional
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.models: list[str] = []
+        self.loaded: set[str] = set()
+        self.reported_in_use: dict[str, int] = {}
+        self.default_model: Optional[str] = None
+        # False while the backend is still loading/warming its default model (its /healthz/ready is 503).
+        self.ready = True
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.last_poll: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.requests = 0
+
+    def healthy(self, now: float) -> bool:
+        return self.last_poll is not None and self.ready and now >= self.ejected_until
+
+    def serves(self, model_path: str) -> Optional[str]:
+        """Replica-local path for `model_path` (exact match first, then by file name)."""
+        if model_path in self.models:
+            return model_path
+        name = os.path.basename(model_path)
+        for m in self.models:
+            if os.path.basename(m) == name:
+                return m
+        return None
+
+    def info(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy(now),
+            "ready": self.ready,
+            "ejected_for_s": max(0.0, self.ejected_until - now),
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "requests": self.requests,
+            "models": self.models,
+            "loaded": sorted(self.loaded),
+            "last_poll": self.last_poll,
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaPool:
+    """Least-outstanding-requests routing with model affinity and failure-based ejection.
+
+    A replica is ejected for `eject_s` seconds after `max_failures` consecutive failed polls
+    or proxied requests; the next successful poll after the window re-admits it.
+    """
+
+    def __init__(self, urls: list[str], max_failures: int = 2, eject_s: float = 15.0):
+        self.replicas = [Replica(u) for u in urls]
+        self.max_failures = max_failures
+        self.eject_s = eject_s
+        self._lock = threading.Lock()
+
+    def update(self, replica: Replica, payload: dict) -> None:
+        status = payload.get("status") or {}
+        with self._lock:
+            replica.models = list(payload.get("models") or [])
+            replica.default_model = payload.get("default_model")
+            replica.ready = payload.get("ready", True)
+            replica.loaded = {p for p, s in status.items() if s.get("state") == "ready"}
+            replica.reported_in_use = {p: int(s.get("in_use") or 0) for p, s in status.items()}
+            replica.last_poll = time.time()
+            if replica.last_poll >= replica.ejected_until:
+                replica.failures = 0
+                replica.last_error = None
+
+    def mark_failure(self, replica: Replica, error: str) -> None:
+        with self._lock:
+            replica.failures += 1
+            replica.last_error = error
+            if replica.failures >= self.max_failures:
+                replica.ejected_until = time.time() + self.eject_s
+
+    def pick(self, model_path: Optional[str], exclude: set[str]) -> Optional[tuple[Replica, Optional[str]]]:
+        """Choose a replica for `model_path` (None = each replica's default) and reserve a slot on it.
+
+        Replicas that already have the model loaded win; among equals the one with the fewest
+        outstanding requests (gateway-side count plus the replica's reported in-use count) wins.
+        """
+        now = time.time()
+        best = None
+        with self._lock:
+            for r in self.replicas:
+                if r.url in exclude or not r.healthy(now):
+                    continue
+                local = r.serves(model_path) if model_path else r.default_model
+                if not local:
+                    continue
+                cold = 0 if local in r.loaded else 1
+                load = r.outstanding + r.reported_in_use.get(local, 0)
+                key = (cold, load, r.requests)
+                if best is None or key < best[0]:
+                    best = (key, r, local)
+            if best is None:
+                return None
+            _, r, local = best
+            r.outstanding += 1
+            r.requests += 1
+            return r, local
+
+    def release(self, replica: Replica) -> None:
+        with self._lock:
+            replica.outstanding -= 1
+
+    def default_model(self) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            return next((r.default_model for r in self.replicas if r.healthy(now) and r.default_model), None)
+
+    def all_models(self) -> list[str]:
+        now = time.time()
+        with self._lock:
+            return sorted({m for r in self.replicas if r.healthy(now) for m in r.models})
+
+    def status(self) -> list[dict]:
+        now = time.time()
+        with self._lock:
+            return [r.info(now) for r in self.replicas]
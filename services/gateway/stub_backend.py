@@ -0,0 +1,102 @@
+"""Stand-in CPU backend for exercising the gateway locally without models.
+
+    STUB_MODELS=/m/a.gguf,/m/b.gguf STUB_LOADED=/m/a.gguf STUB_DELAY_MS=200 \
+        uvicorn services.gateway.stub_backend:app --port 9001
+
+Speaks the same /models, /redact, /redact/bulk and /redact/stream shapes as services/backend/cpu/main.py;
+/eval/* echoes the path and the Accept-Encoding it received.
+"""
+import os
+import random
+import threading
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from services.backend.common.schema import RedactBulkIn, RedactBulkOut, RedactIn, RedactOut
+from services.backend.common.streaming import stream_events
+
+MODELS = [m.strip() for m in os.getenv("STUB_MODELS", "/models/stub.gguf").split(",") if m.strip()]
+LOADED = {m.strip() for m in os.getenv("STUB_LOADED", ",".join(MODELS)).split(",") if m.strip()}
+DELAY_MS = float(os.getenv("STUB_DELAY_MS", "100"))
+FAIL_RATE = float(os.getenv("STUB_FAIL_RATE", "0"))
+NAME = os.getenv("STUB_NAME", f"stub-{os.getpid()}")
+
+app = FastAPI(title="PII Redaction (stub)")
+_lock = threading.Lock()
+_in_use: dict[str, int] = {}
+
+
+def _check(x: RedactIn | RedactBulkIn) -> str:
+    selected = x.model_path or MODELS[0]
+    if selected not in MODELS:
+        raise HTTPException(status_code=400, detail=f"Model not in allowed list: {selected}")
+    if FAIL_RATE and random.random() < FAIL_RATE:
+        raise HTTPException(status_code=503, detail="stub failure")
+    return selected
+
+
+@app.get("/")
+def root():
+    return {"backend": "stub", "name": NAME}
+
+
+@app.get("/models")
+def models():
+    with _lock:
+        status = {
+            m: {"state": "ready" if m in LOADED else "unloaded", "in_use": _in_use.get(m, 0)} for m in MODELS
+        }
+    return {"default_model": MODELS[0], "models": MODELS, "status": status}
+
+
+@app.post("/redact", response_model=RedactOut)
+def redact(x: RedactIn):
+    selected = _check(x)
+    with _lock:
+        _in_use[selected] = _in_use.get(selected, 0) + 1
+    t0 = time.perf_counter()
+    try:
+        time.sleep(DELAY_MS / 1000.0)
+    finally:
+        with _lock:
+            _in_use[selected] -= 1
+    return RedactOut(
+        normalized=f"[{NAME}] {x.text}",
+        latency_ms=(time.perf_counter() - t0) * 1000.0,
+        model_name=os.path.basename(selected),
+        model_path=selected,
+    )
+
+
+@app.post("/redact/bulk", response_model=RedactBulkOut)
+def redact_bulk(x: RedactBulkIn):
+    selected = _check(x)
+    t0 = time.perf_counter()
+    time.sleep(DELAY_MS / 1000.0)
+    results = [
+        RedactOut(normalized=f"[{NAME}] {t}", model_name=os.path.basename(selected), model_path=selected) for t in x.texts
+    ]
+    return RedactBulkOut(results=results, latency_ms=(time.perf_counter() - t0) * 1000.0, llm_calls=len(results))
+
+
+@app.get("/eval/{path:path}")
+def eval_echo(path: str, request: Request):
+    return {"name": NAME, "path": path, "accept_encoding": request.headers.get("accept-encoding")}
+
+
+@app.post("/redact/stream")
+def redact_stream(x: RedactIn):
+    selected = _check(x)
+    words = x.text.split()
+
+    def pieces():
+        for w in words:
+            time.sleep(DELAY_MS / 1000.0 / max(1, len(words)))
+            yield w + " "
+
+    def finish(raw: str, stats: dict) -> dict:
+        return RedactOut(normalized=raw.strip(), model_name=os.path.basename(selected), model_path=selected, **stats).model_dump()
+
+    return StreamingResponse(stream_events(pieces(), time.perf_counter(), finish), media_type="application/x-ndjson")
@@ -0,0 +1,194 @@
+# src/pii_masking/cli/autotune.py
+"""Sweep llama.cpp runtime settings for one GGUF on a representative corpus.
+
+Dimensions are tuned one at a time (coordinate descent) in the order that matters
+most on CPU: n_threads (decode), n_threads_batch and n_batch (prompt eval), n_ctx,
+then mmap/mlock. The winner is written as a profile that GGUFModel and the CPU
+backend pick up at startup (see pii_masking.infer.llama_profile).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+from pathlib import Path
+
+from pii_masking.eval.leaderboard import percentile
+from pii_masking.infer.llama_profile import DEFAULTS, TUNABLE, profile_path_for
+from pii_masking.utils.prompting import alpaca_prompt
+
+SYSTEM = (
+    "You are a PII redaction assistant. Replace PII with bracketed tags only. "
+    "Use only these tags: [NAME], [ADDRESS], [CARDNUMBER], [PHONENUMBER], [DATE], "
+    "[EMAIL], [URL], [USERNAME], [IP], [IPV4], [IPV6], [ACCOUNTNUMBER], [OTHERPII]. "
+    "Preserve all non-PII text exactly. Output only the redacted text."
+)
+OBJECTIVES = {
+    "latency": lambda r: r["mean_latency_ms"],
+    "decode": lambda r: -r["decode_tps"],
+    "prompt": lambda r: -r["prompt_tps"],
+}
+
+
+def _ints(s: str):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def _bools(s: str):
+    return [x.strip().lower() in {"1", "true", "yes"} for x in s.split(",") if x.strip()]
+
+
+def load_corpus(path: str, samples: int) -> list[str]:
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                obj = json.loads(line)
+                line = obj.get("input") or obj.get("source_text") or obj.get("text") or ""
+            if line:
+                texts.append(line)
+            if samples and len(texts) >= samples:
+                break
+    if not texts:
+        raise SystemExit(f"No texts in corpus: {path}")
+    return texts
+
+
+def bench(gguf: str, params: dict, prompts: list[str], max_new_tokens: int) -> dict:
+    """Load with `params`, run every prompt once (after one warm-up) and time prompt eval vs decode.
+
+    Prompt-eval time is taken as time-to-first-token; decode rate from the remaining tokens.
+    """
+    from llama_cpp import Llama  # imported here so load_corpus/SYSTEM can be reused without llama_cpp
+
+    t0 = time.perf_counter()
+    llm = Llama(model_path=gguf, verbose=False, **params)
+    load_ms = (time.perf_counter() - t0) * 1000.0
+
+    def one(prompt: str):
+        n_prompt = len(llm.tokenize(prompt.encode("utf-8")))
+        t_start = time.perf_counter()
+        t_first = None
+        n_out = 0
+        for chunk in llm.create_completion(
+            prompt=prompt, temperature=0.0, max_tokens=max_new_tokens, stop=["</s>"], stream=True
+        ):
+            if t_first is None:
+                t_first = time.perf_counter()
+            n_out += 1
+        t_end = time.perf_counter()
+        return n_prompt, n_out, t_start, t_first or t_end, t_end
+
+    one(prompts[0])
+    lat, p_tok, p_s, d_tok, d_s = [], 0, 0.0, 0, 0.0
+    for prompt in prompts:
+        n_prompt, n_out, t_start, t_first, t_end = one(prompt)
+        lat.append((t_end - t_start) * 1000.0)
+        p_tok += n_prompt
+        p_s += t_first - t_start
+        d_tok += max(0, n_out - 1)
+        d_s += t_end - t_first
+    close = getattr(llm, "close", None)
+    if close is not None:
+        close()
+    del llm
+    return {
+        "params": params,
+        "load_ms": load_ms,
+        "mean_latency_ms": statistics.fmean(lat),
+        "p95_latency_ms": percentile(lat, 95),
+        "prompt_tps": p_tok / p_s if p_s > 0 else 0.0,
+        "decode_tps": d_tok / d_s if d_s > 0 else 0.0,
+    }
+
+
+def main():
+    from llama_cpp import Llama
+
+    cpus = os.cpu_count() or 4
+    thread_grid = sorted({max(1, cpus // 4), max(1, cpus // 2), max(1, cpus - 1), cpus})
+
+    ap = argparse.ArgumentParser(description="Tune llama.cpp runtime params for a GGUF on a corpus.")
+    ap.add_argument("--gguf", required=True)
+    ap.add_argument("--corpus", required=True, help="Text (one input per line) or JSONL with input/source_text")
+    ap.add_argument("--samples", type=int, default=16)
+    ap.add_argument("--max_new_tokens", type=int, default=128)
+    ap.add_argument("--threads", default=",".join(map(str, thread_grid)))
+    ap.add_argument("--threads_batch", default=None, help="Default: same grid as --threads")
+    ap.add_argument("--batch", default="128,256,512,1024")
+    ap.add_argument("--ctx", default="1024,2048,4096")
+    ap.add_argument("--mmap", default="1,0")
+    ap.add_argument("--mlock", default="0,1")
+    ap.add_argument("--objective", default="latency", choices=sorted(OBJECTIVES))
+    ap.add_argument("--out", default=None, help="Default: <gguf>.tuned.json (what GGUFModel loads)")
+    args = ap.parse_args()
+
+    texts = load_corpus(args.corpus, args.samples)
+    prompts = [alpaca_prompt(system=SYSTEM, instruction="Mask all PII:", input_text=t) for t in texts]
+
+    # Smallest context the corpus actually needs; smaller contexts are skipped, not benchmarked.
+    probe = Llama(model_path=args.gguf, vocab_only=True, verbose=False)
+    need_ctx = max(len(probe.tokenize(p.encode("utf-8"))) for p in prompts) + args.max_new_tokens
+    del probe
+
+    grids = {
+        "n_threads": _ints(args.threads),
+        "n_threads_batch": _ints(args.threads_batch or args.threads),
+        "n_batch": _ints(args.batch),
+        "n_ctx": [c for c in _ints(args.ctx) if c >= need_ctx] or [max(_ints(args.ctx) + [need_ctx])],
+        "use_mmap": _bools(args.mmap),
+        "use_mlock": _bools(args.mlock),
+    }
+    score = OBJECTIVES[args.objective]
+    best = dict(DEFAULTS, n_threads=cpus, n_threads_batch=cpus, n_ctx=grids["n_ctx"][0])
+    results = []
+    seen = {}
+
+    for dim in TUNABLE:
+        stage = []
+        for value in grids[dim]:
+            params = dict(best, **{dim: value})
+            key = json.dumps(params, sort_keys=True)
+            if key not in seen:
+                try:
+                    seen[key] = bench(args.gguf, params, prompts, args.max_new_tokens)
+                except Exception as e:
+                    print(f"[skip] {dim}={value}: {e.__class__.__name__}: {e}")
+                    continue
+                results.append(seen[key])
+                r = seen[key]
+                print(
+                    f"{dim}={value!s:>5}  latency={r['mean_latency_ms']:8.1f}ms  "
+                    f"prompt={r['prompt_tps']:7.1f} tok/s  decode={r['decode_tps']:6.1f} tok/s  load={r['load_ms']:.0f}ms",
+                    flush=True,
+                )
+            stage.append(seen[key])
+        if stage:
+            best = dict(min(stage, key=score)["params"])
+        print(f"[best] {dim}={best[dim]}")
+
+    if not results:
+        raise SystemExit("all benchmark runs failed")
+    winner = seen[json.dumps(best, sort_keys=True)]
+    out = Path(args.out) if args.out else profile_path_for(args.gguf)
+    profile = {
+        "gguf": str(Path(args.gguf).resolve()),
+        "gguf_size": os.path.getsize(args.gguf),
+        "objective": args.objective,
+        "params": best,
+        "metrics": {k: v for k, v in winner.items() if k != "params"},
+        "host": {"cpu_count": cpus, "machine": platform.machine(), "processor": platform.processor()},
+        "corpus": {"path": args.corpus, "samples": len(texts), "max_new_tokens": args.max_new_tokens},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    out.write_text(json.dumps(profile, indent=2), encoding="utf-8")
+    print(f"\nSaved tuned profile to: {out}\n{json.dumps(best)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# src/pii_masking/cli/bench_hf_cpu.py
+"""Benchmark HFModel's CPU optimizations against the plain float32/eager path.
+
+Any causal LM works; a small one keeps the run short:
+
+    PYTHONPATH=src python -m pii_masking.cli.bench_hf_cpu --model HuggingFaceTB/SmolLM2-135M \\
+        --corpus data/synthetic100_eval.jsonl --samples 8 --out hf_cpu_bench.json
+
+`agreement` is the share of outputs identical to the baseline's (int8 drifts a little by design).
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from pii_masking.cli.autotune import SYSTEM, load_corpus
+from pii_masking.eval.leaderboard import percentile
+from pii_masking.infer.hf_infer import HFModel
+
+CONFIGS = {
+    "baseline": {"cpu_opt": False},
+    "sdpa_threads": {"cpu_opt": True, "int8": False, "bf16": False},
+    "bf16": {"cpu_opt": True, "int8": False, "bf16": True},
+    "int8": {"cpu_opt": True, "int8": True},
+    "compile": {"cpu_opt": True, "int8": False, "bf16": False, "compile_static": True},
+}
+
+
+def bench(model_dir: str, kwargs: dict, texts: list[str], max_new_tokens: int, warmup: int) -> tuple[dict, list[str]]:
+    t0 = time.perf_counter()
+    model = HFModel(model_dir, device="cpu", **kwargs)
+    load_s = time.perf_counter() - t0
+    # Warm-up also absorbs torch.compile's first-call compilation.
+    for t in texts[:warmup]:
+        model.complete(SYSTEM, t, max_new_tokens=max_new_tokens)
+    lat, outs, toks = [], [], 0
+    for t in texts:
+        t1 = time.perf_counter()
+        out, usage = model.complete(SYSTEM, t, max_new_tokens=max_new_tokens)
+        lat.append((time.perf_counter() - t1) * 1000.0)
+        outs.append(out)
+        toks += usage["completion_tokens"]
+    row = {
+        "kwargs": kwargs,
+        "cpu_opts": model.cpu_opts,
+        "load_s": load_s,
+        "mean_latency_ms": statistics.fmean(lat),
+        "p95_latency_ms": percentile(lat, 95),
+        "tokens_per_s": toks / (sum(lat) / 1000.0) if lat else 0.0,
+    }
+    del model
+    return row, outs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare HFModel CPU modes on one causal LM.")
+    ap.add_argument("--model", required=True, help="HF model dir or hub id")
+    ap.add_argument("--corpus", required=True, help="Text (one input per line) or JSONL with input/source_text")
+    ap.add_argument("--samples", type=int, default=8)
+    ap.add_argument("--max_new_tokens", type=int, default=64)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--configs", default=",".join(CONFIGS), help=f"Subset of: {', '.join(CONFIGS)}")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    texts = load_corpus(args.corpus, args.samples)
+    names = [n.strip() for n in args.configs.split(",") if n.strip()]
+    unknown = [n for n in names if n not in CONFIGS]
+    if unknown:
+        raise SystemExit(f"Unknown config(s): {', '.join(unknown)}")
+
+    results, base_outs = {}, None
+    for name in names:
+        row, outs = bench(args.model, CONFIGS[name], texts, args.max_new_tokens, args.warmup)
+        if base_outs is None:
+            base_outs = outs
+        row["agreement"] = sum(a == b for a, b in zip(outs, base_outs)) / len(outs)
+        results[name] = row
+        base = results[names[0]]["mean_latency_ms"]
+        print(
+            f"{name:>13}  latency={row['mean_latency_ms']:8.1f}ms  p95={row['p95_latency_ms']:8.1f}ms  "
+            f"{row['tokens_per_s']:6.1f} tok/s  speedup={base / row['mean_latency_ms']:4.2f}x  "
+            f"agreement={row['agreement']:.2f}  load={row['load_s']:.1f}s",
+            flush=True,
+        )
+
+    if args.out:
+        report = {
+            "model": args.model,
+            "corpus": {"path": args.corpus, "samples": len(texts), "max_new_tokens": args.max_new_tokens},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Saved: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
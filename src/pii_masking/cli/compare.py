@@ -1,11 +1,12 @@
 # src/pii_masking/cli/compare.py
-import os, json, argparse
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from llama_cpp import Llama
+import time
 
+_T_START = time.perf_counter()
+
+import json, argparse, os
+
+from pii_masking.infer.registry import backend_label, load_backend, parse_backends
 from pii_masking.utils.post_processing import normalize_entities
-from pii_masking.utils.prompting import alpaca_prompt
 
 SYSTEM = (
     "You are a PII redaction assistant. Replace PII with bracketed tags only. "
@@ -14,66 +15,40 @@ SYSTEM = (
     "Preserve all non-PII text exactly. Output only the redacted text."
 )
 
-def load_hf(hf_dir: str):
-    tok = AutoTokenizer.from_pretrained(hf_dir, use_fast=True)
-    if tok.pad_token_id is None:
-        tok.pad_token = tok.eos_token
-    model = AutoModelForCausalLM.from_pretrained(
-        hf_dir,
-        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-        device_map="auto" if torch.cuda.is_available() else None,
-        low_cpu_mem_usage=True,
-    ).eval()
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    if device == "cpu":
-        model = model.to("cpu")
-    return tok, model, device
-
-def gen_hf(tok, model, device, src, max_new_tokens=128):
-    prompt = alpaca_prompt(system=SYSTEM, instruction="Mask all PII:", input_text=src)
-    enc = tok(prompt, return_tensors="pt", add_special_tokens=False)
-    input_ids = enc["input_ids"].to(device)
-    attn = torch.ones_like(input_ids, dtype=torch.long, device=device)
-    out_ids = model.generate(
-        input_ids=input_ids,
-        attention_mask=attn,
-        max_new_tokens=max_new_tokens,
-        do_sample=False,
-        pad_token_id=tok.eos_token_id,
-    )
-    decoded = tok.decode(out_ids[0], skip_special_tokens=False)
-    return normalize_entities(decoded, system=SYSTEM, user_text=src)
-
-def load_gguf(gguf_path, n_ctx=2048, n_threads=None):
-    if n_threads is None:
-        n_threads = max(2, (os.cpu_count() or 4) - 1)
-    os.environ.setdefault("OMP_NUM_THREADS", str(n_threads))
-    os.environ.setdefault("LLAMA_NUM_THREADS", str(n_threads))
-    return Llama(model_path=gguf_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
-
-def gen_gguf(llm, src, max_new_tokens=256):
-    prompt = alpaca_prompt(system=SYSTEM, instruction="Mask all PII:", input_text=src)
-    out = llm.create_completion(prompt=prompt, max_tokens=max_new_tokens, stop=["</s>"])
-    raw = out["choices"][0]["text"]
-    return normalize_entities(raw, system=SYSTEM, user_text=src)
-
 def main():
     ap = argparse.ArgumentParser(description="Compare GPU (HF) vs CPU (GGUF) PII masking in terminal.")
-    ap.add_argument("--hf_dir", required=True)
-    ap.add_argument("--gguf", required=True)
+    ap.add_argument("--backends", default="hf,gguf", help="Comma-separated subset of: hf, gguf")
+    ap.add_argument("--hf_dir", default=None, help="Required when hf is selected")
+    ap.add_argument("--gguf", default=None, help="Required when gguf is selected")
     ap.add_argument("--text")
     ap.add_argument("--infile")
     ap.add_argument("--max_new_tokens", type=int, default=128)
-    ap.add_argument("--n_ctx", type=int, default=2048)
+    ap.add_argument("--n_ctx", type=int, default=None)
     ap.add_argument("--threads", type=int, default=None)
     ap.add_argument("--jsonl_out")
     args = ap.parse_args()
 
     if not args.text and not args.infile:
         ap.error("Provide either --text or --infile")
-
-    tok, hf_model, device = load_hf(args.hf_dir)
-    llm = load_gguf(args.gguf, n_ctx=args.n_ctx, n_threads=args.threads)
+    try:
+        backends = parse_backends(args.backends)
+    except ValueError as e:
+        ap.error(str(e))
+    if "hf" in backends and not args.hf_dir:
+        ap.error("--hf_dir is required for the hf backend")
+    if "gguf" in backends and not args.gguf:
+        ap.error("--gguf is required for the gguf backend")
+
+    models, timings = {}, {}
+    for name in backends:
+        if name == "hf":
+            models[name], timings[name] = load_backend(name, args.hf_dir)
+        else:
+            # Unset n_ctx/threads come from the model's tuned profile (pii_masking.cli.autotune).
+            models[name], timings[name] = load_backend(name, args.gguf, n_ctx=args.n_ctx, n_threads=args.threads)
+        print(f"[startup] {name}: import {timings[name]['import_s']:.2f}s, load {timings[name]['load_s']:.2f}s")
+    startup = {"backends": backends, "models": timings, "startup_s": time.perf_counter() - _T_START}
+    print(f"[startup] ready in {startup['startup_s']:.2f}s")
 
     inputs = []
     if args.text:
@@ -88,21 +63,23 @@ def main():
         print("\n" + "="*80)
         print(f"[{i}] INPUT:\n{src}")
 
-        hf_norm = gen_hf(tok, hf_model, device, src, args.max_new_tokens)
-        print("\n--- HF (GPU) NORMALIZED ---")
-        print(hf_norm)
-
-        gg_norm = gen_gguf(llm, src, args.max_new_tokens)
-        print("\n--- GGUF (CPU) NORMALIZED ---")
-        print(gg_norm)
+        record = {"input": src}
+        for name, model in models.items():
+            raw = model.generate(SYSTEM, src, max_new_tokens=args.max_new_tokens)
+            record[f"{name}_norm"] = normalize_entities(raw, system=SYSTEM, user_text=src)
+            print(f"\n--- {backend_label(name)} NORMALIZED ---")
+            print(record[f"{name}_norm"])
         print("="*80)
 
         if f_log:
-            f_log.write(json.dumps({"input": src, "hf_norm": hf_norm, "gguf_norm": gg_norm}, ensure_ascii=False) + "\n")
+            f_log.write(json.dumps(record, ensure_ascii=False) + "\n")
 
     if f_log:
         f_log.close()
-        print(f"\nSaved JSONL to: {args.jsonl_out}")
+        startup_path = os.path.splitext(args.jsonl_out)[0] + ".startup.json"
+        with open(startup_path, "w", encoding="utf-8") as f:
+            json.dump(startup, f, indent=2)
+        print(f"\nSaved JSONL to: {args.jsonl_out}\nStartup timings: {startup_path}")
 
 if __name__ == "__main__":
     main()
@@ -2,32 +2,92 @@
 import json
 import os
 import random
+from collections import Counter
 from pathlib import Path
-from datasets import load_dataset
+
+import numpy as np
+
+from pii_masking.utils.metrics import extract_tag_sequence
+from pii_masking.utils.post_processing import normalize_reference
 
 _DEFAULT_CACHE = Path(os.getenv("PII_DATASETS_CACHE", Path.cwd() / ".cache" / "hf_datasets"))
 
 def _load(split: str):
+    from datasets import load_dataset  # heavy; not needed for --jsonl runs
+
     _DEFAULT_CACHE.mkdir(parents=True, exist_ok=True)
     return load_dataset("ai4privacy/pii-masking-200k", split=split, cache_dir=str(_DEFAULT_CACHE))
 
-def load_sampled(k: int = 100, seed: int = 42, split: str = "train"):
+def _split(split: str, seed: int):
     if split == "train":
-        ds = _load("train")
-    else:
-        base = _load("train")
-        holdout = base.train_test_split(test_size=0.02, seed=seed)
-        ds = holdout["test"]
+        return _load("train")
+    base = _load("train")
+    holdout = base.train_test_split(test_size=0.02, seed=seed)
+    return holdout["test"]
+
+def _example(ex: dict) -> dict:
+    src = ex.get("source_text") or ex.get("input") or ex.get("text") or ""
+    tgt = ex.get("target_text") or ex.get("output") or ""
+    return {"source_text": src, "target_text": tgt}
+
+def load_sampled(k: int = 100, seed: int = 42, split: str = "train"):
+    ds = _split(split, seed)
     rng = random.Random(seed)
     idxs = rng.sample(range(len(ds)), k=min(k, len(ds)))
-    subset = []
-    for i in idxs:
-        ex = ds[i]
-        src = ex.get("source_text") or ex.get("input") or ex.get("text") or ""
-        tgt = ex.get("target_text") or ex.get("output") or ""
-        subset.append({"source_text": src, "target_text": tgt})
+    subset = [_example(ds[i]) for i in idxs]
     return subset, idxs
 
+def stratified_indices(targets: list[str], min_support: int, seed: int = 42, max_k: int | None = None) -> list[int]:
+    """A small subset of `targets` in which every reference tag occurs at least `min_support` times
+    (or as often as it does in all of `targets`, if less).
+
+    Rows are grouped into strata by tag composition (the multiset of their reference tags). Greedy set
+    multicover: each step takes a random row from the stratum covering the most remaining support,
+    rare tags weighted by 1 / their total count, ties going to the larger stratum. Returns sorted positions.
+    """
+    seqs = [Counter(extract_tag_sequence(normalize_reference(t))) for t in targets]
+    tags = sorted(set().union(*seqs)) if seqs else []
+    if not tags:
+        return []
+    counts = np.array([[c[t] for t in tags] for c in seqs], dtype=np.int64)
+    comps, inverse = np.unique(counts, axis=0, return_inverse=True)
+    rng = random.Random(seed)
+    members = [[] for _ in comps]
+    for i, s in enumerate(inverse.reshape(-1)):
+        members[s].append(i)
+    for m in members:
+        rng.shuffle(m)
+
+    total = counts.sum(axis=0)
+    need = np.minimum(total, min_support)
+    weight = 1.0 / np.maximum(total, 1)
+    left = np.array([len(m) for m in members])
+    picked = []
+    while need.any() and (max_k is None or len(picked) < max_k):
+        gain = (np.minimum(comps, need) * weight).sum(axis=1) * (left > 0)
+        if gain.max() <= 0:
+            break
+        best = np.flatnonzero(gain == gain.max())
+        s = best[np.argmax(left[best])]
+        picked.append(members[s].pop())
+        left[s] -= 1
+        need = np.maximum(need - comps[s], 0)
+    return sorted(picked)
+
+def load_stratified(min_support: int = 20, seed: int = 42, split: str = "train", max_k: int | None = None):
+    """Like load_sampled, but the smallest sample (greedy) with `min_support` reference occurrences per tag."""
+    ds = _split(split, seed)
+    idxs = stratified_indices([_example(ex)["target_text"] for ex in ds], min_support, seed=seed, max_k=max_k)
+    subset = [_example(ds[i]) for i in idxs]
+    return subset, idxs
+
+def tag_support(examples: list[dict]) -> dict:
+    """Reference tag -> occurrences over examples (load_sampled / load_stratified rows)."""
+    c = Counter()
+    for ex in examples:
+        c.update(extract_tag_sequence(normalize_reference(ex["target_text"])))
+    return dict(sorted(c.items()))
+
 def load_jsonl_custom(path: str):
     exs, idxs = [], []
     with open(path, "r", encoding="utf-8") as f:
@@ -5,8 +5,10 @@ HF_DIR="${HF_DIR:-/home/mark/Codes/mahdi_codes_folder/axolotl/outputs/pii_maskin
 GGUF="${GGUF:-/home/mark/Codes/mahdi_codes_folder/axolotl/examples/pii_masking/merged-gguf/mistral7b-pii-Q4_K_M.gguf}"
 JSONL="${JSONL:-/home/mark/Codes/mahdi_codes_folder/axolotl/examples/pii_masking/data/synthetic100_eval.jsonl}"
 OUTDIR="${OUTDIR:-eval_out}"
+BACKENDS="${BACKENDS:-hf,gguf}"
 
 python -m pii_masking.eval.run_eval \
+  --backends "$BACKENDS" \
   --hf_dir "$HF_DIR" \
   --gguf   "$GGUF" \
   --jsonl  "$JSONL" \
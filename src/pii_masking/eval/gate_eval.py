@@ -0,0 +1,65 @@
+# src/pii_masking/eval/gate_eval.py
+"""Gate recall vs. LLM calls saved on held-out source/target pairs.
+
+    python -m pii_masking.eval.gate_eval --gate outputs/pii_gate.json.gz --jsonl data/pii_mask.jsonl --samples 2000
+"""
+import argparse
+import json
+from pathlib import Path
+
+from pii_masking.eval.data import load_jsonl_custom
+from pii_masking.infer.pii_gate import PIIGate, gate_report, labeled_sentences
+
+THRESHOLDS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def labeled_from_pairs(pairs: list[dict]) -> tuple[list[tuple[str, int]], int]:
+    """Sentence labels for every alignable pair; also returns how many pairs were skipped."""
+    data, skipped = [], 0
+    for ex in pairs:
+        lab = labeled_sentences(ex["source_text"], ex["target_text"])
+        if lab is None:
+            skipped += 1
+            continue
+        data.extend(lab)
+    return data, skipped
+
+
+def evaluate(gate: PIIGate, data: list[tuple[str, int]]) -> dict:
+    scores = [gate.score(s) for s, _y in data]
+    labels = [y for _s, y in data]
+    at = gate_report(scores, labels, [gate.threshold])[0]
+    return {
+        "sentences": len(data),
+        "pii_sentences": sum(labels),
+        "threshold": gate.threshold,
+        **{k: v for k, v in at.items() if k != "threshold"},
+        "curve": gate_report(scores, labels, sorted({*THRESHOLDS, gate.threshold})),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--gate", required=True)
+    ap.add_argument("--jsonl", required=True, help="input/output (or source_text/target_text) pairs")
+    ap.add_argument("--samples", type=int, default=0, help="last N pairs (0 = all)")
+    ap.add_argument("--threshold", type=float, default=None, help="override the gate's saved threshold")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    pairs, _idxs = load_jsonl_custom(args.jsonl)
+    if args.samples:
+        pairs = pairs[-args.samples:]
+    data, skipped = labeled_from_pairs(pairs)
+    report = {"jsonl": args.jsonl, "skipped_pairs": skipped, **evaluate(PIIGate.load(args.gate, args.threshold), data)}
+
+    print(f"{'threshold':>9} {'recall':>7} {'precision':>9} {'saved':>6}")
+    for r in report["curve"]:
+        print(f"{r['threshold']:>9.3f} {r['recall']:>7.4f} {r['precision']:>9.4f} {r['llm_calls_saved']:>6.1%}")
+    print(f"gate threshold {report['threshold']:.4f}: recall={report['recall']:.4f} llm_calls_saved={report['llm_calls_saved']:.1%}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
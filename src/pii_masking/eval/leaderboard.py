@@ -0,0 +1,154 @@
+# src/pii_masking/eval/leaderboard.py
+import json
+import math
+import os
+import tempfile
+from collections import defaultdict
+
+from pii_masking.utils.metrics import (
+    extract_tag_sequence,
+    pairwise_confusion,
+    merge_confusion,
+    per_tag_prf,
+    aggregate_prf,
+)
+
+# Exactly the fields services/backend/cpu/main.py::_norm_row serves.
+LEADERBOARD_FIELDS = (
+    "run_name",
+    "model_type",
+    "gguf_path",
+    "micro_f1",
+    "macro_f1",
+    "exact_match_rate",
+    "avg_latency_ms",
+    "p95_latency_ms",
+)
+
+
+def percentile(values, q: float):
+    """Nearest-rank percentile (q in 0..100); None for an empty list."""
+    if not values:
+        return None
+    xs = sorted(values)
+    k = max(0, min(len(xs) - 1, math.ceil(q / 100.0 * len(xs)) - 1))
+    return xs[k]
+
+
+class ModelStats:
+    """Accumulates per-example predictions for one model into a leaderboard-style summary block.
+
+    P/R/F1 come with `n_boot`-replicate bootstrap CIs over examples (0 disables them).
+    """
+
+    def __init__(self, n_boot: int = 1000):
+        self.n_boot = n_boot
+        self.prf_rows = []
+        # Example index of each prf row, for the bootstrap.
+        self.row_examples = []
+        self.conf = {}
+        self.n = 0
+        self.exact = 0
+        self.latencies_ms = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.gen_s = 0.0
+
+    def add(self, ref_norm: str, pred_norm: str, latency_ms=None, prompt_tokens=None, completion_tokens=None):
+        ref_seq = extract_tag_sequence(ref_norm)
+        pred_seq = extract_tag_sequence(pred_norm)
+        merge_confusion(self.conf, pairwise_confusion(ref_seq, pred_seq))
+        prf = per_tag_prf(ref_seq, pred_seq)
+        self.prf_rows.extend(prf)
+        self.row_examples.extend([self.n] * len(prf))
+        self.n += 1
+        self.exact += int(ref_norm.strip() == pred_norm.strip())
+        if latency_ms is not None:
+            self.latencies_ms.append(latency_ms)
+            if completion_tokens:
+                self.gen_s += latency_ms / 1000.0
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+
+    def per_tag(self) -> dict:
+        totals = defaultdict(lambda: {"tp": 0, "fp": 0, "fn": 0})
+        for tag, _p, _r, _f1, tp, fp, fn in self.prf_rows:
+            totals[tag]["tp"] += tp
+            totals[tag]["fp"] += fp
+            totals[tag]["fn"] += fn
+        out = {}
+        for tag, c in sorted(totals.items()):
+            p = c["tp"] / (c["tp"] + c["fp"]) if (c["tp"] + c["fp"]) else 0.0
+            r = c["tp"] / (c["tp"] + c["fn"]) if (c["tp"] + c["fn"]) else 0.0
+            f1 = 2 * p * r / (p + r) if (p + r) else 0.0
+            out[tag] = {"precision": p, "recall": r, "f1": f1, **c}
+        return out
+
+    def summary(self) -> dict:
+        agg = aggregate_prf(self.prf_rows, self.row_examples, n_examples=self.n, n_boot=self.n_boot)
+        lat = self.latencies_ms
+        missing = sum(row.get("<MISSING>", 0) for row in self.conf.values())
+        spurious = sum(self.conf.get("<SPURIOUS>", {}).values())
+        return {
+            **agg,
+            "n_examples": self.n,
+            "exact_match_rate": self.exact / self.n if self.n else 0.0,
+            "avg_latency_ms": sum(lat) / len(lat) if lat else None,
+            "p50_latency_ms": percentile(lat, 50),
+            "p95_latency_ms": percentile(lat, 95),
+            "p99_latency_ms": percentile(lat, 99),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_s": self.completion_tokens / self.gen_s if self.gen_s > 0 else None,
+            "missing_tags": missing,
+            "spurious_tags": spurious,
+            "per_tag": self.per_tag(),
+            "confusion": {g: dict(row) for g, row in self.conf.items()},
+        }
+
+
+def leaderboard_row(run_name: str, model_type: str, model_summary: dict, gguf_path=None) -> dict:
+    row = {"run_name": run_name, "model_type": model_type, "gguf_path": gguf_path}
+    for k in LEADERBOARD_FIELDS[3:]:
+        row[k] = model_summary.get(k)
+    return row
+
+
+def _atomic_write_json(path: str, payload) -> None:
+    d = os.path.dirname(os.path.abspath(path))
+    os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    # Atomic so the backend's mtime-validated cache never sees a half-written file.
+    os.replace(tmp, path)
+
+
+def summary_path(runs_dir: str, run_name: str) -> str:
+    return os.path.join(runs_dir, f"{run_name}_summary.json")
+
+
+def write_summary(runs_dir: str, run_name: str, summary: dict) -> str:
+    path = summary_path(runs_dir, run_name)
+    _atomic_write_json(path, summary)
+    return path
+
+
+def upsert_leaderboard(runs_dir: str, rows: list, dataset=None) -> str:
+    """Insert or replace rows by (run_name, model_type) in leaderboard.json, keeping rows sorted by micro F1.
+
+    One run may contribute several rows (e.g. run_eval's hf_full and gguf rows share a run_name).
+    """
+    path = os.path.join(runs_dir, "leaderboard.json")
+    payload = {"dataset": dataset, "rows": []}
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    by_key = {(r.get("run_name"), r.get("model_type")): r for r in payload.get("rows", [])}
+    for r in rows:
+        by_key[(r["run_name"], r.get("model_type"))] = {k: r.get(k) for k in LEADERBOARD_FIELDS}
+    payload["rows"] = sorted(by_key.values(), key=lambda r: -(r.get("micro_f1") or 0.0))
+    if dataset is not None:
+        payload["dataset"] = dataset
+    _atomic_write_json(path, payload)
+    return path
@@ -1,5 +1,9 @@
 # src/pii_masking/eval/run_eval.py
-import os, json, csv, argparse
+import time
+
+_T_START = time.perf_counter()
+
+import os, json, argparse
 
 # config is optional; fall back if not present
 try:
@@ -15,82 +19,139 @@ except Exception:
     CPU_THREADS = None  # auto
 
 from pii_masking.utils.post_processing import normalize_entities, normalize_reference
-from pii_masking.infer.hf_infer import HFModel
-from pii_masking.infer.gguf_infer import GGUFModel
-from pii_masking.eval.data import load_sampled, load_jsonl_custom
-from pii_masking.utils.metrics import (
-    extract_tag_sequence,
-    pairwise_confusion,
-    merge_confusion,
-    per_tag_prf,
-    aggregate_prf,
-    print_confusion,
-)
-from pii_masking.utils.plots import save_confusion_heatmap
+from pii_masking.infer.registry import backend_label, load_backend, parse_backends
+from pii_masking.eval.data import load_jsonl_custom, load_sampled, load_stratified, stratified_indices, tag_support
+from pii_masking.eval.leaderboard import ModelStats, leaderboard_row, upsert_leaderboard, write_summary
+from pii_masking.utils.metrics import print_confusion
+
+_T_IMPORTED = time.perf_counter()
+
+DEFAULT_RUNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_runs")
+# Leaderboard model_type per backend (the frontend maps hf_full rows to summary["models"]["hf"]).
+MODEL_TYPES = {"hf": "hf_full", "gguf": "gguf"}
+
+
+def _timed(model, src: str, max_new_tokens: int):
+    t0 = time.perf_counter()
+    raw, usage = model.complete(SYSTEM_PROMPT, src, max_new_tokens=max_new_tokens)
+    latency_ms = (time.perf_counter() - t0) * 1000.0
+    return raw, latency_ms, usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+
+
+def _eval_set_name(args) -> str:
+    if args.jsonl:
+        return f"{args.jsonl}:support{args.min_support}:{args.seed}" if args.min_support else args.jsonl
+    if args.min_support:
+        return f"{args.split}:support{args.min_support}:{args.seed}"
+    return f"{args.split}:{args.samples}:{args.seed}"
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--hf_dir", required=True)
-    ap.add_argument("--gguf", required=True)
+    ap.add_argument("--backends", default="hf,gguf", help="Comma-separated subset of: hf, gguf")
+    ap.add_argument("--hf_dir", default=None, help="Required when hf is selected")
+    ap.add_argument("--gguf", default=None, help="Required when gguf is selected")
     ap.add_argument("--samples", type=int, default=100, help="Used only if --jsonl not provided")
+    ap.add_argument("--min_support", type=int, default=0,
+                    help="Instead of --samples random rows, the smallest subset with this many reference occurrences per tag")
+    ap.add_argument("--bootstrap", type=int, default=1000, help="Bootstrap replicates for P/R/F1 CIs (0 = off)")
     ap.add_argument("--seed", type=int, default=42)
     ap.add_argument("--split", default="validation", choices=["train", "validation", "test"])
     ap.add_argument("--jsonl", default=None, help="Path to custom JSONL (input/output format)")
     ap.add_argument("--outdir", default="eval_out")
     ap.add_argument("--plot", action="store_true", help="Save heatmap PNGs")
+    ap.add_argument("--max_new_tokens", type=int, default=256)
+    ap.add_argument("--warmup", type=int, default=2, help="Untimed generations per backend before measuring")
+    ap.add_argument("--run_name", default=None, help="Leaderboard run name (default: basename of --outdir)")
+    ap.add_argument("--runs_dir", default=DEFAULT_RUNS_DIR, help="Where <run>_summary.json and leaderboard.json go")
+    ap.add_argument("--dataset", default="ai4privacy/pii-masking-200k")
     args = ap.parse_args()
+    run_name = args.run_name or os.path.basename(os.path.normpath(args.outdir))
+
+    try:
+        backends = parse_backends(args.backends)
+    except ValueError as e:
+        ap.error(str(e))
+    if "hf" in backends and not args.hf_dir:
+        ap.error("--hf_dir is required for the hf backend")
+    if "gguf" in backends and not args.gguf:
+        ap.error("--gguf is required for the gguf backend")
 
     os.makedirs(args.outdir, exist_ok=True)
 
     # data
+    t0 = time.perf_counter()
     if args.jsonl:
         ds, idxs = load_jsonl_custom(args.jsonl)
         print(f"[data] loaded {len(ds)} rows from {args.jsonl}")
+        if args.min_support:
+            keep = stratified_indices([ex["target_text"] for ex in ds], args.min_support, seed=args.seed)
+            ds, idxs = [ds[i] for i in keep], [idxs[i] for i in keep]
+            print(f"[data] stratified to {len(ds)} rows (min_support={args.min_support})")
+    elif args.min_support:
+        ds, idxs = load_stratified(min_support=args.min_support, seed=args.seed, split=args.split)
+        print(f"[data] stratified {len(ds)} rows from ai4privacy/pii-masking-200k (min_support={args.min_support})")
     else:
         ds, idxs = load_sampled(k=args.samples, seed=args.seed, split=args.split)
         print(f"[data] sampled {len(ds)} rows from ai4privacy/pii-masking-200k")
-
-    print("Loading HF model…")
-    hf = HFModel(args.hf_dir)
-
-    print("Loading GGUF model…")
-    gg = GGUFModel(args.gguf, n_ctx=N_CTX, n_threads=CPU_THREADS)
-
-    rows = []
-    conf_hf, conf_gg = {}, {}
-    prf_hf_all, prf_gg_all = [], []
+    support = tag_support(ds)
+    print(f"[data] tag support: {support}")
+    data_s = time.perf_counter() - t0
+
+    models, timings = {}, {}
+    for name in backends:
+        print(f"Loading {backend_label(name)}…")
+        if name == "hf":
+            models[name], timings[name] = load_backend(name, args.hf_dir)
+        else:
+            models[name], timings[name] = load_backend(name, args.gguf, n_ctx=N_CTX, n_threads=CPU_THREADS)
+        print(f"[startup] {name}: import {timings[name]['import_s']:.2f}s, load {timings[name]['load_s']:.2f}s")
+
+    startup = {
+        "backends": backends,
+        "module_import_s": _T_IMPORTED - _T_START,
+        "data_s": data_s,
+        "models": timings,
+        "startup_s": time.perf_counter() - _T_START,
+    }
+    print(f"[startup] ready in {startup['startup_s']:.2f}s (module imports {startup['module_import_s']:.2f}s)")
+
+    # Warm-up (allocator, kernels, KV cache) is excluded from every timing below.
+    for name, model in models.items():
+        for ex in ds[: args.warmup]:
+            model.complete(SYSTEM_PROMPT, ex["source_text"], max_new_tokens=args.max_new_tokens)
+
+    # pyarrow; imported before the eval loop so a missing dependency fails fast.
+    from pii_masking.eval.store import example_row, write_examples
+
+    rows, examples = [], []
+    stats = {name: ModelStats(n_boot=args.bootstrap) for name in backends}
 
     for i, ex in enumerate(ds):
         src = ex["source_text"]
         ref = ex["target_text"]
         ref_norm = normalize_reference(ref)  # same CANON as predictions
 
-        pred_hf_raw = hf.generate(SYSTEM_PROMPT, src)
-        pred_hf_norm = normalize_entities(pred_hf_raw, system=SYSTEM_PROMPT, user_text=src)
-
-        pred_gg_raw = gg.generate(SYSTEM_PROMPT, src)
-        pred_gg_norm = normalize_entities(pred_gg_raw, system=SYSTEM_PROMPT, user_text=src)
-
-        ref_seq = extract_tag_sequence(ref_norm)
-        hf_seq = extract_tag_sequence(pred_hf_norm)
-        gg_seq = extract_tag_sequence(pred_gg_norm)
-
-        merge_confusion(conf_hf, pairwise_confusion(ref_seq, hf_seq))
-        merge_confusion(conf_gg, pairwise_confusion(ref_seq, gg_seq))
-
-        prf_hf_all.extend(per_tag_prf(ref_seq, hf_seq))
-        prf_gg_all.extend(per_tag_prf(ref_seq, gg_seq))
-
-        rows.append({
+        row = {
             "id": int(idxs[i]),
             "source_text": src,
             "target_text_norm": ref_norm,
-            "hf_raw": pred_hf_raw.strip(),
-            "hf_norm": pred_hf_norm.strip(),
-            "gguf_raw": pred_gg_raw.strip(),
-            "gguf_norm": pred_gg_norm.strip(),
-        })
+        }
+        for name, model in models.items():
+            pred_raw, latency_ms, n_prompt, n_out = _timed(model, src, args.max_new_tokens)
+            pred_norm = normalize_entities(pred_raw, system=SYSTEM_PROMPT, user_text=src)
+            stats[name].add(ref_norm, pred_norm, latency_ms=latency_ms, prompt_tokens=n_prompt, completion_tokens=n_out)
+            row[f"{name}_raw"] = pred_raw.strip()
+            row[f"{name}_norm"] = pred_norm.strip()
+            row[f"{name}_latency_ms"] = round(latency_ms, 2)
+            row[f"{name}_prompt_tokens"] = n_prompt
+            row[f"{name}_completion_tokens"] = n_out
+            row[f"{name}_tokens_per_s"] = round(n_out / (latency_ms / 1000.0), 2) if latency_ms > 0 else None
+            examples.append(
+                example_row(MODEL_TYPES[name], idxs[i], src, ref_norm, pred_raw.strip(), pred_norm.strip(),
+                            round(latency_ms, 2), n_prompt, n_out)
+            )
+        rows.append(row)
 
         if (i + 1) % 10 == 0:
             print(f"...{i+1}/{len(ds)}")
@@ -101,36 +162,62 @@ def main():
         for r in rows:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
 
-    csv_path = os.path.join(args.outdir, "eval_results.csv")
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
-        w.writeheader()
-        w.writerows(rows)
+    # Columnar copy plus error index for /eval/examples, next to the run's summary.
+    examples_path = write_examples(os.path.join(args.runs_dir, run_name), examples)
 
-    # summaries
-    print_confusion(conf_hf, "HF merged (GPU)")
-    print_confusion(conf_gg, "GGUF quantized (CPU)")
-
-    agg_hf = aggregate_prf(prf_hf_all)
-    agg_gg = aggregate_prf(prf_gg_all)
-    print(
-        f"\n=== Macro/Micro P/R/F1: HF merged (GPU) ===\n"
-        f"macro: P={agg_hf['macro_p']:.3f} R={agg_hf['macro_r']:.3f} F1={agg_hf['macro_f1']:.3f}\n"
-        f"micro: P={agg_hf['micro_p']:.3f} R={agg_hf['micro_r']:.3f} F1={agg_hf['micro_f1']:.3f}"
-    )
-    print(
-        f"\n=== Macro/Micro P/R/F1: GGUF quantized (CPU) ===\n"
-        f"macro: P={agg_gg['macro_p']:.3f} R={agg_gg['macro_r']:.3f} F1={agg_gg['macro_f1']:.3f}\n"
-        f"micro: P={agg_gg['micro_p']:.3f} R={agg_gg['micro_r']:.3f} F1={agg_gg['micro_f1']:.3f}"
-    )
+    startup_path = os.path.join(args.outdir, "startup.json")
+    with open(startup_path, "w", encoding="utf-8") as f:
+        json.dump(startup, f, indent=2)
 
+    # summaries
+    summaries = {name: stats[name].summary() for name in backends}
+    for name in backends:
+        summaries[name]["load_ms"] = timings[name]["load_s"] * 1000.0
+        summaries[name]["warmup_examples"] = min(args.warmup, len(ds))
+        print_confusion(stats[name].conf, backend_label(name))
+
+    for name in backends:
+        agg = summaries[name]
+        print(
+            f"\n=== Macro/Micro P/R/F1: {backend_label(name)} ===\n"
+            f"macro: P={agg['macro_p']:.3f} R={agg['macro_r']:.3f} F1={agg['macro_f1']:.3f}\n"
+            f"micro: P={agg['micro_p']:.3f} R={agg['micro_r']:.3f} F1={agg['micro_f1']:.3f}"
+            + (f" (95% CI {agg['micro_f1_ci'][0]:.3f}-{agg['micro_f1_ci'][1]:.3f})" if "micro_f1_ci" in agg else "")
+            + "\n"
+            f"latency: avg={agg['avg_latency_ms'] or 0:.0f}ms p95={agg['p95_latency_ms'] or 0:.0f}ms "
+            f"tok/s={agg['tokens_per_s'] or 0:.1f}"
+        )
+
+    summary = {
+        "run_name": run_name,
+        "dataset": args.dataset,
+        "eval_set": _eval_set_name(args),
+        "n_examples": len(ds),
+        "tag_support": support,
+        "hf_dir": args.hf_dir,
+        "gguf_path": args.gguf,
+        "max_new_tokens": args.max_new_tokens,
+        "startup": startup,
+        "models": summaries,
+    }
+    summary_file = write_summary(args.runs_dir, run_name, summary)
+    lb_rows = [
+        leaderboard_row(run_name, MODEL_TYPES[name], summaries[name], gguf_path=args.gguf if name == "gguf" else None)
+        for name in backends
+    ]
+    lb_file = upsert_leaderboard(args.runs_dir, lb_rows, dataset=args.dataset)
+
+    plot_paths = []
     if args.plot:
-        save_confusion_heatmap(conf_hf, "HF merged (GPU)", os.path.join(args.outdir, "confusion_hf.png"))
-        save_confusion_heatmap(conf_gg, "GGUF quantized (CPU)", os.path.join(args.outdir, "confusion_gguf.png"))
+        from pii_masking.utils.plots import save_confusion_heatmap  # matplotlib only when plotting
 
-    print(f"\nSaved:\n  {jsonl_path}\n  {csv_path}")
-    if args.plot:
-        print(f"  {os.path.join(args.outdir, 'confusion_hf.png')}\n  {os.path.join(args.outdir, 'confusion_gguf.png')}")
+        for name in backends:
+            plot_paths.append(os.path.join(args.outdir, f"confusion_{name}.png"))
+            save_confusion_heatmap(stats[name].conf, backend_label(name), plot_paths[-1])
+
+    print(f"\nSaved:\n  {jsonl_path}\n  {examples_path}\n  {startup_path}\n  {summary_file}\n  {lb_file}")
+    for path in plot_paths:
+        print(f"  {path}")
 
 if __name__ == "__main__":
     main()
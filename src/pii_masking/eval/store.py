@@ -0,0 +1,156 @@
+# src/pii_masking/eval/store.py
+"""Per-run example store: one Parquet row per (example, model) plus an inverted error index.
+
+    <runs_dir>/<run_name>/eval_results.parquet
+    <runs_dir>/<run_name>/eval_index.json   {"models": {model_type: [start, end]},
+                                             "errors": {model_type: {missing|spurious|confused: {TAG: [row, ...]}}}}
+
+Rows are sorted by (model_type, id), so a model's rows are one contiguous range. Error types follow
+the positional tag alignment the summaries use (pii_masking.utils.metrics.pairwise_confusion);
+`confused` is indexed under the gold tag.
+"""
+import bisect
+import json
+import os
+import threading
+from collections import defaultdict
+from itertools import accumulate
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pii_masking.utils.metrics import extract_tag_sequence, pairwise_confusion
+
+ERROR_TYPES = ("missing", "spurious", "confused")
+EXAMPLES_FILE = "eval_results.parquet"
+INDEX_FILE = "eval_index.json"
+
+SCHEMA = pa.schema([
+    ("model_type", pa.dictionary(pa.int8(), pa.string())),
+    ("id", pa.int64()),
+    ("source_text", pa.string()),
+    ("target_text_norm", pa.string()),
+    ("pred_raw", pa.string()),
+    ("pred_norm", pa.string()),
+    ("latency_ms", pa.float64()),
+    ("prompt_tokens", pa.int32()),
+    ("completion_tokens", pa.int32()),
+    ("missing", pa.list_(pa.dictionary(pa.int16(), pa.string()))),
+    ("spurious", pa.list_(pa.dictionary(pa.int16(), pa.string()))),
+    # "GOLD>PRED"
+    ("confused", pa.list_(pa.dictionary(pa.int16(), pa.string()))),
+])
+
+
+def example_errors(ref_norm: str, pred_norm: str) -> dict:
+    """{"missing": [tag...], "spurious": [tag...], "confused": [(gold, pred)...]} for one prediction."""
+    conf = pairwise_confusion(extract_tag_sequence(ref_norm), extract_tag_sequence(pred_norm))
+    out = {"missing": [], "spurious": [], "confused": []}
+    for gold, row in conf.items():
+        for pred, n in row.items():
+            if gold == "<SPURIOUS>":
+                out["spurious"] += [pred] * n
+            elif pred == "<MISSING>":
+                out["missing"] += [gold] * n
+            elif gold != pred:
+                out["confused"] += [(gold, pred)] * n
+    return out
+
+
+def example_row(model_type: str, ex_id: int, source: str, ref_norm: str, pred_raw: str, pred_norm: str,
+                latency_ms=None, prompt_tokens=None, completion_tokens=None) -> dict:
+    err = example_errors(ref_norm, pred_norm)
+    return {
+        "model_type": model_type,
+        "id": int(ex_id),
+        "source_text": source,
+        "target_text_norm": ref_norm,
+        "pred_raw": pred_raw,
+        "pred_norm": pred_norm,
+        "latency_ms": latency_ms,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "missing": err["missing"],
+        "spurious": err["spurious"],
+        "confused": [f"{g}>{p}" for g, p in err["confused"]],
+    }
+
+
+def write_examples(store_dir: str, rows: list[dict]) -> str:
+    """Write example rows (from example_row) and their index; returns the Parquet path."""
+    os.makedirs(store_dir, exist_ok=True)
+    rows = sorted(rows, key=lambda r: (r["model_type"], r["id"]))
+    models: dict[str, list[int]] = {}
+    errors = defaultdict(lambda: {e: defaultdict(list) for e in ERROR_TYPES})
+    for i, r in enumerate(rows):
+        mt = r["model_type"]
+        models.setdefault(mt, [i, i])[1] = i + 1
+        for e in ERROR_TYPES:
+            tags = {c.split(">", 1)[0] for c in r[e]} if e == "confused" else set(r[e])
+            for tag in tags:
+                errors[mt][e][tag].append(i)
+
+    table = pa.Table.from_pylist(rows, schema=SCHEMA)
+    path = os.path.join(store_dir, EXAMPLES_FILE)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression="zstd", use_dictionary=True, row_group_size=1024)
+    os.replace(tmp, path)
+
+    index = {"rows": len(rows), "models": models, "errors": errors}
+    ipath = os.path.join(store_dir, INDEX_FILE)
+    with open(ipath + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(ipath + ".tmp", ipath)
+    return path
+
+
+class ExampleStore:
+    """Read side: the Parquet file is memory-mapped and a page decodes only the row groups
+    (row_group_size rows each) that hold its rows; opening the store reads just the footer."""
+
+    def __init__(self, store_dir: str):
+        with open(os.path.join(store_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.file = pq.ParquetFile(os.path.join(store_dir, EXAMPLES_FILE), memory_map=True)
+        meta = self.file.metadata
+        # First row of each row group, plus the total.
+        self.group_starts = [0, *accumulate(meta.row_group(i).num_rows for i in range(meta.num_row_groups))]
+        self._read_lock = threading.Lock()
+
+    def take(self, rows: list[int]) -> list[dict]:
+        """The given rows, in that order, decoding only the row groups they fall in."""
+        by_group = defaultdict(list)
+        for r in rows:
+            by_group[bisect.bisect_right(self.group_starts, r) - 1].append(r)
+        found = {}
+        for g, members in sorted(by_group.items()):
+            # One group at a time: pyarrow can't combine the list<dictionary> columns of several groups.
+            with self._read_lock:
+                group = self.file.read_row_group(g)
+            local = pa.array([r - self.group_starts[g] for r in members], type=pa.int64())
+            found.update(zip(members, group.take(local).to_pylist()))
+        return [found[r] for r in rows]
+
+    def row_ids(self, model_type: str | None = None, error: str | None = None, tag: str | None = None) -> list[int]:
+        models = [model_type] if model_type else list(self.index["models"])
+        if error is None and tag is None:
+            out = []
+            for mt in models:
+                start, end = self.index["models"].get(mt, (0, 0))
+                out.extend(range(start, end))
+            return out
+        errors = [error] if error else list(ERROR_TYPES)
+        hits = set()
+        for mt in models:
+            by_type = self.index["errors"].get(mt, {})
+            for e in errors:
+                by_tag = by_type.get(e, {})
+                for t in [tag] if tag else by_tag:
+                    hits.update(by_tag.get(t, ()))
+        return sorted(hits)
+
+    def page(self, model_type=None, error=None, tag=None, offset: int = 0, limit: int = 50) -> dict:
+        ids = self.row_ids(model_type, error, tag)
+        sel = ids[offset: offset + limit]
+        rows = self.take(sel) if sel else []
+        return {"total": len(ids), "offset": offset, "limit": limit, "rows": rows}
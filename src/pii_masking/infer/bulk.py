@@ -0,0 +1,152 @@
+# src/pii_masking/infer/bulk.py
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Optional
+
+from pii_masking.utils.align import TAG_RE, align_entities
+from pii_masking.utils.drain import Drain, tokenize
+
+
+def _learn_mask(tokens, text: str, redacted: str):
+    """Turn one LLM redaction into a per-template mask: ((first_tok, last_tok, tag, prefix, suffix), ...).
+
+    prefix/suffix are literal text kept inside the first/last token (e.g. `user=` in `user=alice`).
+    Returns None when the tags could not all be placed on token positions.
+    """
+    entities = align_entities(text, redacted)
+    if len(entities) != len(TAG_RE.findall(redacted)):
+        return None
+    mask = []
+    for e in entities:
+        first = next((i for i, (_t, s, end) in enumerate(tokens) if end > e["start"]), None)
+        last = next((i for i in range(len(tokens) - 1, -1, -1) if tokens[i][1] < e["end"]), None)
+        if first is None or last is None or first > last:
+            return None
+        prefix = text[tokens[first][1]: e["start"]]
+        suffix = text[e["end"]: tokens[last][2]]
+        mask.append((first, last, e["tag"], prefix, suffix))
+    return tuple(mask)
+
+
+def _apply_mask(tokens, text: str, mask):
+    """Redact `text` with a learned mask; None if a slot's literal prefix/suffix doesn't fit this member."""
+    out, entities, pos = [], [], 0
+    for first, last, tag, prefix, suffix in mask:
+        tok_first, tok_last = tokens[first][0], tokens[last][0]
+        if not tok_first.startswith(prefix) or not tok_last.endswith(suffix):
+            return None
+        start = tokens[first][1] + len(prefix)
+        end = tokens[last][2] - len(suffix)
+        if end <= start or start < pos:
+            return None
+        out.append(text[pos:start])
+        out.append(f"[{tag}]")
+        entities.append({"tag": tag, "start": start, "end": end})
+        pos = end
+    out.append(text[pos:])
+    return "".join(out), entities
+
+
+class _TemplateStats:
+    __slots__ = ("version", "masks")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.masks: Counter = Counter()
+
+    def best(self):
+        """(majority mask, agreement ratio, observations)."""
+        n = sum(self.masks.values())
+        if not n:
+            return None, 0.0, 0
+        mask, k = self.masks.most_common(1)[0]
+        return mask, k / n, n
+
+
+class BulkRedactor:
+    """Redacts batches of machine-generated text with one LLM call per template instead of per line.
+
+    Inputs are clustered with Drain. For each template the LLM redacts members until `min_observations`
+    of them agree on which token slots are PII (at least one) with at least `confidence` agreement;
+    the remaining members get that mask applied directly. Members the mask doesn't fit, and templates
+    whose redactions disagree, keep going through the LLM. Learned masks persist across calls.
+    """
+
+    def __init__(
+        self,
+        confidence: float = 0.9,
+        min_observations: int = 2,
+        sim_threshold: float = 0.5,
+        depth: int = 4,
+        max_templates: int = 1000,
+    ):
+        self.confidence = confidence
+        self.min_observations = max(1, min_observations)
+        self.drain = Drain(depth=depth, sim_threshold=sim_threshold, max_clusters=max_templates)
+        self._stats: dict[int, _TemplateStats] = {}
+        self._lock = threading.Lock()
+
+    def _template_stats(self, cluster) -> _TemplateStats:
+        st = self._stats.get(cluster.id)
+        if st is None or st.version != cluster.version:
+            # New template, or it just gained a wildcard: earlier masks no longer describe it.
+            st = self._stats[cluster.id] = _TemplateStats(cluster.version)
+        return st
+
+    def _trusted_mask(self, st: _TemplateStats):
+        """The template's majority mask once enough redactions agree on it, else None.
+
+        A mask with no PII slots is never trusted: the LLM missing PII in a few members must not
+        wave the rest of the template through unredacted.
+        """
+        mask, agree, n = st.best()
+        if mask and n >= self.min_observations and agree >= self.confidence:
+            return mask
+        return None
+
+    def redact_many(self, texts: list[str], llm: Callable[[str], str]) -> list[dict]:
+        """`llm(text) -> normalized redaction`. Returns per input: normalized, entities, source, template_id.
+
+        The lock covers the Drain tree and template stats only, so concurrent batches don't wait on
+        each other's LLM calls.
+        """
+        toks = [tokenize(t) for t in texts]
+        with self._lock:
+            clusters = [self.drain.add([t for t, _s, _e in tk]) for tk in toks]
+            for cid in list(self._stats):
+                if cid not in self.drain.clusters:
+                    del self._stats[cid]
+            members = defaultdict(list)
+            for i, c in enumerate(clusters):
+                members[c.id].append(i)
+            stats = {cid: self._template_stats(clusters[idxs[0]]) for cid, idxs in members.items()}
+
+        results: list[Optional[dict]] = [None] * len(texts)
+        for cid, idxs in members.items():
+            st = stats[cid]
+            for i in idxs:
+                with self._lock:
+                    mask = self._trusted_mask(st)
+                applied = _apply_mask(toks[i], texts[i], mask) if mask is not None else None
+                if applied is not None:
+                    norm, entities = applied
+                    results[i] = {"normalized": norm, "entities": entities, "source": "template", "template_id": cid}
+                    continue
+                norm = llm(texts[i])
+                learned = _learn_mask(toks[i], texts[i], norm)
+                with self._lock:
+                    # Skip the observation if the template gained a wildcard (or was dropped) meanwhile.
+                    if self._stats.get(cid) is st:
+                        st.masks[learned] += 1
+                results[i] = {
+                    "normalized": norm,
+                    "entities": align_entities(texts[i], norm),
+                    "source": "llm",
+                    "template_id": cid,
+                }
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            trusted = sum(1 for st in self._stats.values() if self._trusted_mask(st) is not None)
+            return {"templates": len(self.drain.clusters), "trusted_templates": trusted}
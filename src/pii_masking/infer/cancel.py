@@ -0,0 +1,3 @@
+# src/pii_masking/infer/cancel.py
+class GenerationCancelled(RuntimeError):
+    """Raised by a model's complete()/stream() when its `should_stop` callback ended decoding early."""
@@ -1,21 +1,174 @@
-import os
-from llama_cpp import Llama
+import time
+from typing import Callable, Iterator, Optional, Sequence
+import llama_cpp
+from llama_cpp import Llama, StoppingCriteriaList
+from pii_masking.infer.cancel import GenerationCancelled
+from pii_masking.infer.llama_profile import resolve_llama_params
 from pii_masking.utils.prompting import alpaca_prompt
 
+
+def _lora_api(*names: str):
+    # The runtime-LoRA C API was renamed upstream (llama_lora_adapter_* -> llama_adapter_lora_*).
+    for name in names:
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None:
+            return fn
+    raise RuntimeError(f"llama_cpp has no {names[0]} (llama-cpp-python too old for runtime LoRA adapters)")
+
+
 class GGUFModel:
-    def __init__(self, gguf_path: str, n_ctx: int = 2048, n_threads: int | None = None):
-        self.ll = Llama(
-            model_path=gguf_path,
-            n_ctx=n_ctx,
-            n_threads=n_threads or (os.cpu_count() or 4),
-        )
+    def __init__(
+        self,
+        gguf_path: str,
+        n_ctx: int | None = None,
+        n_threads: int | None = None,
+        profile: dict | None = None,
+        **llama_params,
+    ):
+        # Unset params come from the tuned profile next to the model (see pii_masking.cli.autotune).
+        self.params = resolve_llama_params(gguf_path, profile=profile, n_ctx=n_ctx, n_threads=n_threads, **llama_params)
+        self.ll = Llama(model_path=gguf_path, **self.params)
+        # GGUF LoRA path -> llama.cpp adapter handle; loaded on first use, kept until close().
+        self._adapters: dict[str, object] = {}
+        self.adapter: Optional[str] = None
+        self.adapter_switches = 0
+        self.adapter_switch_ms = 0.0
+
+    def close(self) -> None:
+        # Frees the llama.cpp context and weights now instead of waiting for GC.
+        if self._adapters:
+            free = _lora_api("llama_adapter_lora_free", "llama_lora_adapter_free")
+            for handle in self._adapters.values():
+                free(handle)
+            self._adapters.clear()
+        close = getattr(self.ll, "close", None)
+        if close is not None:
+            close()
+        self.ll = None
+
+    def set_adapter(self, path: Optional[str], scale: float = 1.0) -> float:
+        """Apply a GGUF LoRA adapter (None = the bare base model) to this context; returns the switch cost in ms.
+
+        Adapters are applied at runtime on top of the base weights, so any number of them share one
+        loaded model. A switch also drops the KV cache: the next prompt is evaluated from scratch.
+        """
+        if path == self.adapter:
+            return 0.0
+        t0 = time.perf_counter()
+        ctx = self.ll._ctx.ctx
+        _lora_api("llama_clear_adapter_lora", "llama_lora_adapter_clear")(ctx)
+        self.adapter = None
+        if path is not None:
+            handle = self._adapters.get(path)
+            if handle is None:
+                init = _lora_api("llama_adapter_lora_init", "llama_lora_adapter_init")
+                handle = init(self.ll._model.model, path.encode("utf-8"))
+                if not handle:
+                    raise ValueError(f"Failed to load LoRA adapter: {path}")
+                self._adapters[path] = handle
+            if _lora_api("llama_set_adapter_lora", "llama_lora_adapter_set")(ctx, handle, scale) != 0:
+                raise RuntimeError(f"Failed to apply LoRA adapter: {path}")
+        self.ll.reset()
+        self.adapter = path
+        ms = (time.perf_counter() - t0) * 1000.0
+        self.adapter_switches += 1
+        self.adapter_switch_ms += ms
+        return ms
+
+    def adapter_stats(self) -> dict:
+        return {
+            "active": self.adapter,
+            "loaded": sorted(self._adapters),
+            "switches": self.adapter_switches,
+            "switch_ms_total": self.adapter_switch_ms,
+        }
+
+    @staticmethod
+    def _stopping(should_stop: Optional[Callable[[], bool]]):
+        # Checked after every sampled token, so a cancelled request frees the context within one decode step.
+        return StoppingCriteriaList([lambda _ids, _logits: should_stop()]) if should_stop is not None else None
+
+    def count_tokens(self, text: str) -> int:
+        # Reads only the vocabulary, not the context, so it doesn't need the model's infer lock.
+        return len(self.ll.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def prompt_ids(self, system: str, user_text: str) -> list[int]:
+        # Tokenized the way create_completion() tokenizes a string prompt.
+        prompt = alpaca_prompt(system=system, instruction="Mask all PII:", input_text=user_text)
+        return self.ll.tokenize(prompt.encode("utf-8"), special=True)
+
+    def stream_ids(
+        self,
+        prompt_ids: list[int],
+        max_new_tokens: int = 256,
+        resume: Sequence[int] = (),
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> Iterator[tuple[int, bytes]]:
+        """(token id, its bytes) per greedily decoded token, continuing after `prompt_ids` + `resume`.
+
+        `resume` is the ids already generated, so a paused generation continues exactly where it stopped;
+        re-tokenizing the partial text instead can split it into different tokens. llama.cpp reuses the
+        KV cache of the longest common prefix, so the prompt is only re-evaluated if other work ran meanwhile.
+        A token's bytes can end inside a multi-byte character: decode them incrementally.
+        Raises GenerationCancelled if `should_stop()` turned true while decoding.
+        """
+        tokens = [*prompt_ids, *resume]
+        budget = min(max_new_tokens, self.ll.n_ctx() - len(tokens))
+        if budget > 0:
+            n = 0
+            for tok in self.ll.generate(
+                tokens, temp=0.0, repeat_penalty=1.0, reset=True, stopping_criteria=self._stopping(should_stop)
+            ):
+                if tok == self.ll.token_eos():
+                    break
+                yield tok, self.ll.detokenize([tok])
+                n += 1
+                if n >= budget:
+                    break
+        if should_stop is not None and should_stop():
+            raise GenerationCancelled()
 
-    def generate(self, system: str, user_text: str, max_new_tokens: int = 256) -> str:
+    def complete(
+        self, system: str, user_text: str, max_new_tokens: int = 256, should_stop: Optional[Callable[[], bool]] = None
+    ) -> tuple[str, dict]:
+        """Like generate(), but also returns llama.cpp's usage block (prompt/completion token counts).
+
+        Raises GenerationCancelled if `should_stop()` turned true while decoding.
+        """
         prompt = alpaca_prompt(system=system, instruction="Mask all PII:", input_text=user_text)
         out = self.ll.create_completion(
             prompt=prompt,
             temperature=0.0,
             max_tokens=max_new_tokens,
             stop=["</s>"],
+            stopping_criteria=self._stopping(should_stop),
         )
-        return out["choices"][0]["text"].strip()
+        if should_stop is not None and should_stop():
+            raise GenerationCancelled()
+        return out["choices"][0]["text"].strip(), out.get("usage") or {}
+
+    def generate(self, system: str, user_text: str, max_new_tokens: int = 256, should_stop=None) -> str:
+        return self.complete(system, user_text, max_new_tokens=max_new_tokens, should_stop=should_stop)[0]
+
+    def stream(
+        self,
+        system: str,
+        user_text: str,
+        max_new_tokens: int = 256,
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> Iterator[str]:
+        # Yields one text piece per decoded token; callers join and normalize at the end.
+        prompt = alpaca_prompt(system=system, instruction="Mask all PII:", input_text=user_text)
+        for chunk in self.ll.create_completion(
+            prompt=prompt,
+            temperature=0.0,
+            max_tokens=max_new_tokens,
+            stop=["</s>"],
+            stream=True,
+            stopping_criteria=self._stopping(should_stop),
+        ):
+            piece = chunk["choices"][0]["text"]
+            if piece:
+                yield piece
+        if should_stop is not None and should_stop():
+            raise GenerationCancelled()
@@ -0,0 +1,120 @@
+# src/pii_masking/infer/gguf_meta.py
+import mmap
+import os
+import struct
+from typing import BinaryIO
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF metadata value types -> struct format (scalars only)
+_SCALAR_FMT = {
+    0: "<B",   # uint8
+    1: "<b",   # int8
+    2: "<H",   # uint16
+    3: "<h",   # int16
+    4: "<I",   # uint32
+    5: "<i",   # int32
+    6: "<f",   # float32
+    7: "<?",   # bool
+    10: "<Q",  # uint64
+    11: "<q",  # int64
+    12: "<d",  # float64
+}
+_STRING = 8
+_ARRAY = 9
+
+# Arrays longer than this (tokenizer vocab, merges, scores) are skipped, not materialized.
+_MAX_ARRAY_KEEP = 64
+_U64 = struct.Struct("<Q")
+
+
+def _read(f: BinaryIO, fmt: str):
+    size = struct.calcsize(fmt)
+    buf = f.read(size)
+    if len(buf) != size:
+        raise ValueError("Truncated GGUF header")
+    return struct.unpack(fmt, buf)[0]
+
+
+def _read_str(f: BinaryIO) -> str:
+    n = _read(f, "<Q")
+    return f.read(n).decode("utf-8", errors="replace")
+
+
+def _skip_strings(f: BinaryIO, count: int) -> None:
+    # Walk the length prefixes without decoding or per-item reads; a tokenizer vocab or merges list
+    # has 10^5+ strings.
+    pos = f.tell()
+    unpack_from = _U64.unpack_from
+    try:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for _ in range(count):
+                pos += 8 + unpack_from(mm, pos)[0]
+    except struct.error:
+        raise ValueError("Truncated GGUF header") from None
+    f.seek(pos)
+
+
+def _read_value(f: BinaryIO, vtype: int):
+    if vtype in _SCALAR_FMT:
+        return _read(f, _SCALAR_FMT[vtype])
+    if vtype == _STRING:
+        return _read_str(f)
+    if vtype == _ARRAY:
+        item_type = _read(f, "<I")
+        count = _read(f, "<Q")
+        if item_type in _SCALAR_FMT and count > _MAX_ARRAY_KEEP:
+            f.seek(struct.calcsize(_SCALAR_FMT[item_type]) * count, os.SEEK_CUR)
+            return None
+        if item_type == _STRING and count > _MAX_ARRAY_KEEP:
+            _skip_strings(f, count)
+            return None
+        items = [_read_value(f, item_type) for _ in range(count)]
+        return items if count <= _MAX_ARRAY_KEEP else None
+    raise ValueError(f"Unknown GGUF value type: {vtype}")
+
+
+def read_gguf_metadata(path: str) -> dict:
+    """Key/value metadata from a GGUF header (tensor data is never read)."""
+    with open(path, "rb") as f:
+        if f.read(4) != GGUF_MAGIC:
+            raise ValueError(f"Not a GGUF file: {path}")
+        version = _read(f, "<I")
+        if version == 1:
+            _read(f, "<I")
+            n_kv = _read(f, "<I")
+        else:
+            _read(f, "<Q")
+            n_kv = _read(f, "<Q")
+        meta = {"gguf.version": version}
+        for _ in range(n_kv):
+            key = _read_str(f)
+            vtype = _read(f, "<I")
+            meta[key] = _read_value(f, vtype)
+    return meta
+
+
+def is_lora_adapter(meta: dict) -> bool:
+    """True for LoRA adapter GGUFs (convert_lora_to_gguf.py output), which need a base model to run."""
+    return meta.get("general.type") == "adapter" and meta.get("adapter.type", "lora") == "lora"
+
+
+def kv_cache_bytes(meta: dict, n_ctx: int, bytes_per_elem: int = 2) -> int:
+    arch = meta.get("general.architecture", "llama")
+    n_layer = int(meta.get(f"{arch}.block_count") or 0)
+    n_embd = int(meta.get(f"{arch}.embedding_length") or 0)
+    n_head = int(meta.get(f"{arch}.attention.head_count") or 0) or 1
+    n_head_kv = int(meta.get(f"{arch}.attention.head_count_kv") or n_head)
+    n_embd_kv = n_embd * n_head_kv // n_head
+    # K and V, one row per context position per layer.
+    return 2 * n_layer * n_ctx * n_embd_kv * bytes_per_elem
+
+
+def estimate_gguf_ram_bytes(path: str, n_ctx: int, overhead_bytes: int = 256 * 1024 * 1024) -> int:
+    """Weights (file size, fully paged in) + f16 KV cache for n_ctx + fixed compute-buffer overhead."""
+    size = os.path.getsize(path)
+    try:
+        kv = kv_cache_bytes(read_gguf_metadata(path), n_ctx)
+    except (OSError, ValueError):
+        kv = 0
+    return size + kv + overhead_bytes
@@ -1,10 +1,56 @@
+import os
+import threading
+from contextlib import nullcontext
+from typing import Callable, Iterator, Optional
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from pii_masking.infer.cancel import GenerationCancelled
 from pii_masking.utils.prompting import alpaca_prompt
 
+# CPU-only hosts. PII_HF_CPU_OPT=0 restores the plain float32/eager path.
+HF_CPU_OPT = os.getenv("PII_HF_CPU_OPT", "1") == "1"
+HF_CPU_INT8 = os.getenv("PII_HF_CPU_INT8", "1") == "1"
+HF_CPU_BF16 = os.getenv("PII_HF_CPU_BF16", "1") == "1"
+HF_CPU_COMPILE = os.getenv("PII_HF_CPU_COMPILE", "0") == "1"
+HF_CPU_THREADS = int(os.getenv("PII_HF_CPU_THREADS", "0"))
+
+
+def _cpu_threads() -> int:
+    # torch defaults to the host's physical cores and ignores cgroup/affinity limits.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _cpu_bf16_supported() -> bool:
+    mkldnn = getattr(torch.ops, "mkldnn", None)
+    probe = getattr(mkldnn, "_is_mkldnn_bf16_supported", None)
+    return bool(probe and probe())
+
+
+class _StopWhen(StoppingCriteria):
+    """Ends generate() for the whole batch once `should_stop()` is true; checked after every decode step."""
+
+    def __init__(self, should_stop: Callable[[], bool]):
+        self.should_stop = should_stop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), bool(self.should_stop()), dtype=torch.bool, device=input_ids.device)
+
+
 class HFModel:
-    def __init__(self, model_dir: str):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+    def __init__(
+        self,
+        model_dir: str,
+        device: str | None = None,
+        cpu_opt: bool | None = None,
+        int8: bool | None = None,
+        bf16: bool | None = None,
+        compile_static: bool | None = None,
+        threads: int | None = None,
+    ):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         if self.device == "cuda" and torch.cuda.is_bf16_supported():
             self.dtype = torch.bfloat16
         elif self.device == "cuda":
@@ -17,17 +63,54 @@ class HFModel:
         if self.tok.pad_token_id is None:
             self.tok.pad_token = self.tok.eos_token
 
+        cpu_opt = self.device == "cpu" and (HF_CPU_OPT if cpu_opt is None else cpu_opt)
         self.model = AutoModelForCausalLM.from_pretrained(
             model_dir,
             torch_dtype=self.dtype,
             device_map="auto" if self.device == "cuda" else None,
             low_cpu_mem_usage=True,
+            **({"attn_implementation": "sdpa"} if cpu_opt else {}),
         ).eval()
 
+        self.autocast = False
+        self.cpu_opts: dict = {}
         if self.device == "cpu":
             self.model = self.model.to("cpu")
+            if cpu_opt:
+                self._optimize_cpu(
+                    HF_CPU_INT8 if int8 is None else int8,
+                    HF_CPU_BF16 if bf16 is None else bf16,
+                    HF_CPU_COMPILE if compile_static is None else compile_static,
+                    threads or HF_CPU_THREADS or _cpu_threads(),
+                )
 
-    def generate(self, system: str, user_text: str, max_new_tokens: int = 256) -> str:
+    def _optimize_cpu(self, int8: bool, bf16: bool, compile_static: bool, threads: int) -> None:
+        """Dynamic int8 Linear layers (weights quantized once, activations per call) or, without int8,
+        bf16 autocast on CPUs with native bf16; optional static KV cache + torch.compile (not with int8)."""
+        torch.set_num_threads(threads)
+        if int8:
+            # quantized::linear_dynamic only takes float32 inputs, so int8 and bf16 autocast don't mix.
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif bf16 and _cpu_bf16_supported():
+            self.autocast = True
+        # Dynamo can't trace quantized::linear_dynamic, so int8 models stay eager.
+        compile_static = compile_static and not int8
+        if compile_static:
+            # A fixed-size cache keeps shapes stable across decode steps, so the graph compiles once per length.
+            self.model.generation_config.cache_implementation = "static"
+            self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=True)
+        self.cpu_opts = {
+            "threads": torch.get_num_threads(),
+            "attn": "sdpa",
+            "int8": int8,
+            "bf16_autocast": self.autocast,
+            "static_cache_compile": compile_static,
+        }
+
+    def _ctx(self):
+        return torch.autocast("cpu", dtype=torch.bfloat16) if self.autocast else nullcontext()
+
+    def _encode(self, system: str, user_text: str):
         # Match the training prompt format (alpaca) to avoid train/infer drift.
         prompt = alpaca_prompt(system=system, instruction="Mask all PII:", input_text=user_text)
 
@@ -37,16 +120,75 @@ class HFModel:
         if attention_mask is None:
             attention_mask = (input_ids != self.tok.pad_token_id).long()
         attention_mask = attention_mask.to(self.device)
+        return input_ids, attention_mask
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tok(text, add_special_tokens=False)["input_ids"])
+
+    def _generate_kwargs(self, input_ids, attention_mask, max_new_tokens: int, should_stop=None) -> dict:
+        return dict(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            temperature=0.0,
+            eos_token_id=self.tok.eos_token_id,
+            pad_token_id=self.tok.pad_token_id,
+            stopping_criteria=StoppingCriteriaList([_StopWhen(should_stop)] if should_stop is not None else []),
+        )
+
+    def complete(
+        self, system: str, user_text: str, max_new_tokens: int = 256, should_stop: Optional[Callable[[], bool]] = None
+    ) -> tuple[str, dict]:
+        """Like generate(), but also returns prompt/completion token counts (same shape as GGUFModel).
 
-        with torch.no_grad():
-            out = self.model.generate(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                max_new_tokens=max_new_tokens,
-                do_sample=False,
-                temperature=0.0,
-                eos_token_id=self.tok.eos_token_id,
-                pad_token_id=self.tok.pad_token_id,
-            )
+        Raises GenerationCancelled if `should_stop()` turned true while decoding.
+        """
+        input_ids, attention_mask = self._encode(system, user_text)
+        with torch.no_grad(), self._ctx():
+            out = self.model.generate(**self._generate_kwargs(input_ids, attention_mask, max_new_tokens, should_stop))
+        if should_stop is not None and should_stop():
+            raise GenerationCancelled()
         gen_ids = out[0, input_ids.shape[1]:]
-        return self.tok.decode(gen_ids, skip_special_tokens=True).strip()
+        usage = {"prompt_tokens": int(input_ids.shape[1]), "completion_tokens": int(gen_ids.shape[0])}
+        return self.tok.decode(gen_ids, skip_special_tokens=True).strip(), usage
+
+    def generate(self, system: str, user_text: str, max_new_tokens: int = 256, should_stop=None) -> str:
+        return self.complete(system, user_text, max_new_tokens=max_new_tokens, should_stop=should_stop)[0]
+
+    def stream(
+        self, system: str, user_text: str, max_new_tokens: int = 256, should_stop: Optional[Callable[[], bool]] = None
+    ) -> Iterator[str]:
+        input_ids, attention_mask = self._encode(system, user_text)
+        streamer = TextIteratorStreamer(self.tok, skip_prompt=True, skip_special_tokens=True)
+        closed = False
+        # Also stops the worker when the consumer closes this generator early.
+        kwargs = self._generate_kwargs(
+            input_ids, attention_mask, max_new_tokens, lambda: closed or (should_stop is not None and should_stop())
+        )
+        kwargs["streamer"] = streamer
+
+        errors: list[BaseException] = []
+
+        def _run():
+            try:
+                with torch.no_grad(), self._ctx():
+                    self.model.generate(**kwargs)
+            except BaseException as e:
+                # Without the end signal the consumer would wait on the streamer forever.
+                errors.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=_run, daemon=True)
+        worker.start()
+        try:
+            for piece in streamer:
+                if piece:
+                    yield piece
+        finally:
+            closed = True
+            worker.join()
+        if errors:
+            raise errors[0]
+        if should_stop is not None and should_stop():
+            raise GenerationCancelled()
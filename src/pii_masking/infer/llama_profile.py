@@ -0,0 +1,52 @@
+# src/pii_masking/infer/llama_profile.py
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+# Runtime knobs the autotuner sweeps; anything else in a profile is informational.
+TUNABLE = ("n_threads", "n_threads_batch", "n_batch", "n_ctx", "use_mmap", "use_mlock")
+
+DEFAULTS = {
+    "n_ctx": 2048,
+    "n_threads": None,  # llama.cpp default: cpu_count
+    "n_threads_batch": None,
+    "n_batch": 512,
+    "use_mmap": True,
+    "use_mlock": False,
+}
+
+
+def profile_path_for(gguf_path: str) -> Path:
+    """PII_LLAMA_PROFILE if set, else `<model>.gguf.tuned.json` next to the model."""
+    env = os.getenv("PII_LLAMA_PROFILE", "").strip()
+    if env:
+        return Path(env)
+    return Path(f"{gguf_path}.tuned.json")
+
+
+def load_profile(gguf_path: str) -> dict:
+    """Tuned llama.cpp params for this model, or {} when none was written (or PII_LLAMA_PROFILE=off)."""
+    if os.getenv("PII_LLAMA_PROFILE", "").strip().lower() in {"off", "0", "none"}:
+        return {}
+    p = profile_path_for(gguf_path)
+    if not p.is_file():
+        return {}
+    try:
+        payload = json.loads(p.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+    params = payload.get("params", payload)
+    return {k: params[k] for k in TUNABLE if params.get(k) is not None}
+
+
+def resolve_llama_params(gguf_path: str, profile: Optional[dict] = None, **explicit) -> dict:
+    """Explicit (non-None) args > tuned profile > DEFAULTS."""
+    out = dict(DEFAULTS)
+    out.update(load_profile(gguf_path) if profile is None else profile)
+    out.update({k: v for k, v in explicit.items() if v is not None})
+    if not out.get("n_threads"):
+        out["n_threads"] = os.cpu_count() or 4
+    if not out.get("n_threads_batch"):
+        out["n_threads_batch"] = out["n_threads"]
+    return out
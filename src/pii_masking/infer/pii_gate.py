@@ -0,0 +1,141 @@
+# src/pii_masking/infer/pii_gate.py
+import gzip
+import json
+import math
+import random
+import re
+import zlib
+from array import array
+from typing import Iterable, Optional
+
+from pii_masking.utils.align import TAG_RE, align_entities
+from pii_masking.utils.sentences import split_sentences
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SHAPE_RE = [(re.compile(r"[A-Z]+"), "X"), (re.compile(r"[a-z]+"), "x"), (re.compile(r"\d+"), "d")]
+
+
+def _shape(tok: str) -> str:
+    for rx, ch in _SHAPE_RE:
+        tok = rx.sub(ch, tok)
+    return tok
+
+
+def features(text: str, bits: int) -> list[int]:
+    """Hashed bag of word uni/bigrams, word shapes (Xx, d-d, x@x) and 3-char affixes.
+
+    crc32 rather than hash(): Python's string hash is salted per process, so buckets wouldn't survive a save.
+    """
+    mask = (1 << bits) - 1
+    toks = _TOKEN_RE.findall(text)
+    low = [t.lower() for t in toks]
+    shapes = [_shape(t) for t in toks]
+    feats = [f"w:{w}" for w in low]
+    feats += [f"s:{s}" for s in shapes]
+    feats += [f"b:{a} {b}" for a, b in zip(low, low[1:])]
+    feats += [f"sb:{a} {b}" for a, b in zip(shapes, shapes[1:])]
+    feats += [f"p:{w[:3]}" for w in low if len(w) > 3]
+    feats += [f"x:{w[-3:]}" for w in low if len(w) > 3]
+    return sorted({zlib.crc32(f.encode("utf-8")) & mask for f in feats})
+
+
+def labeled_sentences(source: str, target: str) -> Optional[list[tuple[str, int]]]:
+    """(sentence, 1 if it overlaps a PII span) for one source/target pair; None if the tags can't be aligned."""
+    entities = align_entities(source, target)
+    if len(entities) != len(TAG_RE.findall(target)):
+        return None
+    out, pos = [], 0
+    for sent, sep in split_sentences(source):
+        start, end = pos, pos + len(sent)
+        pos = end + len(sep)
+        if sent.strip():
+            out.append((sent, int(any(e["start"] < end and e["end"] > start for e in entities))))
+    return out
+
+
+class PIIGate:
+    """Hashed n-gram logistic regression scoring how likely a sentence is to contain PII.
+
+    Sentences scoring below `threshold` skip the LLM. The threshold is picked for recall
+    (see choose_threshold), so the gate mostly lets clean boilerplate through.
+    """
+
+    def __init__(self, bits: int = 20, threshold: float = 0.5):
+        self.bits = bits
+        self.threshold = threshold
+        self.bias = 0.0
+        self.weights = array("d", bytes(8 << bits))
+
+    def score(self, text: str) -> float:
+        z = self.bias + sum(self.weights[i] for i in features(text, self.bits))
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+    def flags(self, text: str) -> bool:
+        return self.score(text) >= self.threshold
+
+    def fit(self, data: list[tuple[str, int]], epochs: int = 3, lr: float = 0.2, seed: int = 42) -> None:
+        """Plain SGD on log loss; positives are reweighted to balance the classes."""
+        feats = [(features(s, self.bits), y) for s, y in data]
+        pos = sum(y for _f, y in feats) or 1
+        w_pos = max(1.0, (len(feats) - pos) / pos)
+        rng = random.Random(seed)
+        w = self.weights
+        for epoch in range(epochs):
+            rng.shuffle(feats)
+            step = lr / (1 + epoch)
+            for idx, y in feats:
+                z = self.bias + sum(w[i] for i in idx)
+                p = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+                g = (p - y) * (w_pos if y else 1.0) * step
+                self.bias -= g
+                for i in idx:
+                    w[i] -= g
+
+    def save(self, path: str) -> None:
+        payload = {
+            "bits": self.bits,
+            "threshold": self.threshold,
+            "bias": self.bias,
+            "weights": {str(i): round(v, 6) for i, v in enumerate(self.weights) if v},
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "PIIGate":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        gate = cls(bits=payload["bits"], threshold=payload["threshold"] if threshold is None else threshold)
+        gate.bias = payload["bias"]
+        for i, v in payload["weights"].items():
+            gate.weights[int(i)] = v
+        return gate
+
+
+def choose_threshold(scores: list[float], labels: list[int], target_recall: float = 0.99, ceiling: float = 0.5) -> float:
+    """Highest threshold whose recall on the PII-bearing sentences is still >= target_recall.
+
+    Capped at `ceiling` so a cleanly separated holdout doesn't push the cut up against the positives.
+    """
+    pos = sorted((s for s, y in zip(scores, labels) if y), reverse=True)
+    if not pos:
+        return ceiling
+    keep = max(1, math.ceil(target_recall * len(pos)))
+    return min(pos[keep - 1], ceiling)
+
+
+def gate_report(scores: list[float], labels: list[int], thresholds: Iterable[float]) -> list[dict]:
+    """Recall of the gate vs. share of sentences (= LLM calls) it skips, per threshold."""
+    n, pos = len(scores), sum(labels)
+    rows = []
+    for t in thresholds:
+        flagged = [y for s, y in zip(scores, labels) if s >= t]
+        tp = sum(flagged)
+        rows.append({
+            "threshold": round(t, 6),
+            "recall": tp / pos if pos else 1.0,
+            "precision": tp / len(flagged) if flagged else 1.0,
+            "llm_calls_saved": (n - len(flagged)) / n if n else 0.0,
+            "missed_pii_sentences": pos - tp,
+        })
+    return rows
@@ -0,0 +1,34 @@
+# src/pii_masking/infer/registry.py
+import importlib
+import time
+
+# name -> (module, class, label). Modules are imported only when the backend is selected,
+# so a GGUF-only run never pays for torch/transformers (and vice versa for llama_cpp).
+BACKENDS = {
+    "hf": ("pii_masking.infer.hf_infer", "HFModel", "HF merged (GPU)"),
+    "gguf": ("pii_masking.infer.gguf_infer", "GGUFModel", "GGUF quantized (CPU)"),
+}
+
+
+def parse_backends(spec: str) -> list[str]:
+    """'gguf,hf' -> ['gguf', 'hf'] (order kept, duplicates dropped)."""
+    names = list(dict.fromkeys(s.strip().lower() for s in spec.split(",") if s.strip()))
+    unknown = [n for n in names if n not in BACKENDS]
+    if unknown or not names:
+        raise ValueError(f"Unknown backend(s): {', '.join(unknown) or '<none>'} (choose from {', '.join(BACKENDS)})")
+    return names
+
+
+def backend_label(name: str) -> str:
+    return BACKENDS[name][2]
+
+
+def load_backend(name: str, *args, **kwargs):
+    """Import and construct backend `name`; returns (model, {"import_s": ..., "load_s": ...})."""
+    module, cls, _ = BACKENDS[name]
+    t0 = time.perf_counter()
+    mod = importlib.import_module(module)
+    t1 = time.perf_counter()
+    model = getattr(mod, cls)(*args, **kwargs)
+    t2 = time.perf_counter()
+    return model, {"import_s": t1 - t0, "load_s": t2 - t1}
@@ -0,0 +1,194 @@
+# src/pii_masking/infer/sentence_memo.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from pii_masking.utils.align import TAG_RE
+from pii_masking.utils.sentences import split_sentences
+
+_WS = re.compile(r"\s+")
+
+
+class SentenceStore:
+    """Persistent sentence -> redaction cache in SQLite.
+
+    Keys are sha256(namespace, sentence), so raw sentences (which may hold PII) are never written;
+    values are the model's redacted sentence. Least recently used rows are trimmed past `max_rows`.
+    """
+
+    def __init__(self, path: str, max_rows: int = 1_000_000):
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        self.max_rows = max_rows
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sentences (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sentences_last_used ON sentences(last_used)")
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @staticmethod
+    def key(namespace: str, sentence: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{sentence}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        if not keys:
+            return {}
+        out = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i: i + 500]
+                marks = ",".join("?" * len(chunk))
+                out.update(self._db.execute(f"SELECT key, value FROM sentences WHERE key IN ({marks})", chunk).fetchall())
+            if out:
+                self._db.executemany("UPDATE sentences SET last_used=? WHERE key=?", [(now, k) for k in out])
+        return out
+
+    def put_many(self, items: dict[str, str]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sentences(key, value, last_used) VALUES (?, ?, ?)",
+                [(k, v, now) for k, v in items.items()],
+            )
+            self._writes += len(items)
+            if self._writes >= 1000:
+                self._writes = 0
+                self._db.execute(
+                    "DELETE FROM sentences WHERE key IN "
+                    "(SELECT key FROM sentences ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sentences").fetchone()[0]
+
+
+def _batches(items: list[tuple[int, str]], count_tokens: Callable[[str], int], budget: int):
+    batch, used = [], 0
+    for i, s in items:
+        n = count_tokens(s) + 1
+        if batch and used + n > budget:
+            yield batch, used
+            batch, used = [], 0
+        batch.append((i, s))
+        used += n
+    if batch:
+        yield batch, used
+
+
+def _is_redaction_of(line: str, sentence: str) -> bool:
+    """True if `line` is `sentence` with some spans replaced by [TAG]s (whitespace ignored).
+
+    Each tag must cover at least one character, and a line of nothing but tags matches no sentence.
+    Literals are placed left to right with str.find, so the check is linear in the sentence length.
+    """
+    literals = [_WS.sub("", lit) for lit in TAG_RE.split(line)[::2]]
+    src = _WS.sub("", sentence)
+    if len(literals) == 1:
+        return literals[0] == src
+    if not any(literals) or not src.startswith(literals[0]):
+        return False
+    pos = len(literals[0])
+    for lit in literals[1:-1]:
+        found = src.find(lit, pos + 1)
+        if found < 0:
+            return False
+        pos = found + len(lit)
+    last = literals[-1]
+    return len(src) - len(last) > pos and src.endswith(last)
+
+
+def redact_by_sentence(
+    text: str,
+    redact: Callable[[str, int], str],
+    store: Optional[SentenceStore],
+    namespace: str,
+    normalize: Optional[Callable[[str, str], str]] = None,
+    gate: Optional[Callable[[str], bool]] = None,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    batch_tokens: int = 384,
+) -> tuple[str, dict]:
+    """Redact `text` one sentence at a time, reusing cached sentence redactions.
+
+    `redact(text, max_new_tokens) -> raw output` is the model call and `normalize(line, sentence)`
+    post-processes each output line. Uncached sentences are joined with newlines into prompts of at
+    most `batch_tokens` input tokens. A normalized line is only taken for its sentence if the text
+    around its tags reproduces that sentence; other sentences are redone one per call, and results
+    that still don't match are returned but not cached. Sentences `gate(sentence)` doesn't flag as
+    likely PII are kept verbatim.
+    Returns (normalized, {"sentences", "gated_sentences", "cached_sentences", "llm_calls", "reuse_ratio"}).
+    """
+    count_tokens = count_tokens or (lambda s: len(s) // 4 + 1)
+    normalize = normalize or (lambda line, _s: line.strip())
+    parts = split_sentences(text)
+    out = [s for s, _sep in parts]
+    todo = [(i, s) for i, (s, _sep) in enumerate(parts) if s.strip()]
+    n = len(todo)
+    if gate is not None:
+        todo = [(i, s) for i, s in todo if gate(s)]
+    gated = n - len(todo)
+
+    keys = {i: SentenceStore.key(namespace, s) for i, s in todo}
+    cached = store.get_many(list(set(keys.values()))) if store is not None else {}
+    misses = []
+    for i, s in todo:
+        if keys[i] in cached:
+            out[i] = cached[keys[i]]
+        else:
+            misses.append((i, s))
+
+    # Identical sentences within one request are redacted once.
+    seen: set[str] = set()
+    unique = []
+    for i, s in misses:
+        if keys[i] not in seen:
+            seen.add(keys[i])
+            unique.append((i, s))
+
+    llm_calls = 0
+    fresh: dict[str, str] = {}
+    unchecked: dict[str, str] = {}
+    for batch, used in _batches(unique, count_tokens, batch_tokens):
+        redo = batch
+        if len(batch) > 1:
+            llm_calls += 1
+            # Redaction mostly copies the input, so output length tracks input length.
+            lines = redact("\n".join(s for _i, s in batch), int(used * 1.5) + 32).strip().split("\n")
+            if len(lines) == len(batch):
+                redo = []
+                for (i, s), line in zip(batch, lines):
+                    line = normalize(line, s)
+                    if _is_redaction_of(line, s):
+                        fresh[keys[i]] = line
+                    else:
+                        redo.append((i, s))
+        for i, s in redo:
+            llm_calls += 1
+            line = normalize(redact(s, int((count_tokens(s) + 1) * 1.5) + 32), s)
+            (fresh if _is_redaction_of(line, s) else unchecked)[keys[i]] = line
+
+    for i, _s in misses:
+        out[i] = fresh.get(keys[i], unchecked.get(keys[i]))
+    if store is not None:
+        store.put_many(fresh)
+
+    reused = len(todo) - len(unique)
+    normalized = "".join(o + sep for o, (_s, sep) in zip(out, parts))
+    return normalized, {
+        "sentences": n,
+        "gated_sentences": gated,
+        "cached_sentences": len(todo) - len(misses),
+        "llm_calls": llm_calls,
+        "reuse_ratio": reused / n if n else 0.0,
+    }
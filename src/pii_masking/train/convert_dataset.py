@@ -3,7 +3,6 @@ import json
 import os
 import random
 from pathlib import Path
-from datasets import load_dataset
 from pii_masking.utils.tag_profiles import get_tag_profile, rewrite_bracketed_tags
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
@@ -19,6 +18,8 @@ SYSTEM_PROMPT = os.getenv(
 INSTRUCTION = "Mask all PII:"
 
 def main():
+    from datasets import load_dataset  # heavy; importers only need OUT / PROJECT_ROOT
+
     OUT.parent.mkdir(parents=True, exist_ok=True)
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -0,0 +1,210 @@
+# src/pii_masking/train/dedup_dataset.py
+"""Near-duplicate removal for convert_dataset output.
+
+ai4privacy rows are rendered from templates, so many differ only in their PII values. Each source
+text becomes a MinHash signature over word shingles (digit runs folded to 0, so "card 4532..." and
+"card 5521..." share shingles); LSH banding finds candidate pairs, candidates whose estimated Jaccard
+similarity reaches the threshold are merged, and only the first row of each cluster is kept.
+Signatures are computed once across --workers processes; every --report_thresholds value is then
+scored from them, and --threshold is the one written out. Kept rows keep their input order.
+
+    python -m pii_masking.train.convert_dataset
+    python -m pii_masking.train.dedup_dataset --threshold 0.85
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from pii_masking.train.convert_dataset import OUT
+
+DEDUP_OUT = OUT.with_name("pii_mask_dedup.jsonl")
+
+_WORD_RE = re.compile(r"\w+")
+_DIGIT_RE = re.compile(r"\d+")
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def shingle_hashes(text: str, k: int) -> np.ndarray:
+    """crc32 of each word k-gram of the normalized text (one shingle for texts shorter than k words)."""
+    words = _WORD_RE.findall(_DIGIT_RE.sub("0", text.lower()))
+    grams = {" ".join(words[i: i + k]) for i in range(max(1, len(words) - k + 1))}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def _permutations(num_perm: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    # a, b < 2**31 and hashes < 2**32, so a * h + b stays inside uint64.
+    rng = np.random.RandomState(seed)
+    return (
+        rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64),
+        rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64),
+    )
+
+
+def _signature_chunk(args) -> np.ndarray:
+    texts, num_perm, shingle, seed = args
+    a, b = _permutations(num_perm, seed)
+    out = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for i, text in enumerate(texts):
+        h = shingle_hashes(text, shingle)[:, None]
+        out[i] = (((h * a + b) % _MERSENNE) & _MAX_HASH).min(axis=0)
+    return out
+
+
+def minhash_signatures(texts: list[str], num_perm: int = 128, shingle: int = 3, seed: int = 42, workers: int = 1,
+                       chunk: int = 2048) -> np.ndarray:
+    """(len(texts), num_perm) uint32 MinHash signatures, computed in `workers` processes."""
+    jobs = [(texts[i: i + chunk], num_perm, shingle, seed) for i in range(0, len(texts), chunk)]
+    if workers <= 1 or len(jobs) <= 1:
+        parts = [_signature_chunk(j) for j in jobs]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            parts = pool.map(_signature_chunk, jobs)
+    return np.concatenate(parts) if parts else np.empty((0, num_perm), dtype=np.uint32)
+
+
+def lsh_params(threshold: float, num_perm: int, fn_weight: float = 0.7) -> tuple[int, int]:
+    """(bands, rows) whose S-curve 1 - (1 - s^rows)^bands best separates pairs at `threshold`.
+
+    Candidates are verified afterwards, so false negatives (never compared) cost more than false positives.
+    """
+    xs = [i / 200 for i in range(201)]
+
+    def cost(bands: int, rows: int) -> float:
+        p = [1 - (1 - x ** rows) ** bands for x in xs]
+        fp = sum(pi for x, pi in zip(xs, p) if x < threshold)
+        fn = sum(1 - pi for x, pi in zip(xs, p) if x >= threshold)
+        return ((1 - fn_weight) * fp + fn_weight * fn) / len(xs)
+
+    return min(((b, num_perm // b) for b in range(1, num_perm + 1)), key=lambda br: cost(*br))
+
+
+def _candidate_pairs(sig: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """(i, j) pairs, i < j, sharing at least one band.
+
+    Not every pair in a band bucket is returned: each row is paired only with the bucket's first
+    (lowest-index) row, which keeps the count linear in bucket size when thousands of template rows
+    share a band. Clustering is transitive, so rows that verify against that first row end up together;
+    two rows that are similar to each other but not to the first row are only paired if they also
+    share a band bucket that the first row is not in.
+    """
+    pairs = []
+    for band in range(bands):
+        cols = sig[:, band * rows: (band + 1) * rows].astype(np.uint64)
+        keys = np.zeros(len(sig), dtype=np.uint64)
+        for j in range(rows):
+            keys = (keys * np.uint64(0x100000001B3)) ^ cols[:, j]
+        order = np.argsort(keys, kind="stable")
+        sk = keys[order]
+        start = np.r_[True, sk[1:] != sk[:-1]]
+        first = order[start][np.cumsum(start) - 1]
+        dup = first != order
+        if dup.any():
+            pairs.append(np.stack([first[dup], order[dup]], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def near_duplicates(sig: np.ndarray, threshold: float, bands: int, rows: int) -> tuple[np.ndarray, int]:
+    """(bool mask of rows to drop, verified pair count): rows in a cluster with an earlier row are dropped."""
+    cand = _candidate_pairs(sig, bands, rows)
+    keep_pairs = []
+    for i in range(0, len(cand), 100_000):
+        c = cand[i: i + 100_000]
+        sim = (sig[c[:, 0]] == sig[c[:, 1]]).mean(axis=1)
+        keep_pairs.append(c[sim >= threshold])
+    verified = np.concatenate(keep_pairs) if keep_pairs else cand
+
+    parent = list(range(len(sig)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in verified.tolist():
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    drop = np.fromiter((find(i) != i for i in range(len(sig))), dtype=bool, count=len(sig))
+    return drop, len(verified)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="MinHash/LSH near-duplicate removal.")
+    ap.add_argument("--jsonl", default=str(OUT), help="convert_dataset output")
+    ap.add_argument("--out", default=str(DEDUP_OUT))
+    ap.add_argument("--threshold", type=float, default=float(os.getenv("PII_DEDUP_THRESHOLD", "0.85")),
+                    help="Estimated Jaccard similarity at which source texts count as duplicates")
+    ap.add_argument("--report_thresholds", default="0.7,0.8,0.85,0.9,0.95,1.0")
+    ap.add_argument("--num_perm", type=int, default=128)
+    ap.add_argument("--shingle", type=int, default=3, help="Words per shingle")
+    ap.add_argument("--workers", type=int, default=0, help="Signature processes (0 = all CPUs)")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    with open(args.jsonl, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    texts = [r["input"] for r in rows]
+    workers = args.workers or os.cpu_count() or 1
+
+    t0 = time.perf_counter()
+    sig = minhash_signatures(texts, args.num_perm, args.shingle, args.seed, workers)
+    sig_s = time.perf_counter() - t0
+
+    thresholds = sorted({float(t) for t in args.report_thresholds.split(",") if t.strip()} | {args.threshold})
+    by_threshold, drop = [], None
+    for t in thresholds:
+        bands, brows = lsh_params(t, args.num_perm)
+        t1 = time.perf_counter()
+        mask, pairs = near_duplicates(sig, t, bands, brows)
+        removed = int(mask.sum())
+        by_threshold.append({
+            "threshold": t,
+            "bands": bands,
+            "rows_per_band": brows,
+            "verified_pairs": pairs,
+            "removed": removed,
+            "removed_pct": removed / len(rows) if rows else 0.0,
+            "lsh_s": round(time.perf_counter() - t1, 2),
+        })
+        print(f"threshold={t:.2f} bands={bands}x{brows} removed={removed} ({by_threshold[-1]['removed_pct']:.1%})", flush=True)
+        if t == args.threshold:
+            drop = mask
+
+    kept = [r for r, d in zip(rows, drop) if not d]
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8") as f:
+        for r in kept:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    report = {
+        "jsonl": args.jsonl,
+        "out": str(out),
+        "rows_in": len(rows),
+        "rows_out": len(kept),
+        "threshold": args.threshold,
+        "num_perm": args.num_perm,
+        "shingle": args.shingle,
+        "workers": workers,
+        "signature_s": round(sig_s, 2),
+        "by_threshold": by_threshold,
+    }
+    report_path = out.with_name(out.stem + ".report.json")
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Saved {len(kept)}/{len(rows)} rows to {out} (threshold={args.threshold}; {report_path.name})")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,7 @@ else
 fi
 
 DATA_OUT="$PROJECT_ROOT/data/pii_mask.jsonl"
+DEDUP_OUT="$PROJECT_ROOT/data/pii_mask_dedup.jsonl"
 
 echo "🔍 Checking environment..."
 command -v python >/dev/null || { echo "❌ Python not found"; exit 1; }
@@ -37,12 +38,13 @@ run python - <<'PY'
 import importlib.util
 required = {
     "datasets": "datasets",
+    "numpy": "numpy",
     "axolotl.cli.preprocess": "axolotl",
 }
 missing = [name for mod, name in required.items() if importlib.util.find_spec(mod) is None]
 if missing:
     raise SystemExit("Missing required Python modules: " + ", ".join(sorted(set(missing))))
-print("✅ Python package check passed: datasets, axolotl")
+print("✅ Python package check passed: datasets, numpy, axolotl")
 PY
 
 echo "📘 Step 1: Convert dataset to Alpaca format..."
@@ -56,10 +58,17 @@ else
   run python -m pii_masking.train.convert_dataset
 fi
 
+echo "🧹 Step 1b: Remove near-duplicates (threshold ${PII_DEDUP_THRESHOLD:-0.85})..."
+if [[ -f "$DEDUP_OUT" && "$DEDUP_OUT" -nt "$DATA_OUT" && "${FORCE_REBUILD_DATA:-0}" != "1" ]]; then
+  echo "ℹ️  Deduplicated dataset already exists at $DEDUP_OUT (skipping)"
+else
+  run python -m pii_masking.train.dedup_dataset --jsonl "$DATA_OUT" --out "$DEDUP_OUT"
+fi
+
 run python - <<'PY'
 from pathlib import Path
 from hashlib import sha256
-p = Path("data/pii_mask.jsonl")
+p = Path("data/pii_mask_dedup.jsonl")
 if not p.exists():
     raise SystemExit(f"Missing dataset file: {p}")
 with p.open("rb") as f:
@@ -0,0 +1,63 @@
+# src/pii_masking/train/train_gate.py
+"""Train the sentence-level PII gate from convert_dataset output.
+
+Sentences are labeled by aligning each ai4privacy target back onto its source: a sentence is
+positive if any masked span overlaps it. The last --holdout pairs pick the threshold (highest one
+keeping --target_recall) and produce the recall vs. LLM-calls-saved report.
+
+    python -m pii_masking.train.convert_dataset
+    python -m pii_masking.train.train_gate --out outputs/pii_gate.json.gz
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from pii_masking.eval.data import load_jsonl_custom
+from pii_masking.eval.gate_eval import evaluate, labeled_from_pairs
+from pii_masking.infer.pii_gate import PIIGate, choose_threshold
+from pii_masking.train.convert_dataset import OUT, PROJECT_ROOT
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jsonl", default=str(OUT), help="convert_dataset output (input/output pairs)")
+    ap.add_argument("--out", default=str(PROJECT_ROOT / "outputs" / "pii_gate.json.gz"))
+    ap.add_argument("--max_pairs", type=int, default=50000)
+    ap.add_argument("--holdout", type=int, default=2000)
+    ap.add_argument("--target_recall", type=float, default=0.99)
+    ap.add_argument("--bits", type=int, default=20)
+    ap.add_argument("--epochs", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    pairs, _idxs = load_jsonl_custom(args.jsonl)
+    random.Random(args.seed).shuffle(pairs)
+    pairs = pairs[: args.max_pairs + args.holdout]
+    train, held = pairs[: -args.holdout], pairs[-args.holdout:]
+    train_data, skipped = labeled_from_pairs(train)
+    held_data, _ = labeled_from_pairs(held)
+    print(f"{len(train_data)} train sentences ({sum(y for _s, y in train_data)} with PII, {skipped} pairs unalignable)")
+
+    gate = PIIGate(bits=args.bits)
+    t0 = time.perf_counter()
+    gate.fit(train_data, epochs=args.epochs, seed=args.seed)
+    train_s = time.perf_counter() - t0
+
+    gate.threshold = choose_threshold([gate.score(s) for s, _y in held_data], [y for _s, y in held_data], args.target_recall)
+    report = {"jsonl": args.jsonl, "target_recall": args.target_recall, "train_s": round(train_s, 1), **evaluate(gate, held_data)}
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    gate.save(str(out))
+    report_path = out.with_name(out.name.removesuffix(".json.gz") + ".report.json")
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(
+        f"threshold={gate.threshold:.4f} recall={report['recall']:.4f} "
+        f"llm_calls_saved={report['llm_calls_saved']:.1%} -> {out} ({report_path.name})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# src/pii_masking/utils/align.py
+import re
+
+TAG_RE = re.compile(r"\[([A-Z0-9_]+)\]")
+_WS_RUN = re.compile(r"\s+|\S+")
+_WS = re.compile(r"\s+")
+
+
+def _compact(text: str):
+    """Collapse whitespace runs to one space, keeping compact->original offsets (len+1 entries)."""
+    parts, offs = [], []
+    for m in _WS_RUN.finditer(text):
+        s = m.group(0)
+        if s[0].isspace():
+            parts.append(" ")
+            offs.append(m.start())
+        else:
+            parts.append(s)
+            offs.extend(range(m.start(), m.end()))
+    offs.append(len(text))
+    return "".join(parts), offs
+
+
+def _split(redacted: str):
+    """literals[0] TAG[0] literals[1] TAG[1] ... literals[n]; literals are whitespace-compacted."""
+    literals, tags, pos = [], [], 0
+    for m in TAG_RE.finditer(redacted):
+        literals.append(_WS.sub(" ", redacted[pos:m.start()]))
+        tags.append(m.group(1))
+        pos = m.end()
+    literals.append(_WS.sub(" ", redacted[pos:]))
+    return literals, tags
+
+
+def _find_anchor(src: str, lit: str, cursor: int, last: bool):
+    """Position of `lit` in src at/after cursor, or (pos, matched_len) using a shorter prefix if the model edited it."""
+    if last:
+        stripped = lit.rstrip()
+        end = len(src.rstrip())
+        if stripped and src.endswith(stripped, cursor, end):
+            return end - len(stripped), len(stripped)
+    pos = src.find(lit, cursor)
+    if pos >= 0:
+        return pos, len(lit)
+    # The model may have altered non-PII text after the tag; anchor on the leading word(s) instead.
+    lead = lit[: len(lit) - len(lit.lstrip(" "))]
+    words = lit.strip(" ").split(" ")
+    for k in (3, 2, 1):
+        if k >= len(words):
+            continue
+        head = lead + " ".join(words[:k])
+        pos = src.find(head, cursor)
+        if pos >= 0:
+            return pos, len(head)
+    return -1, 0
+
+
+def _split_group(src: str, start: int, end: int, tags: list):
+    """Spread consecutive tags with no literal between them over the words of one span."""
+    if len(tags) == 1:
+        return [(tags[0], start, end)]
+    words = [(m.start() + start, m.end() + start) for m in re.finditer(r"\S+", src[start:end])]
+    if len(words) < len(tags):
+        return [(tags[0], start, end)]
+    out = [(t, words[i][0], words[i][1]) for i, t in enumerate(tags[:-1])]
+    out.append((tags[-1], words[len(tags) - 1][0], end))
+    return out
+
+
+def align_entities(source: str, redacted: str) -> list:
+    """Map each [TAG] in `redacted` back to the character range it replaced in `source`.
+
+    Walks both strings once, anchoring on the unchanged text between tags (whitespace
+    differences are ignored), so cost is linear in the input and output lengths.
+    Tags whose surrounding text cannot be located are left out.
+    """
+    literals, tags = _split(redacted)
+    if not tags:
+        return []
+    src, offs = _compact(source)
+
+    cursor = 0
+    lead = literals[0]
+    if lead.strip():
+        pos, n = _find_anchor(src, lead, 0, last=False)
+        if pos < 0:
+            return []
+        cursor = pos + n
+    elif src.startswith(" ") and not lead:
+        cursor = 1
+
+    spans = []
+    group: list = []
+    for i, tag in enumerate(tags):
+        group.append(tag)
+        lit = literals[i + 1]
+        last = i == len(tags) - 1
+        if not lit and not last:
+            continue
+        if lit:
+            pos, n = _find_anchor(src, lit, cursor, last=last)
+            if pos < 0:
+                break
+        else:
+            pos, n = len(src), 0
+        spans.extend(_split_group(src, cursor, pos, group))
+        group = []
+        cursor = pos + n
+
+    out = []
+    for tag, cs, ce in spans:
+        start, end = offs[cs], offs[ce]
+        while start < end and source[start].isspace():
+            start += 1
+        while end > start and source[end - 1].isspace():
+            end -= 1
+        if end > start:
+            out.append({"tag": tag, "start": start, "end": end})
+    return out
@@ -0,0 +1,84 @@
+# src/pii_masking/utils/compaction.py
+"""Reversible input compaction before redaction.
+
+compact() maps confusable characters (Unicode spaces, zero-width characters, smart quotes, dashes,
+full-width ASCII) to plain ones and collapses whitespace runs to one space (one newline if the run
+had a line break), keeping the source offset of every compacted character. The model then reads and
+echoes fewer tokens. project() puts a redaction of the compacted text back onto the original: each
+[TAG] replaces its span of the original text, and everything else is kept exactly as it was.
+"""
+from typing import Optional
+
+from pii_masking.utils.align import TAG_RE, align_entities
+
+_CONFUSABLES = {
+    **{c: " " for c in "\u00a0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u202f\u205f\u3000"},
+    **{c: "" for c in "\u00ad\u180e\u200b\u200c\u200d\u2060\ufeff"},
+    **{c: "'" for c in "\u2018\u2019\u201a\u201b\u2032"},
+    **{c: '"' for c in "\u201c\u201d\u201e\u201f\u2033"},
+    **{c: "-" for c in "\u2010\u2011\u2012\u2013\u2014\u2015\u2212"},
+    "\u2026": "...",
+    # Full-width ASCII (U+FF01 .. U+FF5E).
+    **{chr(c): chr(c - 0xFEE0) for c in range(0xFF01, 0xFF5F)},
+}
+_NEWLINES = "\n\r\x0b\x0c\x85\u2028\u2029"
+
+
+class Compacted:
+    """`text` is the compacted form of `original`; `offsets[i]` is the index in `original` that text[i] came from."""
+
+    def __init__(self, original: str, text: str, offsets: list[int]):
+        self.original = original
+        self.text = text
+        self.offsets = offsets
+
+    def span(self, start: int, end: int) -> tuple[int, int]:
+        """Original range covering text[start:end] (end > start)."""
+        return self.offsets[start], self.offsets[end - 1] + 1
+
+
+def compact(text: str) -> Compacted:
+    out: list[str] = []
+    offs: list[int] = []
+    run_start = None
+    run_newline = False
+    for i, ch in enumerate(text):
+        rep = _CONFUSABLES.get(ch, ch)
+        if not rep:
+            continue
+        if rep.isspace():
+            if run_start is None:
+                run_start, run_newline = i, False
+            run_newline = run_newline or ch in _NEWLINES
+            continue
+        if run_start is not None:
+            # Leading whitespace is dropped; trailing runs never get here.
+            if out:
+                out.append("\n" if run_newline else " ")
+                offs.append(run_start)
+            run_start = None
+        for c in rep:
+            out.append(c)
+            offs.append(i)
+    return Compacted(text, "".join(out), offs)
+
+
+def project(comp: Compacted, redacted: str) -> Optional[tuple[str, list[dict]]]:
+    """(original text with each tagged span replaced by its [TAG], entities in original offsets).
+
+    None if any tag in `redacted` can't be located in the compacted text: substituting only some
+    spans would put unredacted PII back, so callers keep the compacted redaction instead.
+    """
+    spans = align_entities(comp.text, redacted)
+    if len(spans) != len(TAG_RE.findall(redacted)):
+        return None
+    parts, entities, pos = [], [], 0
+    for e in spans:
+        start, end = comp.span(e["start"], e["end"])
+        if start < pos:
+            return None
+        parts += [comp.original[pos:start], f"[{e['tag']}]"]
+        entities.append({"tag": e["tag"], "start": start, "end": end})
+        pos = end
+    parts.append(comp.original[pos:])
+    return "".join(parts), entities
@@ -0,0 +1,89 @@
+# src/pii_masking/utils/drain.py
+import re
+from collections import OrderedDict
+
+WILDCARD = "<*>"
+_TOKEN_RE = re.compile(r"\S+")
+_HAS_DIGIT = re.compile(r"\d")
+
+
+def tokenize(text: str) -> list[tuple[str, int, int]]:
+    """Whitespace tokens with their character offsets, so templates can be mapped back onto the text."""
+    return [(m.group(0), m.start(), m.end()) for m in _TOKEN_RE.finditer(text)]
+
+
+class Cluster:
+    __slots__ = ("id", "template", "size", "version")
+
+    def __init__(self, cid: int, tokens: list[str]):
+        self.id = cid
+        self.template = list(tokens)
+        self.size = 1
+        # Bumped whenever a constant position turns into a wildcard.
+        self.version = 0
+
+    def similarity(self, tokens: list[str]) -> float:
+        same = sum(1 for t, m in zip(self.template, tokens) if t != WILDCARD and t == m)
+        return same / len(tokens) if tokens else 1.0
+
+    def merge(self, tokens: list[str]) -> None:
+        changed = False
+        for i, (t, m) in enumerate(zip(self.template, tokens)):
+            if t != WILDCARD and t != m:
+                self.template[i] = WILDCARD
+                changed = True
+        if changed:
+            self.version += 1
+        self.size += 1
+
+
+class Drain:
+    """Drain online log parser (He et al., 2017): a fixed-depth tree keyed on token count and the
+    first few tokens routes each message to a small leaf of candidate templates.
+
+    Tokens containing digits never become tree keys, so ids and timestamps don't fan the tree out.
+    At most `max_clusters` templates are kept; the least recently matched one is dropped.
+    """
+
+    def __init__(self, depth: int = 4, sim_threshold: float = 0.5, max_children: int = 100, max_clusters: int = 1000):
+        self.depth = max(3, depth)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.root: dict = {}
+        self.clusters: "OrderedDict[int, Cluster]" = OrderedDict()
+        self._next_id = 1
+
+    def _leaf(self, tokens: list[str]) -> list:
+        node = self.root.setdefault(len(tokens), {})
+        for tok in tokens[: self.depth - 2]:
+            key = WILDCARD if _HAS_DIGIT.search(tok) else tok
+            if key not in node:
+                key = key if len(node) < self.max_children else WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault(None, [])
+
+    def add(self, tokens: list[str]) -> Cluster:
+        """Route `tokens` to its template, creating or generalizing one as needed."""
+        leaf = self._leaf(tokens)
+        best, best_sim = None, -1.0
+        for cid in leaf:
+            c = self.clusters.get(cid)
+            if c is None:
+                continue
+            sim = c.similarity(tokens)
+            if sim > best_sim:
+                best, best_sim = c, sim
+        if best is not None and best_sim >= self.sim_threshold:
+            best.merge(tokens)
+            self.clusters.move_to_end(best.id)
+            return best
+
+        c = Cluster(self._next_id, tokens)
+        self._next_id += 1
+        leaf[:] = [cid for cid in leaf if cid in self.clusters]
+        leaf.append(c.id)
+        self.clusters[c.id] = c
+        while len(self.clusters) > self.max_clusters:
+            self.clusters.popitem(last=False)
+        return c
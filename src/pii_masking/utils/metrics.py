@@ -2,6 +2,8 @@
 import re
 from collections import defaultdict, Counter
 
+import numpy as np
+
 TAG_RE = re.compile(r"\[([A-Z0-9_]+)\]")
 
 # minimal alias map; expand if needed
@@ -55,7 +57,48 @@ def per_tag_prf(ref_seq, pred_seq):
         rows.append((t, p, r, f1, tp, fp, fn))
     return rows
 
-def aggregate_prf(rows):
+def _ratio(num, den):
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+def bootstrap_prf(tp, fp, fn, n_boot: int = 1000, alpha: float = 0.05, seed: int = 0, chunk: int = 100):
+    """Percentile bootstrap CIs for aggregate_prf's metrics, resampling examples.
+
+    tp/fp/fn are (n_examples, n_tags) count matrices. Each replicate is a multinomial draw of example
+    weights, so a block of replicates is one matrix product. Returns {metric: (lo, hi)}.
+    """
+    n = tp.shape[0]
+    rng = np.random.default_rng(seed)
+    counts = np.stack([tp, fp, fn]).astype(np.float64)
+    samples = {k: [] for k in ("macro_p", "macro_r", "macro_f1", "micro_p", "micro_r", "micro_f1")}
+    for start in range(0, n_boot, chunk):
+        w = rng.multinomial(n, np.full(n, 1.0 / n), size=min(chunk, n_boot - start)).astype(np.float64)
+        # (B, T) per-tag totals; tags absent from a replicate don't count towards its macro average.
+        btp, bfp, bfn = w @ counts[0], w @ counts[1], w @ counts[2]
+        p, r = _ratio(btp, btp + bfp), _ratio(btp, btp + bfn)
+        f1 = _ratio(2 * p * r, p + r)
+        present = (btp + bfp + bfn) > 0
+        n_present = np.maximum(1, present.sum(axis=1))
+        samples["macro_p"].append((p * present).sum(axis=1) / n_present)
+        samples["macro_r"].append((r * present).sum(axis=1) / n_present)
+        samples["macro_f1"].append((f1 * present).sum(axis=1) / n_present)
+        ttp, tfp, tfn = btp.sum(axis=1), bfp.sum(axis=1), bfn.sum(axis=1)
+        mp, mr = _ratio(ttp, ttp + tfp), _ratio(ttp, ttp + tfn)
+        samples["micro_p"].append(mp)
+        samples["micro_r"].append(mr)
+        samples["micro_f1"].append(_ratio(2 * mp * mr, mp + mr))
+    out = {}
+    for k, parts in samples.items():
+        lo, hi = np.quantile(np.concatenate(parts), [alpha / 2, 1 - alpha / 2])
+        out[k] = (float(lo), float(hi))
+    return out
+
+def aggregate_prf(rows, example_ids=None, n_examples: int | None = None, n_boot: int = 1000, alpha: float = 0.05,
+                  seed: int = 0):
+    """Macro/micro P/R/F1 over per_tag_prf rows.
+
+    With `example_ids` (the example each row came from, 0..n_examples-1) every metric also gets a
+    `<metric>_ci` [lo, hi] (1 - alpha) bootstrap interval over examples.
+    """
     if not rows:
         return {"macro_p": 0.0, "macro_r": 0.0, "macro_f1": 0.0, "micro_p": 0.0, "micro_r": 0.0, "micro_f1": 0.0}
 
@@ -87,7 +130,7 @@ def aggregate_prf(rows):
     micro_r = tp_all / (tp_all + fn_all) if (tp_all + fn_all) else 0.0
     micro_f1 = 2 * micro_p * micro_r / (micro_p + micro_r) if (micro_p + micro_r) else 0.0
 
-    return {
+    out = {
         "macro_p": macro_p,
         "macro_r": macro_r,
         "macro_f1": macro_f1,
@@ -95,6 +138,16 @@ def aggregate_prf(rows):
         "micro_r": micro_r,
         "micro_f1": micro_f1,
     }
+    if example_ids is not None and n_boot > 0:
+        tags = {t: j for j, t in enumerate(sorted(per_tag))}
+        n = n_examples if n_examples is not None else max(example_ids) + 1
+        mats = np.zeros((3, n, len(tags)))
+        for (tag, _p, _r, _f1, tp, fp, fn), e in zip(rows, example_ids):
+            mats[:, e, tags[tag]] += (tp, fp, fn)
+        for k, (lo, hi) in bootstrap_prf(*mats, n_boot=n_boot, alpha=alpha, seed=seed).items():
+            out[f"{k}_ci"] = [lo, hi]
+        out["bootstrap"] = {"n_boot": n_boot, "alpha": alpha, "n_examples": n}
+    return out
 
 def print_confusion(conf, title):
     print(f"\n=== Confusion: {title} ===")
@@ -0,0 +1,30 @@
+# src/pii_masking/utils/sentences.py
+import re
+
+# Sentence ends: terminal punctuation followed by whitespace, or any line break.
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+_ABBREV = {"mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "no", "vs", "etc", "e.g", "i.e", "inc", "ltd", "co", "apt"}
+
+
+def split_sentences(text: str) -> list[tuple[str, str]]:
+    """Split into (sentence, separator) pairs; "".join(s + sep) reproduces `text` exactly.
+
+    Common abbreviations ("Dr. Smith") don't end a sentence, so names aren't cut in half.
+    """
+    out: list[tuple[str, str]] = []
+    start = 0
+    for m in _BOUNDARY.finditer(text):
+        if "\n" not in m.group(0):
+            words = text[start: m.start()].split()
+            if words and words[-1].rstrip(".!?").lower() in _ABBREV:
+                continue
+        if m.start() > start:
+            out.append((text[start: m.start()], m.group(0)))
+        elif out:
+            out[-1] = (out[-1][0], out[-1][1] + m.group(0))
+        else:
+            out.append(("", m.group(0)))
+        start = m.end()
+    if start < len(text) or not out:
+        out.append((text[start:], ""))
+    return out
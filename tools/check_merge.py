@@ -0,0 +1,99 @@
+# tools/check_merge.py
+"""Bit-for-bit check of merge.py --streaming against PEFT's merge_and_unload on a tiny random model.
+
+Builds a 2-layer Mistral saved in several shards and a LoRA adapter over every linear projection
+with a per-module rank, an rsLoRA variant and a modules_to_save copy of lm_head (also rewritten into
+the older `<module>.modules_to_save.<adapter>.weight` key layout). Each adapter is then merged both
+ways in float32 and bfloat16, and the check fails unless compare_dirs finds no differing tensor.
+
+    PYTHONPATH=src:. python -m tools.check_merge
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+import torch
+from peft import LoraConfig, PeftModel, get_peft_model
+from safetensors.torch import load_file, save_file
+from transformers import AutoModelForCausalLM, MistralConfig, MistralForCausalLM
+
+from tools.merge import DTYPES, compare_dirs, merge_streaming
+
+PROJ = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+
+
+def build_base(out: Path, seed: int) -> None:
+    torch.manual_seed(seed)
+    cfg = MistralConfig(vocab_size=256, hidden_size=64, intermediate_size=160, num_hidden_layers=2,
+                        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256)
+    MistralForCausalLM(cfg).save_pretrained(str(out), max_shard_size="100KB")
+
+
+def build_adapter(base: Path, out: Path, seed: int, **lora) -> None:
+    torch.manual_seed(seed)
+    model = AutoModelForCausalLM.from_pretrained(str(base), torch_dtype=torch.float32)
+    # init_lora_weights=False: random A and B, so every delta is non-zero.
+    cfg = LoraConfig(r=8, lora_alpha=16, target_modules=PROJ, modules_to_save=["lm_head"], init_lora_weights=False, **lora)
+    peft = get_peft_model(model, cfg)
+    with torch.no_grad():
+        peft.base_model.model.lm_head.modules_to_save["default"].weight.add_(0.01)
+    peft.save_pretrained(str(out))
+
+
+def legacy_keys(adapter: Path, out: Path) -> None:
+    """Copy of `adapter` with modules_to_save weights under their older key names."""
+    out.mkdir(parents=True)
+    sd = load_file(str(adapter / "adapter_model.safetensors"))
+    sd = {k if "lora_" in k else k.replace(".weight", ".modules_to_save.default.weight"): v for k, v in sd.items()}
+    save_file(sd, str(out / "adapter_model.safetensors"))
+    (out / "adapter_config.json").write_text((adapter / "adapter_config.json").read_text())
+
+
+def peft_merge(base: Path, adapter: Path, out: Path, dtype: torch.dtype) -> None:
+    model = AutoModelForCausalLM.from_pretrained(str(base), torch_dtype=dtype)
+    with torch.inference_mode():
+        merged = PeftModel.from_pretrained(model, str(adapter)).merge_and_unload()
+    merged.save_pretrained(str(out), safe_serialization=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check merge.py --streaming against PEFT merge_and_unload.")
+    ap.add_argument("--workdir", help="Keep the models here (default: a temporary dir)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(args.workdir or tmp)
+        base = work / "base"
+        build_base(base, args.seed)
+        shards = json.loads((base / "model.safetensors.index.json").read_text())["weight_map"].values()
+        adapters = {
+            "lora": {"rank_pattern": {"down_proj": 4}, "alpha_pattern": {"o_proj": 32}},
+            "rslora": {"use_rslora": True},
+        }
+        for name, lora in adapters.items():
+            build_adapter(base, work / name, args.seed + 1, **lora)
+        legacy_keys(work / "lora", work / "lora_legacy_keys")
+        adapters["lora_legacy_keys"] = {}
+
+        failed = 0
+        for name in adapters:
+            for dtype_name in ("float32", "bfloat16"):
+                dtype = DTYPES[dtype_name]
+                ref = work / f"{name}_{dtype_name}_peft"
+                out = work / f"{name}_{dtype_name}_streaming"
+                # The legacy copy has the same weights, so PEFT merges the original adapter for it.
+                peft_merge(base, work / name.removesuffix("_legacy_keys"), ref, dtype)
+                merge_streaming(base, work / name, out, dtype)
+                diffs = compare_dirs(out, ref)
+                failed += bool(diffs)
+                status = "bit-identical" if not diffs else f"{len(diffs)} tensors differ, e.g. {diffs[0]}"
+                print(f"{name:18s} {dtype_name:9s} ({len(set(shards))} base shards): {status}")
+        if failed:
+            raise SystemExit(f"❌ {failed} merges differ from PEFT")
+        print("✅ streaming merge matches PEFT merge_and_unload")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
 # tools/merge.py
-import os, shutil, time
+import os, json, re, shutil, time
 from pathlib import Path
 import argparse
 import torch
+from safetensors import safe_open
+from safetensors.torch import load_file, save_file
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from peft import PeftModel
-from pii_masking.config.config import BASE_MODEL, DEFAULT_HF_DIR
+# config is optional; fall back if not present
+try:
+    from pii_masking.config.config import BASE_MODEL, DEFAULT_HF_DIR
+except Exception:
+    BASE_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+    DEFAULT_HF_DIR = "outputs/pii_masking_mistral_english_basic_v1/merged_pii_model"
 
 def is_adapter_dir(p: Path) -> bool:
     return (p / "adapter_config.json").is_file() and any(
@@ -27,28 +34,141 @@ def find_newest_adapter(root: Path) -> Path:
     cands.sort(reverse=True)
     return cands[0][1]
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--base_model", default=BASE_MODEL)
-    ap.add_argument("--root", default=str(Path(DEFAULT_HF_DIR).parent))
-    ap.add_argument("--out", default=DEFAULT_HF_DIR)
-    args = ap.parse_args()
+DTYPES = {"float32": torch.float32, "bfloat16": torch.bfloat16, "float16": torch.float16}
+_PEFT_PREFIX = "base_model.model."
+_LORA_KEY = re.compile(r"^(?P<module>.+)\.lora_(?P<ab>[AB])\.weight$")
+# Older PEFT versions save modules_to_save copies as <module>.modules_to_save[.<adapter>].weight.
+_SAVED_COPY = re.compile(r"\.modules_to_save(?:\.[^.]+)?(?=\.[^.]+$)")
 
-    ROOT = Path(args.root)
-    OUT = Path(args.out)
-    ADAPTER = find_newest_adapter(ROOT)
-    print(f"Using adapter: {ADAPTER} (modified {time.ctime(ADAPTER.stat().st_mtime)})")
+def _pattern_value(pattern: dict, module: str, default):
+    # PEFT rank_pattern/alpha_pattern keys match a module name suffix.
+    for key, value in pattern.items():
+        if module == key or module.endswith("." + key):
+            return value
+    return default
 
-    tok_src = ADAPTER if (ADAPTER / "tokenizer_config.json").is_file() else args.base_model
-    tok = AutoTokenizer.from_pretrained(tok_src, use_fast=True)
-    print(f"Loaded tokenizer from: {tok_src}")
+def load_lora(adapter: Path) -> tuple[dict, dict]:
+    """({base weight key: (A, B, scaling, fan_in_fan_out)}, {base key: replacement tensor}) from a PEFT LoRA dir.
+
+    Replacements are modules_to_save weights (saved whole, not as deltas).
+    """
+    cfg = json.loads((adapter / "adapter_config.json").read_text())
+    if cfg.get("peft_type", "LORA") != "LORA" or cfg.get("use_dora") or cfg.get("bias", "none") != "none":
+        raise SystemExit("--streaming only merges plain LoRA adapters (no DoRA, no trained biases); use the default mode")
+    st = adapter / "adapter_model.safetensors"
+    sd = load_file(str(st)) if st.is_file() else torch.load(adapter / "adapter_model.bin", map_location="cpu")
+
+    pairs, replaced = {}, {}
+    for key, t in sd.items():
+        key = key.removeprefix(_PEFT_PREFIX)
+        m = _LORA_KEY.match(key)
+        if m:
+            pairs.setdefault(m["module"], {})[m["ab"]] = t
+        elif "lora_" in key:
+            raise SystemExit(f"--streaming can't merge {key} (embedding LoRA / magnitude vectors); use the default mode")
+        else:
+            replaced[_SAVED_COPY.sub("", key)] = t
+
+    deltas = {}
+    for module, ab in pairs.items():
+        r = _pattern_value(cfg.get("rank_pattern") or {}, module, cfg["r"])
+        alpha = _pattern_value(cfg.get("alpha_pattern") or {}, module, cfg["lora_alpha"])
+        scaling = alpha / (r ** 0.5) if cfg.get("use_rslora") else alpha / r
+        deltas[module + ".weight"] = (ab["A"], ab["B"], scaling, bool(cfg.get("fan_in_fan_out")))
+    return deltas, replaced
+
+def merged_tensor(w: torch.Tensor, lora: tuple, dtype: torch.dtype) -> torch.Tensor:
+    # Same arithmetic as PEFT's merge_and_unload on CPU: the base weight is loaded in `dtype`, while the
+    # adapter weights stay fp32 (autocast_adapter_dtype), so `weight += delta` adds the rounded base
+    # and the fp32 delta in fp32 and rounds the sum back to `dtype`. tools/check_merge.py verifies this.
+    a, b, scaling, fan_in_fan_out = lora
+    delta = (b.to(torch.float32) @ a.to(torch.float32))
+    if fan_in_fan_out:
+        delta = delta.T
+    return (w.to(dtype).to(torch.float32) + delta * scaling).to(dtype)
+
+def base_model_dir(base_model: str) -> Path:
+    if Path(base_model).is_dir():
+        return Path(base_model)
+    from huggingface_hub import snapshot_download
+    return Path(snapshot_download(base_model, allow_patterns=["*.json", "*.safetensors", "tokenizer*"]))
+
+def merge_streaming(base_dir: Path, adapter: Path, out: Path, dtype: torch.dtype) -> dict:
+    """Merge shard by shard: only one base shard (plus the adapter) is in memory at a time.
+
+    Output shards keep the base model's shard names.
+    """
+    index = base_dir / "model.safetensors.index.json"
+    if index.is_file():
+        shards = sorted(set(json.loads(index.read_text())["weight_map"].values()))
+    elif (base_dir / "model.safetensors").is_file():
+        shards = ["model.safetensors"]
+    else:
+        raise SystemExit(f"--streaming needs safetensors shards in {base_dir}")
+    deltas, replaced = load_lora(adapter)
+    pending = set(deltas) | set(replaced)
+
+    out.mkdir(parents=True, exist_ok=True)
+    weight_map, total = {}, 0
+    for i, shard in enumerate(shards, 1):
+        t0 = time.perf_counter()
+        tensors = {}
+        with safe_open(str(base_dir / shard), framework="pt") as f:
+            for key in f.keys():
+                w = f.get_tensor(key)
+                if key in deltas:
+                    w = merged_tensor(w, deltas[key], dtype)
+                elif key in replaced:
+                    w = replaced[key]
+                tensors[key] = w.to(dtype) if w.is_floating_point() else w
+                pending.discard(key)
+                weight_map[key] = shard
+                total += tensors[key].numel() * tensors[key].element_size()
+        save_file(tensors, str(out / shard), metadata={"format": "pt"})
+        del tensors
+        print(f"[{i}/{len(shards)}] {shard} ({time.perf_counter() - t0:.1f}s)")
+    if pending:
+        raise SystemExit(f"Adapter weights with no matching base tensor: {sorted(pending)[:5]}")
+    if len(shards) > 1:
+        (out / "model.safetensors.index.json").write_text(
+            json.dumps({"metadata": {"total_size": total}, "weight_map": weight_map}, indent=2)
+        )
 
+    for name in ("config.json", "generation_config.json"):
+        if (base_dir / name).is_file():
+            cfg = json.loads((base_dir / name).read_text())
+            for k in ("torch_dtype", "dtype"):
+                if k in cfg:
+                    cfg[k] = str(dtype).removeprefix("torch.")
+            (out / name).write_text(json.dumps(cfg, indent=2))
+    return {"shards": len(shards), "merged": len(deltas), "replaced": len(replaced), "bytes": total}
+
+def compare_dirs(a: Path, b: Path) -> list[str]:
+    """Tensors that differ (name, dtype, shape or any bit) between two safetensors model dirs."""
+    def tensors(d: Path) -> dict:
+        out = {}
+        for f in sorted(d.glob("*.safetensors")):
+            with safe_open(str(f), framework="pt") as sf:
+                out.update({k: (f, k) for k in sf.keys()})
+        return out
+
+    ta, tb = tensors(a), tensors(b)
+    diffs = [f"only in {a}: {k}" for k in sorted(ta.keys() - tb.keys())]
+    diffs += [f"only in {b}: {k}" for k in sorted(tb.keys() - ta.keys())]
+    for k in sorted(ta.keys() & tb.keys()):
+        with safe_open(str(ta[k][0]), framework="pt") as fa, safe_open(str(tb[k][0]), framework="pt") as fb:
+            x, y = fa.get_tensor(k), fb.get_tensor(k)
+        if x.dtype != y.dtype or x.shape != y.shape or not torch.equal(x.view(torch.uint8), y.view(torch.uint8)):
+            diffs.append(f"differs: {k}")
+    return diffs
+
+def merge_in_memory(base_model: str, ADAPTER: Path, OUT: Path):
     use_cuda = torch.cuda.is_available()
     dtype = torch.bfloat16 if use_cuda else torch.float32
 
     print("Loading base...")
     base = AutoModelForCausalLM.from_pretrained(
-        args.base_model,
+        base_model,
         torch_dtype=dtype,
         device_map="auto" if use_cuda else None,
         low_cpu_mem_usage=True,
@@ -62,6 +182,34 @@ def main():
     OUT.mkdir(parents=True, exist_ok=True)
     print("Saving merged model…")
     merged.save_pretrained(str(OUT), safe_serialization=True, max_shard_size="2GB")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base_model", default=BASE_MODEL)
+    ap.add_argument("--root", default=str(Path(DEFAULT_HF_DIR).parent))
+    ap.add_argument("--out", default=DEFAULT_HF_DIR)
+    ap.add_argument("--streaming", action="store_true",
+                    help="Merge shard by shard without loading the model (peak memory ~ one shard)")
+    ap.add_argument("--dtype", choices=sorted(DTYPES), default="float32",
+                    help="--streaming output dtype (float32 matches the default CPU merge)")
+    ap.add_argument("--compare", metavar="DIR", help="After merging, check every tensor in --out is bit-identical to DIR's")
+    args = ap.parse_args()
+
+    ROOT = Path(args.root)
+    OUT = Path(args.out)
+    ADAPTER = find_newest_adapter(ROOT)
+    print(f"Using adapter: {ADAPTER} (modified {time.ctime(ADAPTER.stat().st_mtime)})")
+
+    tok_src = ADAPTER if (ADAPTER / "tokenizer_config.json").is_file() else args.base_model
+    tok = AutoTokenizer.from_pretrained(tok_src, use_fast=True)
+    print(f"Loaded tokenizer from: {tok_src}")
+
+    if args.streaming:
+        print("Merging LoRA -> base shard by shard…")
+        stats = merge_streaming(base_model_dir(args.base_model), ADAPTER, OUT, DTYPES[args.dtype])
+        print(f"Merged {stats['merged']} LoRA weights over {stats['shards']} shards ({stats['bytes'] / 1e9:.2f} GB)")
+    else:
+        merge_in_memory(args.base_model, ADAPTER, OUT)
     tok.save_pretrained(str(OUT))
 
     tmpl = ADAPTER / "chat_template.jinja"
@@ -71,5 +219,13 @@ def main():
 
     print(f"✅ Saved merged model to: {OUT}")
 
+    if args.compare:
+        diffs = compare_dirs(OUT, Path(args.compare))
+        for d in diffs[:20]:
+            print(d)
+        if diffs:
+            raise SystemExit(f"❌ {len(diffs)} tensors differ from {args.compare}")
+        print(f"✅ Bit-identical to {args.compare}")
+
 if __name__ == "__main__":
     main()
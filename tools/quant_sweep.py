@@ -0,0 +1,312 @@
+# tools/quant_sweep.py
+"""Merged HF dir -> f16 GGUF -> quantized variants -> eval -> leaderboard rows.
+
+Every stage is keyed by content checksums recorded in <outdir>/manifest.json, so
+re-running with unchanged inputs only re-does the stages whose inputs changed.
+Each variant is evaluated in its own subprocess so peak RSS is per-model.
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from pii_masking.eval.leaderboard import ModelStats, leaderboard_row, upsert_leaderboard, write_summary
+
+# config is optional; fall back if not present
+try:
+    from pii_masking.config.config import SYSTEM_PROMPT
+except Exception:
+    SYSTEM_PROMPT = (
+        "You are a PII redaction assistant. Replace PII with bracketed tags only. "
+        "Use only these tags: [NAME], [ADDRESS], [CARDNUMBER], [PHONENUMBER], [DATE], "
+        "[EMAIL], [URL], [USERNAME], [IP], [IPV4], [IPV6], [ACCOUNTNUMBER], [OTHERPII]. "
+        "Preserve all non-PII text exactly. Output only the redacted text."
+    )
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_QUANTS = "Q4_K_M,Q5_K_M,Q6_K,Q8_0"
+DEFAULT_RUNS_DIR = PROJECT_ROOT / "src" / "pii_masking" / "eval" / "eval_runs"
+CONVERTERS = ("convert_hf_to_gguf.py", "convert-hf-to-gguf.py", "convert.py")
+HF_WEIGHT_GLOBS = ("*.safetensors", "*.bin", "*.json", "tokenizer.model")
+
+
+def _sha256_file(path: Path, cache: dict) -> str:
+    st = path.stat()
+    key = str(path.resolve())
+    hit = cache.get(key)
+    if hit and hit["size"] == st.st_size and hit["mtime_ns"] == st.st_mtime_ns:
+        return hit["sha256"]
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 24), b""):
+            h.update(chunk)
+    cache[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+    return h.hexdigest()
+
+
+def _sha256_hf_dir(d: Path, cache: dict) -> str:
+    files = sorted({f for g in HF_WEIGHT_GLOBS for f in d.glob(g) if f.is_file()})
+    if not files:
+        raise FileNotFoundError(f"No model files found in {d}")
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.name.encode())
+        h.update(_sha256_file(f, cache).encode())
+    return h.hexdigest()
+
+
+def _key(*parts) -> str:
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _load_manifest(path: Path) -> dict:
+    if path.is_file():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"hash_cache": {}, "f16": {}, "variants": {}}
+
+
+def _save_manifest(path: Path, manifest: dict) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _run(cmd: list) -> None:
+    print("+ " + " ".join(str(c) for c in cmd), flush=True)
+    subprocess.run([str(c) for c in cmd], check=True)
+
+
+def _find_converter(llama_dir: Path) -> Path:
+    for name in CONVERTERS:
+        p = llama_dir / name
+        if p.is_file():
+            return p
+    raise FileNotFoundError(f"No HF->GGUF converter found in {llama_dir}")
+
+
+def _quantize_bin(llama_dir: Path) -> Path:
+    for p in (llama_dir / "build" / "bin" / "llama-quantize", llama_dir / "build" / "bin" / "quantize"):
+        if p.is_file():
+            return p
+    raise FileNotFoundError(
+        f"llama-quantize not found under {llama_dir}/build/bin; build it with "
+        f"`cmake -S {llama_dir} -B {llama_dir}/build -DLLAMA_CURL=OFF && cmake --build {llama_dir}/build -j`"
+    )
+
+
+def _materialize_eval_set(args, outdir: Path) -> Path:
+    if args.jsonl:
+        return Path(args.jsonl)
+    size = f"support{args.min_support}" if args.min_support else args.samples
+    path = outdir / f"eval_set_{args.split}_{size}_{args.seed}.jsonl"
+    if path.is_file():
+        return path
+    from pii_masking.eval.data import load_sampled, load_stratified
+
+    if args.min_support:
+        ds, idxs = load_stratified(min_support=args.min_support, seed=args.seed, split=args.split)
+    else:
+        ds, idxs = load_sampled(k=args.samples, seed=args.seed, split=args.split)
+    with path.open("w", encoding="utf-8") as f:
+        for i, ex in zip(idxs, ds):
+            f.write(json.dumps({"id": int(i), "input": ex["source_text"], "output": ex["target_text"]}, ensure_ascii=False) + "\n")
+    print(f"[data] cached {len(ds)} eval rows at {path}")
+    return path
+
+
+def eval_one(
+    gguf: str, eval_set: str, result: str, n_ctx: int, threads, max_new_tokens: int, warmup: int, store_dir=None
+) -> None:
+    """Child-process entry: evaluate one GGUF and write its summary block (with peak RSS) to `result`.
+
+    With `store_dir`, per-example predictions also go to the run's example store (pii_masking.eval.store).
+    """
+    from pii_masking.eval.data import load_jsonl_custom
+    from pii_masking.eval.store import example_row, write_examples
+    from pii_masking.infer.gguf_infer import GGUFModel
+    from pii_masking.utils.post_processing import normalize_entities, normalize_reference
+
+    ds, idxs = load_jsonl_custom(eval_set)
+    t0 = time.perf_counter()
+    gg = GGUFModel(gguf, n_ctx=n_ctx, n_threads=threads)
+    load_ms = (time.perf_counter() - t0) * 1000.0
+
+    for ex in ds[:warmup]:
+        gg.complete(SYSTEM_PROMPT, ex["source_text"], max_new_tokens=max_new_tokens)
+
+    stats = ModelStats()
+    examples = []
+    for i, ex in enumerate(ds):
+        t0 = time.perf_counter()
+        raw, usage = gg.complete(SYSTEM_PROMPT, ex["source_text"], max_new_tokens=max_new_tokens)
+        latency_ms = (time.perf_counter() - t0) * 1000.0
+        pred = normalize_entities(raw, system=SYSTEM_PROMPT, user_text=ex["source_text"])
+        ref = normalize_reference(ex["target_text"])
+        examples.append(
+            example_row("gguf", idxs[i], ex["source_text"], ref, raw.strip(), pred.strip(), round(latency_ms, 2),
+                        usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        )
+        stats.add(
+            ref,
+            pred,
+            latency_ms=latency_ms,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+        if (i + 1) % 10 == 0:
+            print(f"...{i + 1}/{len(ds)}", flush=True)
+
+    if store_dir:
+        write_examples(store_dir, examples)
+    summary = stats.summary()
+    summary["load_ms"] = load_ms
+    summary["warmup_examples"] = warmup
+    # ru_maxrss is KiB on Linux.
+    summary["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    Path(result).write_text(json.dumps(summary, ensure_ascii=False), encoding="utf-8")
+
+
+def sweep(args) -> None:
+    merged = Path(args.merged).resolve()
+    llama_dir = Path(args.llama_dir).resolve()
+    outdir = Path(args.outdir).resolve()
+    (outdir / "f16").mkdir(parents=True, exist_ok=True)
+    (outdir / "quantized").mkdir(parents=True, exist_ok=True)
+    manifest_path = outdir / "manifest.json"
+    manifest = _load_manifest(manifest_path)
+    hashes = manifest.setdefault("hash_cache", {})
+
+    # 1) HF -> f16 GGUF
+    merged_sha = _sha256_hf_dir(merged, hashes)
+    f16 = outdir / "f16" / f"{args.name}-f16.gguf"
+    if f16.is_file() and manifest["f16"].get("merged_sha256") == merged_sha:
+        print(f"[skip] f16 up to date: {f16}")
+    else:
+        _run([sys.executable, _find_converter(llama_dir), merged, "--outfile", f16, "--outtype", "f16"])
+        manifest["f16"] = {"path": str(f16), "merged_sha256": merged_sha}
+    manifest["f16"]["sha256"] = f16_sha = _sha256_file(f16, hashes)
+    _save_manifest(manifest_path, manifest)
+
+    eval_set = _materialize_eval_set(args, outdir)
+    eval_sha = _sha256_file(eval_set, hashes)
+    runs_dir = Path(args.runs_dir)
+    rows = []
+
+    for quant in [q.strip() for q in args.quants.split(",") if q.strip()]:
+        out = outdir / "quantized" / f"{args.name}-{quant}.gguf"
+        run_name = f"{args.run_prefix}_{quant.lower()}"
+        v = manifest["variants"].setdefault(quant, {})
+
+        # 2) f16 -> quant
+        if out.is_file() and v.get("f16_sha256") == f16_sha:
+            print(f"[skip] {quant} up to date: {out}")
+        else:
+            _run([_quantize_bin(llama_dir), f16, out, quant])
+            v.clear()
+            v["f16_sha256"] = f16_sha
+        v["path"] = str(out)
+        v["sha256"] = gguf_sha = _sha256_file(out, hashes)
+        _save_manifest(manifest_path, manifest)
+
+        # 3) eval (one subprocess per variant so peak RSS is attributable)
+        eval_key = _key(gguf_sha, eval_sha, args.n_ctx, args.threads, args.max_new_tokens, args.warmup)
+        summary_file = runs_dir / f"{run_name}_summary.json"
+        if v.get("eval_key") == eval_key and summary_file.is_file() and v.get("row"):
+            print(f"[skip] {quant} eval up to date: {summary_file}")
+            rows.append(v["row"])
+            continue
+
+        result = outdir / f".eval-{quant}.json"
+        cmd = [
+            sys.executable, Path(__file__).resolve(), "eval-one",
+            "--gguf", out, "--eval_set", eval_set, "--result", result,
+            "--n_ctx", args.n_ctx, "--max_new_tokens", args.max_new_tokens, "--warmup", args.warmup,
+            "--store_dir", runs_dir / run_name,
+        ]
+        if args.threads:
+            cmd += ["--threads", args.threads]
+        _run(cmd)
+        model = json.loads(result.read_text(encoding="utf-8"))
+        result.unlink()
+        model["quant_type"] = quant
+        model["file_size_mb"] = out.stat().st_size / (1024 * 1024)
+
+        summary = {
+            "run_name": run_name,
+            "model_type": "gguf",
+            "gguf_path": str(out),
+            "dataset": args.dataset,
+            "eval_set": str(eval_set),
+            "eval_set_sha256": eval_sha,
+            "gguf_sha256": gguf_sha,
+            "model": model,
+        }
+        write_summary(str(runs_dir), run_name, summary)
+        row = leaderboard_row(run_name, "gguf", model, gguf_path=str(out))
+        v.update({"eval_key": eval_key, "row": row})
+        _save_manifest(manifest_path, manifest)
+        rows.append(row)
+        ci = model.get("micro_f1_ci") or [0.0, 0.0]
+        print(
+            f"[eval] {quant}: micro_f1={model['micro_f1']:.4f} [{ci[0]:.4f}, {ci[1]:.4f}] "
+            f"p95={model['p95_latency_ms'] or 0:.0f}ms tok/s={model['tokens_per_s'] or 0:.1f} "
+            f"rss={model['peak_rss_mb']:.0f}MiB"
+        )
+
+    lb = upsert_leaderboard(str(runs_dir), rows, dataset=args.dataset)
+    print(f"\nSaved:\n  {manifest_path}\n  {lb}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Quantize a merged HF model to several GGUF types and benchmark each.")
+    sub = ap.add_subparsers(dest="cmd")
+
+    sw = sub.add_parser("sweep")
+    sw.add_argument("--merged", required=True, help="Merged HF dir from tools/merge.py")
+    sw.add_argument("--llama_dir", default=os.getenv("LLAMA_DIR", "./third_party/llama.cpp"))
+    sw.add_argument("--outdir", default="outputs/gguf/pii_masking_english_basic_v1")
+    sw.add_argument("--name", default="mistral7b-pii")
+    sw.add_argument("--quants", default=DEFAULT_QUANTS)
+    sw.add_argument("--runs_dir", default=str(DEFAULT_RUNS_DIR))
+    sw.add_argument("--run_prefix", default="gguf")
+    sw.add_argument("--dataset", default="ai4privacy/pii-masking-200k")
+    sw.add_argument("--jsonl", default=None, help="Eval JSONL (input/output); default caches a sampled split")
+    sw.add_argument("--samples", type=int, default=200)
+    sw.add_argument("--min_support", type=int, default=0,
+                    help="Instead of --samples random rows, the smallest subset with this many occurrences per tag")
+    sw.add_argument("--split", default="validation", choices=["train", "validation", "test"])
+    sw.add_argument("--seed", type=int, default=42)
+    sw.add_argument("--n_ctx", type=int, default=2048)
+    sw.add_argument("--threads", type=int, default=None)
+    sw.add_argument("--max_new_tokens", type=int, default=256)
+    sw.add_argument("--warmup", type=int, default=2, help="Examples run before timing starts")
+
+    one = sub.add_parser("eval-one")
+    one.add_argument("--gguf", required=True)
+    one.add_argument("--eval_set", required=True)
+    one.add_argument("--result", required=True)
+    one.add_argument("--n_ctx", type=int, default=2048)
+    one.add_argument("--threads", type=int, default=None)
+    one.add_argument("--max_new_tokens", type=int, default=256)
+    one.add_argument("--warmup", type=int, default=2)
+    one.add_argument("--store_dir", default=None)
+
+    args = ap.parse_args()
+    if args.cmd == "eval-one":
+        eval_one(
+            args.gguf, args.eval_set, args.result, args.n_ctx, args.threads, args.max_new_tokens, args.warmup,
+            store_dir=args.store_dir,
+        )
+    elif args.cmd == "sweep":
+        sweep(args)
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()